@@ -0,0 +1,121 @@
+"""
+ACL 計算引擎
+依專案成員（managers / team_members）推導 ACL，並快取、去重共用
+
+Graph 以 Entra ID（Azure AD）的 object id 比對 ACL 的 user / group，
+因此成員 id 必須已是 object id（GUID 格式）；其他格式的 id 不列入 ACL 並計數。
+沒有任何可用成員的項目不退回 everyone：設定了 fallback_group 時只授權給該群組，
+否則回傳空的 ACL，由上傳端寫入 dead letter
+"""
+import re
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+EVERYONE_ACL = [
+    {"type": "everyone", "value": "everyone", "accessType": "grant"}
+]
+# 沒有可授權對象時共用的空 ACL（不可上傳）
+NO_ACL: List[Dict] = []
+
+OBJECT_ID_RE = re.compile(r"^[0-9a-fA-F]{8}-(?:[0-9a-fA-F]{4}-){3}[0-9a-fA-F]{12}$")
+
+
+def is_object_id(value: str) -> bool:
+    return bool(OBJECT_ID_RE.match(str(value)))
+
+
+class AclEngine:
+    """
+    每個專案只計算一次 ACL，內容相同的 ACL 陣列只保留一份（interning），
+    由該專案的 milestones / risks / issues 共用。
+    只有在專案成員變動時才會使該專案相關的快取失效。
+    """
+
+    def __init__(self, fallback_group: str = ""):
+        if fallback_group and not is_object_id(fallback_group):
+            raise ValueError(f"ACL_FALLBACK_GROUP 必須是 Entra ID 群組的 object id：{fallback_group}")
+        self._fallback = ([{"type": "group", "value": fallback_group, "accessType": "grant"}]
+                          if fallback_group else NO_ACL)
+        # 成員組合（排序後的 tuple）-> 共用的 ACL 陣列
+        self._interned: Dict[Tuple[str, ...], List[Dict]] = {}
+        # project_id -> 成員組合
+        self._members: Dict[str, Tuple[str, ...]] = {}
+        # (project_ids, owners) -> ACL，以及反向索引供失效使用
+        self._derived: Dict[Tuple[Tuple[str, ...], Tuple[str, ...]], List[Dict]] = {}
+        self._derived_by_project: Dict[str, Set[Tuple[Tuple[str, ...], Tuple[str, ...]]]] = {}
+        # no_members：沒有可用成員的項目數（授權給 fallback 群組或不上傳）
+        self.stats = {"hits": 0, "misses": 0, "invalidations": 0, "no_members": 0}
+        # 不是 object id 而未列入 ACL 的成員 id
+        self.invalid_ids: Set[str] = set()
+
+    # ============================================
+    # 成員管理
+    # ============================================
+    def update_project(self, project_id: str, managers: Optional[Iterable[str]],
+                       team_members: Optional[Iterable[str]]) -> bool:
+        """登記專案成員，成員有變動時回傳 True 並使相關快取失效"""
+        members = tuple(sorted(set(managers or []) | set(team_members or [])))
+        if self._members.get(project_id) == members:
+            return False
+
+        if project_id in self._members:
+            self.invalidate(project_id)
+        self._members[project_id] = members
+        return True
+
+    def knows(self, project_id: str) -> bool:
+        return project_id in self._members
+
+    def invalidate(self, project_id: str):
+        """移除與此專案相關的衍生 ACL"""
+        for key in self._derived_by_project.pop(project_id, set()):
+            self._derived.pop(key, None)
+        self.stats["invalidations"] += 1
+
+    # ============================================
+    # ACL 查詢
+    # ============================================
+    def acl_for_project(self, project_id: str) -> List[Dict]:
+        return self.acl_for_item([project_id])
+
+    def acl_for_item(self, project_ids: Optional[Iterable[str]],
+                     owners: Optional[Iterable[str]] = None) -> List[Dict]:
+        """專案成員 ∪ 項目負責人；結果相同時回傳同一個 list 物件"""
+        project_key = tuple(sorted(set(project_ids or [])))
+        owner_key = tuple(sorted(set(owners or [])))
+        key = (project_key, owner_key)
+
+        acl = self._derived.get(key)
+        if acl is not None:
+            self.stats["hits"] += 1
+        else:
+            self.stats["misses"] += 1
+            members: Set[str] = set(owner_key)
+            for pid in project_key:
+                members.update(self._members.get(pid, ()))
+            acl = self._intern(tuple(sorted(members)))
+
+            self._derived[key] = acl
+            for pid in project_key:
+                self._derived_by_project.setdefault(pid, set()).add(key)
+        if acl is self._fallback:
+            self.stats["no_members"] += 1
+        return acl
+
+    def _intern(self, members: Tuple[str, ...]) -> List[Dict]:
+        valid = tuple(m for m in members if is_object_id(m))
+        if len(valid) != len(members):
+            self.invalid_ids.update(m for m in members if not is_object_id(m))
+        if not valid:
+            # 不退回 everyone，避免機密專案對所有人公開
+            return self._fallback
+        members = valid
+
+        acl = self._interned.get(members)
+        if acl is None:
+            acl = [{"type": "user", "value": m, "accessType": "grant"} for m in members]
+            self._interned[members] = acl
+        return acl
+
+    @property
+    def interned_count(self) -> int:
+        return len(self._interned)
@@ -0,0 +1,161 @@
+"""
+記憶體基準測試：比較 dict 與 CompactItem 在大量項目同時存在時的峰值 RSS，
+以及不排序時每種資料轉換完即上傳（stream，同時只保留一種資料）的峰值
+用法：python bench_memory.py --rows 1000000
+"""
+import argparse
+import random
+import resource
+import subprocess
+import sys
+import time
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, Tuple
+
+STATUSES = ["planning", "in_progress", "on_hold", "completed", "cancelled"]
+PRIORITIES = ["low", "medium", "high", "critical"]
+LEVELS = ["low", "medium", "high"]
+PHASES = ["C0", "C1", "C2", "C3", "C4"]
+CATEGORIES = ["AI專案", "基礎建設", "產品開發", "內部流程"]
+
+# 各類型在合成資料中的比例
+MIX = [("project", 0.02), ("milestone", 0.48), ("risk", 0.25), ("issue", 0.25)]
+
+
+def _fresh(value: str) -> str:
+    """產生內容相同但物件不同的字串，模擬資料庫驅動程式每列各自解碼"""
+    return value.encode().decode()
+
+
+# ============================================
+# 合成資料
+# ============================================
+def generate_rows(total: int, seed: int = 42) -> Iterator[Tuple[str, Dict]]:
+    """依 MIX 比例產生與 fetch_* 回傳格式相同的資料列"""
+    rng = random.Random(seed)
+    base = datetime(2024, 1, 1)
+    project_count = max(1, int(total * MIX[0][1]))
+    users = [f"user-{i:05d}" for i in range(2000)]
+    project_ids = [f"p{i:07d}" for i in range(project_count)]
+    description = "這是一段用於基準測試的描述文字。" * 4
+
+    def people(k):
+        return [_fresh(u) for u in rng.sample(users, k)]
+
+    def stamp():
+        return base + timedelta(minutes=rng.randrange(500_000))
+
+    for kind, ratio in MIX:
+        count = project_count if kind == "project" else int(total * ratio)
+        for i in range(count):
+            pid = project_ids[i % project_count]
+            common = {
+                "id": f"{kind[0]}{i:07d}",
+                "description": _fresh(description),
+                "status": _fresh(rng.choice(STATUSES)),
+                "created_at": stamp(),
+                "updated_at": stamp(),
+                "is_critical_path": rng.random() < 0.1,
+            }
+            if kind == "project":
+                common.update({
+                    "id": pid, "name": f"專案 {i}", "code": f"PRJ-{i:05d}",
+                    "start_date": stamp(), "end_date": stamp(),
+                    "progress": rng.randrange(101), "budget": 100000.0, "budget_used": 5000.0,
+                    "priority": _fresh(rng.choice(PRIORITIES)),
+                    "managers": people(2), "team_members": people(8), "tags": ["tag-a", "tag-b"],
+                    "category_label": _fresh(rng.choice(CATEGORIES)),
+                })
+            elif kind == "milestone":
+                common.update({
+                    "project_id": _fresh(pid), "title": f"里程碑 {i}", "due_date": stamp(),
+                    "priority": _fresh(rng.choice(PRIORITIES)), "assigned_to": people(1)[0],
+                    "category": _fresh(rng.choice(CATEGORIES)), "phase": _fresh(rng.choice(PHASES)),
+                    "project_name": _fresh(f"專案 {i % project_count}"),
+                    "project_code": _fresh(f"PRJ-{i % project_count:05d}"),
+                })
+            elif kind == "risk":
+                common.update({
+                    "project_ids": [_fresh(pid)], "title": f"風險 {i}", "deadline": stamp(),
+                    "probability": _fresh(rng.choice(LEVELS)), "impact": _fresh(rng.choice(LEVELS)),
+                    "mitigation": _fresh("增加人力資源"), "owners": people(2),
+                })
+            else:
+                common.update({
+                    "project_ids": [_fresh(pid)], "title": f"問題 {i}", "due_date": stamp(),
+                    "severity": _fresh(rng.choice(LEVELS)), "root_cause": _fresh("資料庫查詢未優化"),
+                    "owners": people(2),
+                })
+            yield kind, common
+
+
+def synthetic_project_map(total: int) -> Dict[str, Dict]:
+    project_count = max(1, int(total * MIX[0][1]))
+    return {
+        f"p{i:07d}": {"name": f"專案 {i}", "code": f"PRJ-{i:05d}"}
+        for i in range(project_count)
+    }
+
+
+# ============================================
+# 單一模式量測（於子行程中執行）
+# ============================================
+def run_mode(mode: str, rows: int):
+    from data_sync import transform_project, transform_milestone, transform_risk, transform_issue
+    from compact_item import CompactItem
+
+    project_map = synthetic_project_map(rows)
+    transforms = {
+        "project": transform_project,
+        "milestone": transform_milestone,
+        "risk": lambda r: transform_risk(r, project_map),
+        "issue": lambda r: transform_issue(r, project_map),
+    }
+
+    start = time.perf_counter()
+    items = []
+    total = 0
+    current = None
+    for kind, row in generate_rows(rows):
+        if mode == "stream" and kind != current:
+            # 上一種資料已交給上傳端，不再保留
+            items, current = [], kind
+        item = transforms[kind](row)
+        items.append(item if mode == "dict" else CompactItem.from_item(item))
+        total += 1
+    elapsed = time.perf_counter() - start
+
+    # Linux 的 ru_maxrss 單位為 KB
+    peak_mb = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    print(f"{mode}\t{total}\t{peak_mb:.1f}\t{elapsed:.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="比較 dict 與 CompactItem 的峰值 RSS")
+    parser.add_argument("--rows", type=int, default=1_000_000)
+    parser.add_argument("--mode", choices=["dict", "compact", "stream"], help="只量測單一模式（內部使用）")
+    args = parser.parse_args()
+
+    if args.mode:
+        run_mode(args.mode, args.rows)
+        return
+
+    print(f"📊 合成資料 {args.rows:,} 列，峰值 RSS 比較")
+    print("=" * 50)
+    results = {}
+    for mode in ("dict", "compact", "stream"):
+        out = subprocess.run(
+            [sys.executable, __file__, "--rows", str(args.rows), "--mode", mode],
+            check=True, capture_output=True, text=True,
+        ).stdout.strip().splitlines()[-1]
+        _, count, peak_mb, elapsed = out.split("\t")
+        results[mode] = float(peak_mb)
+        print(f"   {mode:<8} 項目: {int(count):,} | 峰值 RSS: {peak_mb} MB | 耗時: {elapsed}s")
+
+    saved = 1 - results["compact"] / results["dict"]
+    print(f"\n   CompactItem 節省 {saved:.0%} 峰值記憶體")
+    print(f"   逐類型上傳（不排序）再節省 {1 - results['stream'] / results['compact']:.0%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -2,7 +2,7 @@
 import requests
 import json
 from config import CONFIG
-CONNECTION_ID = "ProjectPortalConnection"
+from data_sync import resolve_connection_id
 
 def get_token():
     url = f"https://login.microsoftonline.com/{CONFIG['tenant_id']}/oauth2/v2.0/token"
@@ -17,11 +17,13 @@ def get_token():
 def check_connection():
     token = get_token()
     headers = {"Authorization": f"Bearer {token}"}
+    # 與 data_sync 相同，blue/green 切換後檢查新的 Connection
+    connection_id = resolve_connection_id()
     
     # 1. 檢查 Connection 狀態
-    conn_url = f"https://graph.microsoft.com/v1.0/external/connections/{CONNECTION_ID}"
+    conn_url = f"https://graph.microsoft.com/v1.0/external/connections/{connection_id}"
     conn_resp = requests.get(conn_url, headers=headers)
-    print("=== Connection 狀態 ===")
+    print(f"=== Connection 狀態（{connection_id}）===")
     print(json.dumps(conn_resp.json(), indent=2, ensure_ascii=False))
     
     # 2. 檢查 Schema 狀態
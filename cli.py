@@ -0,0 +1,183 @@
+"""
+統一命令列入口
+各子命令於執行時才載入對應模組（requests / psycopg2 等），
+cron 執行的狀態檢查與小量同步可快速啟動
+
+用法：python cli.py [--timing] <子命令> [參數...]
+"""
+import sys
+import time
+
+_T0 = time.perf_counter()
+
+
+# ============================================
+# 子命令
+# ============================================
+def _cmd_create(argv):
+    import connection_create
+
+    connection_create.main()
+
+
+def _cmd_schema(argv):
+    import schema_register
+
+    schema_register.main()
+
+
+def _cmd_sync(argv):
+    import data_sync
+
+    data_sync.main(argv)
+
+
+def _cmd_status(argv):
+    import check_status
+
+    check_status.check_connection()
+
+
+def _cmd_list(argv):
+    import if_connect_success
+
+    if_connect_success.main()
+
+
+def _cmd_audit(argv):
+    import argparse
+    import spool
+
+    parser = argparse.ArgumentParser(prog="cli.py audit", description="檢查 spool 目錄是否完整")
+    parser.add_argument("spool_dir")
+    args = parser.parse_args(argv)
+
+    problems = spool.audit_spool(args.spool_dir)
+    if problems:
+        print(f"❌ 發現 {len(problems)} 個問題：")
+        for problem in problems:
+            print(f"   - {problem}")
+        return 1
+    index = spool.load_index(args.spool_dir)
+    print(f"✅ spool 完整：{index['total']} 個項目，{len(index['chunks'])} 個分塊")
+    return 0
+
+
+def _cmd_replay(argv):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="cli.py replay", description="上傳先前匯出的 spool 目錄")
+    parser.add_argument("spool_dir")
+    parser.add_argument("--concurrency", type=int)
+    args = parser.parse_args(argv)
+
+    import data_sync
+
+    data_sync.replay_spool(args.spool_dir, args.concurrency)
+
+
+def _cmd_query(argv):
+    import local_mirror
+
+    return local_mirror.main(argv)
+
+
+def _cmd_history(argv):
+    import run_history
+
+    return run_history.main(argv)
+
+
+def _cmd_freshness(argv):
+    import freshness
+
+    return freshness.main(argv)
+
+
+def _cmd_mock(argv):
+    import mock_graph
+
+    return mock_graph.main(argv)
+
+
+def _cmd_purge(argv):
+    import purge
+
+    return purge.main(argv)
+
+
+def _cmd_health(argv):
+    import health_snapshot
+
+    return health_snapshot.main(argv)
+
+
+def _cmd_reindex(argv):
+    import reindex
+
+    return reindex.main(argv)
+
+
+def _cmd_serve(argv):
+    import sync_service
+
+    sync_service.main(argv)
+
+
+COMMANDS = {
+    "create": ("建立 External Connection", _cmd_create),
+    "schema": ("註冊 Schema", _cmd_schema),
+    "sync": ("同步資料（參數同 data_sync.py）", _cmd_sync),
+    "status": ("檢查 Connection、Schema 與已同步項目", _cmd_status),
+    "list": ("列出所有 External Connections", _cmd_list),
+    "audit": ("檢查 spool 目錄完整性", _cmd_audit),
+    "replay": ("上傳 spool 目錄", _cmd_replay),
+    "query": ("查詢本機鏡像中已上傳的項目（全文檢索）", _cmd_query),
+    "history": ("同步執行紀錄與效能退步", _cmd_history),
+    "freshness": ("新鮮度延遲百分位數（由 sync --freshness 量測）", _cmd_freshness),
+    "mock": ("本機 Mock Graph API（搭配 GRAPH_API_BASE）", _cmd_mock),
+    "health": ("所有 Connections 的健康快照（JSON，短暫快取）", _cmd_health),
+    "purge": ("刪除 Connection 中的所有項目（保留 Connection 與 Schema）", _cmd_purge),
+    "reindex": ("Blue/green 完整重建索引到新的 Connection", _cmd_reindex),
+    "serve": ("常駐服務：定時增量同步並提供 /health、/metrics", _cmd_serve),
+}
+
+
+def print_usage():
+    print("用法：python cli.py [--timing] <子命令> [參數...]\n")
+    print("子命令：")
+    for name, (description, _) in COMMANDS.items():
+        print(f"  {name:<10} {description}")
+    print("\n  --timing   在 stderr 輸出啟動與總執行時間")
+
+
+# ============================================
+# 執行
+# ============================================
+def main(argv=None):
+    argv = list(sys.argv[1:] if argv is None else argv)
+    timing = "--timing" in argv
+    if timing:
+        argv.remove("--timing")
+
+    if not argv or argv[0] in ("-h", "--help"):
+        print_usage()
+        return 0
+
+    name, rest = argv[0], argv[1:]
+    if name not in COMMANDS:
+        print(f"未知的子命令：{name}\n", file=sys.stderr)
+        print_usage()
+        return 2
+
+    if timing:
+        print(f"⏱️ 啟動耗時：{(time.perf_counter() - _T0) * 1000:.1f} ms", file=sys.stderr)
+    try:
+        return COMMANDS[name][1](rest) or 0
+    finally:
+        if timing:
+            print(f"⏱️ 總耗時：{(time.perf_counter() - _T0) * 1000:.1f} ms", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    sys.exit(main())
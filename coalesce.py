@@ -0,0 +1,141 @@
+"""
+增量同步的逐項目更新合併
+進行中的專案 progress、里程碑 status 等欄位一小時內可能變更多次，每次增量同步都會重新上傳同一個項目。
+設定合併時間窗後，項目在上次上傳後的時間窗內再次變更時先延後，
+時間窗結束後依 id 重新讀取最新狀態只上傳一次；延後中的項目記錄在同步狀態檔，跨次執行保留
+
+COALESCE_WINDOWS 以 itemType=秒數 設定，例如 projects=900,milestones=600；未列出的類型不合併
+"""
+import os
+import time
+from typing import Dict, List, Optional, Tuple
+
+COALESCE_WINDOWS = os.environ.get("COALESCE_WINDOWS", "")
+
+
+def parse_windows(text: str) -> Dict[str, float]:
+    """"projects=900,milestones=600" -> {"projects": 900.0, "milestones": 600.0}"""
+    import data_sync
+
+    windows: Dict[str, float] = {}
+    for part in text.split(","):
+        if not part.strip():
+            continue
+        kind, _, seconds = part.partition("=")
+        kind = kind.strip()
+        if kind not in data_sync.ENTITY_TYPES:
+            raise ValueError(f"COALESCE_WINDOWS 中未知的資料類型：{kind}（可用：{', '.join(data_sync.ENTITY_TYPES)}）")
+        try:
+            windows[kind] = float(seconds)
+        except ValueError:
+            raise ValueError(f"COALESCE_WINDOWS 中 {kind} 的秒數無效：{seconds!r}")
+    return {kind: seconds for kind, seconds in windows.items() if seconds > 0}
+
+
+def split_id(item_id: str) -> Tuple[Optional[str], str]:
+    """External Item id -> (資料類型, 原始 id)"""
+    import data_sync
+
+    for prefix, kind in data_sync.ID_PREFIXES.items():
+        if item_id.startswith(prefix):
+            return kind, item_id[len(prefix):]
+    return None, item_id
+
+
+class Coalescer:
+    """
+    狀態存於 state["coalesce"]：
+      items  item id -> {"uploaded_at": 上次上傳成功的時間, "pending": 延後中尚未上傳的變更次數}
+      saved_total  累計節省的上傳次數
+    """
+
+    def __init__(self, state: Dict, windows: Dict[str, float], now: Optional[float] = None):
+        self.windows = windows
+        self.now = time.time() if now is None else now
+        self.data = state.setdefault("coalesce", {"items": {}, "saved_total": 0})
+        self.entries: Dict[str, Dict] = self.data["items"]
+        self.stats = {"deferred": 0, "flushed": 0, "saved": 0}
+
+    def _window(self, item_id: str) -> float:
+        kind, _ = split_id(item_id)
+        return self.windows.get(kind, 0.0)
+
+    def _in_window(self, item_id: str, entry: Dict) -> bool:
+        return self.now - entry["uploaded_at"] < self._window(item_id)
+
+    def defer(self, items: List) -> List:
+        """回傳現在要上傳的項目；仍在時間窗內的變更記為延後"""
+        upload = []
+        for item in items:
+            entry = self.entries.get(item.id)
+            if entry is not None and self._in_window(item.id, entry):
+                entry["pending"] += 1
+                self.stats["deferred"] += 1
+            else:
+                if entry is not None and entry["pending"]:
+                    # 延後的變更與這次的變更合併為一次上傳
+                    self.stats["flushed"] += 1
+                    self.stats["saved"] += entry["pending"]
+                    entry["pending"] = 0
+                upload.append(item)
+        return upload
+
+    def due(self, skip: set) -> List[str]:
+        """時間窗已結束、這次沒有新變更的延後項目 id"""
+        return [item_id for item_id, entry in self.entries.items()
+                if entry["pending"] and item_id not in skip and not self._in_window(item_id, entry)]
+
+    def flush(self, due: List[str], items: List):
+        """items 為依 due 重新讀取的最新狀態；資料列已刪除而讀不到的項目不再追蹤"""
+        found = {item.id for item in items}
+        for item_id in due:
+            entry = self.entries[item_id]
+            if item_id in found:
+                # n 次延後的變更只上傳一次
+                self.stats["flushed"] += 1
+                self.stats["saved"] += entry["pending"] - 1
+                entry["pending"] = 0
+            else:
+                del self.entries[item_id]
+
+    def record_uploads(self, item_ids: List[str], failed: List[str]):
+        """上傳成功的項目開始新的時間窗；只追蹤有設定時間窗的類型"""
+        failed_ids = set(failed)
+        for item_id in item_ids:
+            if item_id in failed_ids or not self._window(item_id):
+                continue
+            entry = self.entries.setdefault(item_id, {"uploaded_at": self.now, "pending": 0})
+            entry["uploaded_at"] = self.now
+        self.data["saved_total"] += self.stats["saved"]
+
+    def prune(self):
+        """時間窗已過且沒有延後變更的項目不需保留"""
+        for item_id in [i for i, e in self.entries.items() if not e["pending"] and not self._in_window(i, e)]:
+            del self.entries[item_id]
+
+    def pending_count(self) -> int:
+        return sum(1 for e in self.entries.values() if e["pending"])
+
+
+def ids_filter(item_ids: List[str]) -> Dict:
+    """External Item id 清單 -> build_items 的 filters"""
+    by_type: Dict[str, List[str]] = {}
+    for item_id in item_ids:
+        kind, raw_id = split_id(item_id)
+        if kind is not None:
+            by_type.setdefault(kind, []).append(raw_id)
+    return {"ids": by_type, "types": set(by_type)}
+
+
+def get_coalescer(state: Dict, windows: Optional[str] = None) -> Optional[Coalescer]:
+    """
+    未設定任何時間窗時回傳 None；
+    之前延後的項目仍會以時間窗 0 處理一次，讓移除設定後不會遺漏延後中的變更
+    """
+    parsed = parse_windows(COALESCE_WINDOWS if windows is None else windows)
+    if not parsed:
+        pending = state.get("coalesce", {}).get("items", {})
+        if not any(e["pending"] for e in pending.values()):
+            state.pop("coalesce", None)
+            return None
+    return Coalescer(state, parsed)
@@ -0,0 +1,95 @@
+"""
+精簡的 External Item 表示法
+在 transform 與序列化之間使用，降低大量項目同時存在時的記憶體用量
+"""
+import sys
+from typing import Any, Dict, List, Optional
+
+from schema_register import SCHEMA
+
+# 依 SCHEMA 順序排列的屬性名稱，CompactItem.values 與其一一對應
+PROPERTY_NAMES = tuple(p["name"] for p in SCHEMA["properties"])
+_PROPERTY_INDEX = {name: i for i, name in enumerate(PROPERTY_NAMES)}
+
+# 值域有限、在每一列重複出現的欄位，字串會被 intern 共用
+INTERNED_PROPERTIES = {
+    "itemType", "status", "priority", "severity", "probability", "impact",
+    "phase", "category", "projectCode", "projectName", "projectId",
+}
+COLLECTION_PROPERTIES = {
+    p["name"] for p in SCHEMA["properties"] if p["type"] == "StringCollection"
+}
+
+# 代表「此屬性不存在」（與值為 None 不同）
+_MISSING = object()
+
+
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+class CompactItem:
+    """
+    以 __slots__ 與 tuple 儲存的 External Item：
+    - properties 依 PROPERTY_NAMES 順序存成 tuple，不存在的屬性以 _MISSING 表示
+    - 列舉型字串與人員 id 使用 sys.intern 共用
+    - acl 直接保留引用（ACL 引擎回傳的 list 本身已共用）
+    """
+
+    __slots__ = ("id", "values", "content_type", "content_value", "acl")
+
+    def __init__(self, item_id: str, values: tuple, content_type: str,
+                 content_value: str, acl: List[Dict]):
+        self.id = item_id
+        self.values = values
+        self.content_type = content_type
+        self.content_value = content_value
+        self.acl = acl
+
+    @classmethod
+    def from_item(cls, item: Dict) -> "CompactItem":
+        values = [_MISSING] * len(PROPERTY_NAMES)
+        for name, value in item["properties"].items():
+            index = _PROPERTY_INDEX.get(name)
+            if index is None:
+                raise ValueError(f"{item['id']}: 屬性 {name} 不在 SCHEMA 中")
+            if name in COLLECTION_PROPERTIES and value is not None:
+                value = tuple(_intern(v) for v in value)
+            elif name in INTERNED_PROPERTIES:
+                value = _intern(value)
+            values[index] = value
+
+        content = item.get("content") or {}
+        return cls(
+            item["id"],
+            tuple(values),
+            sys.intern(content.get("type", "text")),
+            content.get("value", ""),
+            item["acl"],
+        )
+
+    def get(self, name: str, default: Any = None) -> Any:
+        value = self.values[_PROPERTY_INDEX[name]]
+        if value is _MISSING:
+            return default
+        return list(value) if name in COLLECTION_PROPERTIES and value is not None else value
+
+    @property
+    def item_type(self) -> Optional[str]:
+        return self.get("itemType")
+
+    def to_item(self) -> Dict:
+        """還原為 Graph API 需要的 dict（序列化前呼叫）"""
+        properties = {}
+        for name, value in zip(PROPERTY_NAMES, self.values):
+            if value is _MISSING:
+                continue
+            if name in COLLECTION_PROPERTIES and value is not None:
+                value = list(value)
+            properties[name] = value
+        return {
+            "id": self.id,
+            "properties": properties,
+            "content": {"type": self.content_type, "value": self.content_value},
+            "acl": self.acl,
+        }
@@ -38,7 +38,7 @@ def get_access_token():
 # ============================================
 # 建立 External Connection
 # ============================================
-def create_connection(token):
+def create_connection(token, connection=CONNECTION):
     url = "https://graph.microsoft.com/v1.0/external/connections"
     
     headers = {
@@ -46,7 +46,7 @@ def create_connection(token):
         "Content-Type": "application/json"
     }
     
-    response = requests.post(url, headers=headers, json=CONNECTION)
+    response = requests.post(url, headers=headers, json=connection)
     data = response.json()
     
     if not response.ok:
@@ -55,6 +55,21 @@ def create_connection(token):
     
     return data
 
+# ============================================
+# 刪除 External Connection（連同其中所有項目）
+# ============================================
+def delete_connection(token, connection_id):
+    url = f"https://graph.microsoft.com/v1.0/external/connections/{connection_id}"
+    headers = {"Authorization": f"Bearer {token}"}
+    
+    response = requests.delete(url, headers=headers)
+    
+    if not response.ok and response.status_code != 404:
+        print(f"❌ 刪除 Connection 失敗：{response.status_code} {response.text[:200]}")
+        raise Exception(f"Failed to delete {connection_id}")
+    
+    return True
+
 # ============================================
 # 執行
 # ============================================
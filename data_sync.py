@@ -2,22 +2,72 @@
 步驟 4：同步資料到 Microsoft Graph Connector
 將 Projects, Milestones, Risks, Issues 同步到 M365
 """
-import requests
+import copy
+import hashlib
 import json
 import os
-from datetime import datetime
-from typing import Optional, List, Dict, Any
-import psycopg2
-from psycopg2.extras import RealDictCursor
+import threading
+from datetime import datetime, timedelta
+from typing import Optional, List, Dict, Any, Iterable, Iterator, Tuple
 
+# requests / psycopg2 於使用時才載入，--test、--replay 等模式不需要資料庫驅動程式
 from config import CONFIG
+from acl_engine import AclEngine, EVERYONE_ACL
+from compact_item import CompactItem
+from schema_register import OPTIONAL_PROPERTIES
+import profiling
 
-CONNECTION_ID = "ProjectPortalConnection"
-GRAPH_API_BASE = "https://graph.microsoft.com/v1.0"
+DEFAULT_CONNECTION_ID = "ProjectPortalConnection"
+
+
+def resolve_connection_id() -> str:
+    """CONNECTION_ID 環境變數 > blue/green 切換後的使用中 Connection > 預設值"""
+    import sync_state
+    
+    return os.environ.get("CONNECTION_ID") or sync_state.load_active_connection() or DEFAULT_CONNECTION_ID
+
+
+CONNECTION_ID = resolve_connection_id()
+# 可指向本機的 mock_graph.py（例如 http://127.0.0.1:8765/v1.0）
+GRAPH_API_BASE = os.environ.get("GRAPH_API_BASE", "https://graph.microsoft.com/v1.0")
 
 # 你的應用程式 URL（用於生成連結）
 APP_BASE_URL = os.environ.get("APP_BASE_URL", "https://project.adata-ai.com/")
 
+# ACL 模式：everyone（全部可見）或 project（依專案成員限制存取）
+ACL_MODE = os.environ.get("ACL_MODE", "everyone")
+
+# 是否依新鮮度/重要性排序上傳（策略見 priority_scheduler.py）
+PRIORITY_SCHEDULING = os.environ.get("PRIORITY_SCHEDULING", "1") != "0"
+
+# 是否以 Graph $batch 打包上傳（批次大小與並行數見 graph_batch.py）
+USE_GRAPH_BATCH = os.environ.get("GRAPH_BATCH", "1") != "0"
+
+# 由 PostgreSQL 直接產生項目 JSON（見 sql_items.py）
+SQL_JSON = os.environ.get("SQL_JSON", "0") == "1"
+
+# 本機 SQLite 全文檢索鏡像（空字串表示停用，見 local_mirror.py）
+MIRROR_PATH = os.environ.get("LOCAL_MIRROR_PATH", "")
+
+# 是否將描述等富文字轉為純文字（見 text_normalize.py）；SQL JSON 模式無法套用，未設定時預設關閉
+TEXT_NORMALIZE = os.environ.get("TEXT_NORMALIZE", "0" if SQL_JSON else "1") != "0"
+
+# 量測資料列變更到可從 Connection 讀回的延遲（見 freshness.py）
+FRESHNESS = os.environ.get("FRESHNESS", "0") == "1"
+
+# 將 owners / managers / teamMembers 的使用者 id 解析為「名稱 <信箱>」的目錄來源
+# （空字串表示停用，見 people_resolver.py；不能與 SQL JSON 模式同時使用）
+PEOPLE_SOURCE = os.environ.get("PEOPLE_SOURCE", "")
+
+# 只轉換、上傳指紋與上次上傳時不同的資料列（見 row_fingerprint.py；SQL JSON 模式不套用）
+ROW_FINGERPRINTS = os.environ.get("ROW_FINGERPRINTS", "0") == "1"
+
+# 增量同步以 >= 重新讀取 watermark 前這段時間（秒）內的變更，
+# 交易較晚 commit、updated_at 不大於 watermark 的資料列才不會被永久略過
+INCREMENTAL_OVERLAP_SECONDS = float(os.environ.get("INCREMENTAL_OVERLAP_SECONDS", "300"))
+
+# 是否記錄每次同步的統計到執行紀錄（見 run_history.py）
+RUN_HISTORY = os.environ.get("RUN_HISTORY", "1") != "0"
 
 # 資料庫連線設定（請修改為你的設定）
 DATABASE_CONFIG = {
@@ -32,25 +82,53 @@ DATABASE_CONFIG = {
 # ============================================
 # Access Token
 # ============================================
+# Token 快取：到期前 TOKEN_REFRESH_MARGIN 秒才重新取得，常駐服務可重複使用
+TOKEN_REFRESH_MARGIN = 300
+_token_cache = {"token": None, "expires_at": 0.0}
+_token_lock = threading.Lock()
+
+
 def get_access_token():
-    url = f"https://login.microsoftonline.com/{CONFIG['tenant_id']}/oauth2/v2.0/token"
-    payload = {
-        "client_id": CONFIG["client_id"],
-        "client_secret": CONFIG["client_secret"],
-        "scope": "https://graph.microsoft.com/.default",
-        "grant_type": "client_credentials",
-    }
-    response = requests.post(url, data=payload)
-    data = response.json()
-    if not response.ok:
-        raise Exception(f"Token 取得失敗：{data}")
-    return data["access_token"]
+    import time
+    
+    # 連到 mock 伺服器時直接使用固定的 Token
+    if os.environ.get("GRAPH_ACCESS_TOKEN"):
+        return os.environ["GRAPH_ACCESS_TOKEN"]
+    # 批次上傳的各執行緒共用同一個 Token，過期時只重新取得一次
+    with _token_lock:
+        if _token_cache["token"] and time.time() < _token_cache["expires_at"] - TOKEN_REFRESH_MARGIN:
+            return _token_cache["token"]
+        
+        url = f"https://login.microsoftonline.com/{CONFIG['tenant_id']}/oauth2/v2.0/token"
+        payload = {
+            "client_id": CONFIG["client_id"],
+            "client_secret": CONFIG["client_secret"],
+            "scope": "https://graph.microsoft.com/.default",
+            "grant_type": "client_credentials",
+        }
+        response = get_http_session().post(url, data=payload)
+        data = response.json()
+        if not response.ok:
+            raise Exception(f"Token 取得失敗：{data}")
+        _token_cache["token"] = data["access_token"]
+        _token_cache["expires_at"] = time.time() + int(data.get("expires_in", 3599))
+        return data["access_token"]
+
+
+def expire_access_token(token: str):
+    """Graph 回應 401 時呼叫：作廢快取中的這個 Token，下次 get_access_token 會重新取得"""
+    with _token_lock:
+        if _token_cache["token"] == token:
+            _token_cache["expires_at"] = 0.0
 
 
 # ============================================
 # 資料庫連線
 # ============================================
 def get_db_connection():
+    import psycopg2
+    from psycopg2.extras import RealDictCursor
+    
     return psycopg2.connect(
         host=DATABASE_CONFIG["host"],
         port=DATABASE_CONFIG["port"],
@@ -61,10 +139,96 @@ def get_db_connection():
     )
 
 
+def get_db_pool(maxconn: int):
+    """常駐服務使用的連線池（歸還時會自動 rollback 未結束的交易）"""
+    from psycopg2.pool import ThreadedConnectionPool
+    from psycopg2.extras import RealDictCursor
+    
+    return ThreadedConnectionPool(
+        1, maxconn,
+        host=DATABASE_CONFIG["host"],
+        port=DATABASE_CONFIG["port"],
+        database=DATABASE_CONFIG["database"],
+        user=DATABASE_CONFIG["user"],
+        password=DATABASE_CONFIG["password"],
+        cursor_factory=RealDictCursor,
+    )
+
+
 # ============================================
 # 從資料庫讀取資料
 # ============================================
-def fetch_projects(conn) -> List[Dict]:
+# 各資料表 id 欄位的陣列型別（例如 uuid[]），供 = ANY(%s::型別) 使用
+_id_array_types: Dict[str, str] = {}
+
+
+def id_type(conn, table: str) -> str:
+    return id_array_type(conn, table)[:-2]
+
+
+def id_array_type(conn, table: str) -> str:
+    if table not in _id_array_types:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT format_type(atttypid, atttypmod) AS type FROM pg_attribute "
+                "WHERE attrelid = %s::regclass AND attname = 'id'",
+                (table,)
+            )
+            _id_array_types[table] = cur.fetchone()["type"] + "[]"
+    return _id_array_types[table]
+
+
+def build_filter(conn, table: str, alias: str, filters: Optional[Dict]) -> Tuple[str, List]:
+    """
+    將篩選條件轉為參數化的 WHERE 子句
+    filters 支援：
+      since / until  updated_at 的時間範圍（since 不含、until 含）
+      not_before     updated_at >= 此時間（增量同步含重疊區間的下界）
+      ids            {資料表: [id, ...]}，只取指定 id
+      project_ids    專案範圍：專案本身及其 milestones / risks / issues
+      id_ranges      {資料表: (下界, 上界)}，id >= 下界且 < 上界，None 表示不限（分區平行讀取）
+    """
+    clauses, params = [], []
+    if filters:
+        if filters.get("since") is not None:
+            clauses.append(f"{alias}.updated_at > %s")
+            params.append(filters["since"])
+        if filters.get("not_before") is not None:
+            clauses.append(f"{alias}.updated_at >= %s")
+            params.append(filters["not_before"])
+        if filters.get("until") is not None:
+            clauses.append(f"{alias}.updated_at <= %s")
+            params.append(filters["until"])
+        ids = (filters.get("ids") or {}).get(table)
+        if ids is not None:
+            clauses.append(f"{alias}.id = ANY(%s::{id_array_type(conn, table)})")
+            params.append(list(ids))
+        project_ids = filters.get("project_ids")
+        if project_ids is not None:
+            project_type = id_array_type(conn, "projects")
+            if table == "projects":
+                clauses.append(f"{alias}.id = ANY(%s::{project_type})")
+            elif table == "milestones":
+                clauses.append(f"{alias}.project_id = ANY(%s::{project_type})")
+            else:
+                clauses.append(f"{alias}.project_ids && %s::{project_type}")
+            params.append(list(project_ids))
+        id_range = (filters.get("id_ranges") or {}).get(table)
+        if id_range is not None:
+            lower, upper = id_range
+            if lower is not None:
+                clauses.append(f"{alias}.id >= %s::{id_type(conn, table)}")
+                params.append(lower)
+            if upper is not None:
+                clauses.append(f"{alias}.id < %s::{id_type(conn, table)}")
+                params.append(upper)
+    if not clauses:
+        return "", params
+    return "\n            WHERE " + " AND ".join(clauses), params
+
+
+def fetch_projects(conn, filters: Optional[Dict] = None) -> List[Dict]:
+    where, params = build_filter(conn, "projects", "p", filters)
     with conn.cursor() as cur:
         cur.execute("""
             SELECT 
@@ -76,11 +240,12 @@ def fetch_projects(conn) -> List[Dict]:
                 pc.label as category_label
             FROM projects p
             LEFT JOIN project_categories pc ON p.category_id = pc.id
-        """)
+        """ + where, params)
         return cur.fetchall()
 
 
-def fetch_milestones(conn) -> List[Dict]:
+def fetch_milestones(conn, filters: Optional[Dict] = None) -> List[Dict]:
+    where, params = build_filter(conn, "milestones", "m", filters)
     with conn.cursor() as cur:
         cur.execute("""
             SELECT 
@@ -91,11 +256,12 @@ def fetch_milestones(conn) -> List[Dict]:
                 p.name as project_name, p.code as project_code
             FROM milestones m
             JOIN projects p ON m.project_id = p.id
-        """)
+        """ + where, params)
         return cur.fetchall()
 
 
-def fetch_risks(conn) -> List[Dict]:
+def fetch_risks(conn, filters: Optional[Dict] = None) -> List[Dict]:
+    where, params = build_filter(conn, "risks", "r", filters)
     with conn.cursor() as cur:
         cur.execute("""
             SELECT 
@@ -104,11 +270,12 @@ def fetch_risks(conn) -> List[Dict]:
                 r.mitigation, r.owners, r.is_critical_path,
                 r.created_at, r.updated_at
             FROM risks r
-        """)
+        """ + where, params)
         return cur.fetchall()
 
 
-def fetch_issues(conn) -> List[Dict]:
+def fetch_issues(conn, filters: Optional[Dict] = None) -> List[Dict]:
+    where, params = build_filter(conn, "issues", "i", filters)
     with conn.cursor() as cur:
         cur.execute("""
             SELECT 
@@ -117,7 +284,7 @@ def fetch_issues(conn) -> List[Dict]:
                 i.root_cause, i.is_critical_path,
                 i.created_at, i.updated_at
             FROM issues i
-        """)
+        """ + where, params)
         return cur.fetchall()
 
 
@@ -134,6 +301,22 @@ def fetch_project_names(conn, project_ids: List[str]) -> Dict[str, Dict]:
         return {row["id"]: {"name": row["name"], "code": row["code"]} for row in rows}
 
 
+def load_project_members(conn, project_ids: List[str]):
+    """增量同步時，為 ACL 引擎補齊本次未讀取的專案成員"""
+    if _acl_engine is None:
+        return
+    missing = [pid for pid in set(project_ids) if not _acl_engine.knows(pid)]
+    if not missing:
+        return
+    with conn.cursor() as cur:
+        cur.execute(
+            "SELECT id, managers, team_members FROM projects WHERE id = ANY(%s)",
+            (missing,)
+        )
+        for row in cur.fetchall():
+            _acl_engine.update_project(row["id"], row["managers"], row["team_members"])
+
+
 # ============================================
 # 日期格式轉換
 # ============================================
@@ -148,7 +331,7 @@ def to_iso_string(dt) -> Optional[str]:
 # ============================================
 # 資料轉換為 External Item
 # ============================================
-def transform_project(project: Dict) -> Dict:
+def transform_project(project: Dict, acl: Optional[List[Dict]] = None) -> Dict:
     return {
         "id": f"project-{project['id']}",
         "properties": {
@@ -184,13 +367,11 @@ def transform_project(project: Dict) -> Dict:
                 project.get("description") or "",
             ]),
         },
-        "acl": [
-            {"type": "everyone", "value": "everyone", "accessType": "grant"}
-        ],
+        "acl": EVERYONE_ACL if acl is None else acl,
     }
 
 
-def transform_milestone(milestone: Dict) -> Dict:
+def transform_milestone(milestone: Dict, acl: Optional[List[Dict]] = None) -> Dict:
     return {
         "id": f"milestone-{milestone['id']}",
         "properties": {
@@ -222,13 +403,11 @@ def transform_milestone(milestone: Dict) -> Dict:
                 milestone.get("description") or "",
             ]),
         },
-        "acl": [
-            {"type": "everyone", "value": "everyone", "accessType": "grant"}
-        ],
+        "acl": EVERYONE_ACL if acl is None else acl,
     }
 
 
-def transform_risk(risk: Dict, project_map: Dict[str, Dict]) -> Dict:
+def transform_risk(risk: Dict, project_map: Dict[str, Dict], acl: Optional[List[Dict]] = None) -> Dict:
     project_ids = risk.get("project_ids") or []
     project_names = ", ".join([project_map.get(pid, {}).get("name", "") for pid in project_ids if pid in project_map])
     project_codes = ", ".join([project_map.get(pid, {}).get("code", "") for pid in project_ids if pid in project_map])
@@ -265,13 +444,11 @@ def transform_risk(risk: Dict, project_map: Dict[str, Dict]) -> Dict:
                 risk.get("description") or "",
             ]),
         },
-        "acl": [
-            {"type": "everyone", "value": "everyone", "accessType": "grant"}
-        ],
+        "acl": EVERYONE_ACL if acl is None else acl,
     }
 
 
-def transform_issue(issue: Dict, project_map: Dict[str, Dict]) -> Dict:
+def transform_issue(issue: Dict, project_map: Dict[str, Dict], acl: Optional[List[Dict]] = None) -> Dict:
     project_ids = issue.get("project_ids") or []
     project_names = ", ".join([project_map.get(pid, {}).get("name", "") for pid in project_ids if pid in project_map])
     project_codes = ", ".join([project_map.get(pid, {}).get("code", "") for pid in project_ids if pid in project_map])
@@ -307,29 +484,93 @@ def transform_issue(issue: Dict, project_map: Dict[str, Dict]) -> Dict:
                 issue.get("description") or "",
             ]),
         },
-        "acl": [
-            {"type": "everyone", "value": "everyone", "accessType": "grant"}
-        ],
+        "acl": EVERYONE_ACL if acl is None else acl,
     }
 
 
+# ============================================
+# ACL 計算
+# ============================================
+# 模組層級共用，專案成員未變動時快取可跨多次同步沿用
+# 沒有可授權成員的項目改授權給此群組（Entra ID 群組 object id）；未設定時不上傳、寫入 dead letter
+ACL_FALLBACK_GROUP = os.environ.get("ACL_FALLBACK_GROUP", "")
+_acl_engine = AclEngine(ACL_FALLBACK_GROUP) if ACL_MODE == "project" else None
+NO_ACL_REASON = "沒有可授權的成員（成員 id 需為 Entra ID object id，或設定 ACL_FALLBACK_GROUP）"
+
+
+def item_acl(project_ids: List[str], owners: Optional[List[str]] = None) -> List[Dict]:
+    """取得項目 ACL；everyone 模式下回傳共用的 EVERYONE_ACL"""
+    if _acl_engine is None:
+        return EVERYONE_ACL
+    return _acl_engine.acl_for_item(project_ids, owners)
+
+
 # ============================================
 # 上傳到 Microsoft Graph
 # ============================================
+# 共用 HTTP Session，讓並行上傳重複使用 TLS 連線
+HTTP_POOL_SIZE = int(os.environ.get("HTTP_POOL_SIZE", "32"))
+_http_session = None
+
+
+def get_http_session():
+    global _http_session
+    if _http_session is None:
+        import requests
+        
+        session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE)
+        session.mount("https://", adapter)
+        session.mount("http://", adapter)
+        _http_session = session
+    return _http_session
+
+
+SERIALIZE_CHUNK = int(os.environ.get("SERIALIZE_CHUNK", "500"))
+
+
+def serialize_item(item: Dict) -> bytes:
+    """序列化為上傳用的 JSON bytes（id 固定在最前面，方便快速讀取）"""
+    return json.dumps(item, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def serialize_items(items: Iterable[CompactItem]) -> Iterator[Tuple[str, bytes]]:
+    """逐塊序列化成 (id, bytes)；每 SERIALIZE_CHUNK 個項目才計時一次，避免逐項進出 profiling.stage"""
+    chunk: List[CompactItem] = []
+    for c in items:
+        chunk.append(c)
+        if len(chunk) >= SERIALIZE_CHUNK:
+            yield from _serialize_chunk(chunk)
+            chunk = []
+    if chunk:
+        yield from _serialize_chunk(chunk)
+
+
+def _serialize_chunk(chunk: List[CompactItem]) -> List[Tuple[str, bytes]]:
+    with profiling.stage("serialization"):
+        return [(c.id, serialize_item(c.to_item())) for c in chunk]
+
+
 def upsert_external_item(token: str, item: Dict) -> bool:
     """新增或更新 External Item"""
-    url = f"{GRAPH_API_BASE}/external/connections/{CONNECTION_ID}/items/{item['id']}"
+    return upsert_external_item_raw(token, item["id"], serialize_item(item))
+
+
+def upsert_external_item_raw(token: str, item_id: str, body: bytes) -> bool:
+    """上傳已序列化的 External Item"""
+    url = f"{GRAPH_API_BASE}/external/connections/{CONNECTION_ID}/items/{item_id}"
     headers = {
         "Authorization": f"Bearer {token}",
-        "Content-Type": "application/json",
+        "Content-Type": "application/json; charset=utf-8",
     }
     
-    response = requests.put(url, headers=headers, json=item)
+    with profiling.stage("upload"):
+        response = get_http_session().put(url, headers=headers, data=body)
     
     if response.ok:
         return True
     else:
-        print(f"   ❌ 上傳失敗 {item['id']}: {response.status_code}")
+        print(f"   ❌ 上傳失敗 {item_id}: {response.status_code}")
         try:
             error_data = response.json()
             print(f"      錯誤: {json.dumps(error_data, indent=2, ensure_ascii=False)}")
@@ -343,68 +584,310 @@ def delete_external_item(token: str, item_id: str) -> bool:
     url = f"{GRAPH_API_BASE}/external/connections/{CONNECTION_ID}/items/{item_id}"
     headers = {"Authorization": f"Bearer {token}"}
     
-    response = requests.delete(url, headers=headers)
+    response = get_http_session().delete(url, headers=headers)
     return response.ok or response.status_code == 404
 
 
 # ============================================
-# 主要同步邏輯
+# 上傳前驗證
 # ============================================
-def sync_all_data():
-    print("=" * 60)
-    print("步驟 4：同步資料到 Microsoft Graph Connector")
-    print("=" * 60)
+# 由 SCHEMA 預先編譯一次；VALIDATE_ITEMS=0 可關閉
+if os.environ.get("VALIDATE_ITEMS", "1") != "0":
+    from item_validator import compile_validator
+    _validate_item = compile_validator()
+else:
+    _validate_item = None
+_dead_letter = None
+
+
+def get_dead_letter():
+    global _dead_letter
+    if _dead_letter is None:
+        from dead_letter import DeadLetterWriter
+        _dead_letter = DeadLetterWriter()
+    return _dead_letter
+
+
+# ============================================
+# 取得並轉換所有項目
+# ============================================
+def emit_item(items: List[CompactItem], item: Dict):
+    """驗證後加入上傳清單；不符合 Schema 的項目寫入 dead letter"""
+    if _people is not None:
+        _people.apply(item)
+    omit_empty_optional(item)
+    if not item.get("acl"):
+        # ACL_MODE=project 下沒有任何可授權的成員；不論是否啟用驗證都不上傳
+        reject_item(item, NO_ACL_REASON)
+        return
+    if _validate_item is not None:
+        reason = _validate_item(item)
+        if reason is not None:
+            reject_item(item, reason)
+            return
+    items.append(CompactItem.from_item(item))
+
+
+def omit_empty_optional(item: Dict):
+    """沒有值的選填屬性（例如沒有結束日期）不送出；必要屬性為 null 時由驗證器擋下"""
+    properties = item["properties"]
+    for name in OPTIONAL_PROPERTIES:
+        if name in properties and properties[name] is None:
+            del properties[name]
+
+
+def reject_item(item: Dict, reason: str):
+    get_dead_letter().write(item, reason)
+    if _fingerprints is not None:
+        _fingerprints.discard(item["id"])
+
+
+def fetch_table(conn, kind: str, fetch, filters: Optional[Dict] = None) -> List[Dict]:
+    """
+    讀取一種資料；大型資料表依 id 範圍分區平行讀取（見 partitioned_fetch.py），
+    指定 id、專案或 updated_at 時間範圍（含增量同步）的小範圍讀取直接以單一查詢完成
+    """
+    if not wants_type(filters, kind):
+        return []
+    import partitioned_fetch
     
-    # 取得 Token
-    print("\n🔑 取得 Access Token...")
-    token = get_access_token()
-    print("✅ Token 取得成功")
+    # 表的估計筆數無法反映篩選後的筆數，有這些條件時讀到的通常只是一小部分
+    targeted = filters and (filters.get("ids") or filters.get("project_ids") is not None
+                            or any(filters.get(key) is not None for key in ("since", "not_before", "until")))
+    if (partitioned_fetch.EXTRACT_PARTITIONS > 1 and kind in partitioned_fetch.PARTITIONED_TABLES
+            and not targeted):
+        rows = partitioned_fetch.fetch_partitioned(fetch, kind, filters)
+        if rows is not None:
+            return rows
+    return fetch(conn, filters)
+
+
+def wants_type(filters: Optional[Dict], kind: str) -> bool:
+    types = (filters or {}).get("types")
+    return types is None or kind in types
+
+
+def track_rows(stats: Optional[Dict], kind: str, rows: List[Dict]):
+    """記錄筆數與最大 updated_at（作為下次增量同步的 watermark）"""
+    if stats is None:
+        return
+    stats.setdefault("fetched", {})[kind] = len(rows)
+    latest = max((r["updated_at"] for r in rows if r.get("updated_at") is not None), default=None)
+    if latest is not None and (stats.get("max_updated_at") is None or latest > stats["max_updated_at"]):
+        stats["max_updated_at"] = latest
+    if kind == "projects":
+        labels = stats.setdefault("project_labels", {})
+        for row in rows:
+            labels[str(row["id"])] = project_label(row)
+    recent = stats.get("recent")
+    if recent is not None:
+        # 增量同步：記錄每列的 updated_at，供下次略過重疊區間內已處理的資料列
+        prefix = next(p for p, k in ID_PREFIXES.items() if k == kind)
+        for row in rows:
+            if row.get("updated_at") is not None:
+                recent[f"{prefix}{row['id']}"] = row["updated_at"]
+
+
+def rows_read(stats: Dict) -> int:
+    """track_rows 記錄的讀取列數合計（執行紀錄以此換算各階段每列耗時）"""
+    return sum(stats.get("fetched", {}).values())
+
+
+def normalize_texts(rows: List[Dict], kind: str, text_stats: Dict):
+    """就地將描述、緩解措施與根本原因轉為純文字（依原文雜湊快取）"""
+    if not TEXT_NORMALIZE or not rows:
+        return
+    import text_normalize
     
-    # 連接資料庫
-    print("\n📦 連接資料庫...")
-    try:
-        conn = get_db_connection()
-        print("✅ 資料庫連接成功")
-    except Exception as e:
-        print(f"❌ 資料庫連接失敗: {e}")
-        print("\n請確認 DATABASE_CONFIG 設定正確，或使用環境變數：")
-        print("  DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD")
+    with profiling.stage("normalize"):
+        text_normalize.normalize_rows(rows, text_normalize.NORMALIZED_FIELDS[kind], text_stats)
+
+
+# 模組層級共用，常駐服務多次同步沿用同一份記憶體快取
+_people = None
+
+
+def get_people_resolver():
+    """設定 PEOPLE_SOURCE 時回傳共用的 PeopleResolver，否則為 None"""
+    global _people
+    if _people is None and PEOPLE_SOURCE:
+        from people_resolver import create_resolver
+        _people = create_resolver(PEOPLE_SOURCE)
+    return _people
+
+
+def resolve_people(rows: List[Dict], kind: str, people_stats: Dict):
+    """收集這批資料列中的使用者 id，轉換前一次分批解析快取中沒有的"""
+    resolver = get_people_resolver()
+    if resolver is None or not rows:
         return
+    from people_resolver import PEOPLE_FIELDS, collect_ids
     
-    results = {"success": 0, "failed": 0, "errors": []}
+    with profiling.stage("people"):
+        resolver.prefetch(collect_ids(rows, PEOPLE_FIELDS[kind]), people_stats)
+
+
+_fingerprints = None
+
+
+def get_fingerprints():
+    """啟用 ROW_FINGERPRINTS 時回傳共用的 FingerprintStore，否則為 None"""
+    global _fingerprints
+    if _fingerprints is None and ROW_FINGERPRINTS:
+        from row_fingerprint import FingerprintStore
+        _fingerprints = FingerprintStore()
+    return _fingerprints
+
+
+def fingerprint_salt() -> str:
+    """會影響轉換結果、但不在資料列中的設定"""
+    from row_fingerprint import FINGERPRINT_VERSION
     
-    try:
-        # 1. 同步 Projects
-        print("\n📁 同步 Projects...")
-        projects = fetch_projects(conn)
-        print(f"   找到 {len(projects)} 個專案")
-        
+    parts = [FINGERPRINT_VERSION, APP_BASE_URL, ACL_MODE, PEOPLE_SOURCE, TEXT_NORMALIZE]
+    if TEXT_NORMALIZE:
+        import text_normalize
+        parts += [text_normalize.NORMALIZER_VERSION, text_normalize.TEXT_MAX_LENGTH]
+    return repr(parts)
+
+
+def row_dependencies(kind: str, project_map: Optional[Dict[str, Dict]] = None):
+    """轉換結果中來自資料列以外的部分：專案名稱/代碼與 ACL"""
+    acl_keys: Dict[int, str] = {}
+    
+    def acl_key(acl: List[Dict]) -> str:
+        # ACL 引擎回傳共用的 list，同一次同步中以 id 快取其內容
+        key = acl_keys.get(id(acl))
+        if key is None:
+            key = acl_keys[id(acl)] = json.dumps(acl, sort_keys=True)
+        return key
+    
+    def extra(row: Dict) -> str:
+        # 使用者 id 已在資料列中，人員解析的設定在 fingerprint_salt；
+        # 不含解析後的名稱，才能在正規化與人員解析之前比對指紋
+        parts: List = []
+        if kind in ("risks", "issues"):
+            project_ids = row.get("project_ids") or []
+            parts.append([(project_map[pid]["name"], project_map[pid]["code"])
+                          for pid in project_ids if pid in project_map])
+            if _acl_engine is not None:
+                parts.append(acl_key(item_acl(project_ids, row.get("owners"))))
+        elif kind == "milestones" and _acl_engine is not None:
+            owners = [row["assigned_to"]] if row.get("assigned_to") else []
+            parts.append(acl_key(item_acl([row["project_id"]], owners)))
+        return repr(parts)
+    
+    return extra
+
+
+def skip_unchanged(rows: List[Dict], kind: str, fingerprint_stats: Dict,
+                   project_map: Optional[Dict[str, Dict]] = None, enabled: bool = True,
+                   skipped_ids: Optional[List[str]] = None) -> List[Dict]:
+    """
+    只保留指紋有變更的資料列（未啟用時原樣回傳）；以讀取到的原始資料列計算，
+    需在文字正規化與人員解析之前呼叫，未變更的資料列不做任何處理
+    skipped_ids 不為 None 時加入被略過的項目 id
+    """
+    store = get_fingerprints() if enabled else None
+    if store is None or not rows:
+        return rows
+    prefix = next(p for p, k in ID_PREFIXES.items() if k == kind)
+    with profiling.stage("fingerprint"):
+        changed = store.filter_changed(rows, CONNECTION_ID, prefix, fingerprint_salt(),
+                                       row_dependencies(kind, project_map or {}))
+        if skipped_ids is not None and len(changed) != len(rows):
+            kept = {id(row) for row in changed}
+            skipped_ids.extend(f"{prefix}{row['id']}" for row in rows if id(row) not in kept)
+    fingerprint_stats["rows"] = fingerprint_stats.get("rows", 0) + len(rows)
+    fingerprint_stats["skipped"] = fingerprint_stats.get("skipped", 0) + len(rows) - len(changed)
+    return changed
+
+
+def project_label(project: Dict) -> List:
+    """
+    會被複製到子項目的專案欄位：名稱與代碼；
+    ACL_MODE=project 時另含成員雜湊，成員變動也需要更新子項目的 ACL
+    """
+    label = [project.get("name"), project.get("code")]
+    if ACL_MODE == "project":
+        members = sorted(set(project.get("managers") or []) | set(project.get("team_members") or []))
+        label.append(hashlib.sha1("\n".join(map(str, members)).encode("utf-8")).hexdigest()[:16])
+    return label
+
+
+def load_project_labels(conn) -> Dict[str, List]:
+    """讀取所有專案目前的 label，作為相依追蹤的初始基準"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT id, name, code, managers, team_members FROM projects")
+        return {str(row["id"]): project_label(row) for row in cur.fetchall()}
+
+
+def build_items(conn, filters: Optional[Dict] = None, stats: Optional[Dict] = None,
+                use_fingerprints: bool = True) -> List[CompactItem]:
+    """
+    讀取四種資料並轉換為 CompactItem；每種資料轉換完即釋放原始資料列
+    filters 見 build_filter；stats 會記錄各類型筆數與看到的最大 updated_at
+    啟用 ROW_FINGERPRINTS 時只轉換指紋有變更的資料列（use_fingerprints=False 可略過，如重建索引）
+    """
+    items: List[CompactItem] = []
+    for batch in iter_item_batches(conn, filters, stats, use_fingerprints):
+        items.extend(batch)
+    return items
+
+
+def iter_item_batches(conn, filters: Optional[Dict] = None, stats: Optional[Dict] = None,
+                      use_fingerprints: bool = True) -> Iterator[List[CompactItem]]:
+    """與 build_items 相同，但每種資料轉換完就產生該批項目，不必同時保留四種資料"""
+    items: List[CompactItem] = []
+    text_stats: Dict[str, int] = {}
+    people_stats: Dict[str, int] = {}
+    fingerprint_stats: Dict[str, int] = {}
+    # 呼叫端（--plan）需要知道被指紋略過的項目時，於 stats 傳入 "unchanged" list
+    skipped_ids = stats.get("unchanged") if stats is not None else None
+    
+    # 1. Projects
+    print("\n📁 讀取 Projects...")
+    with profiling.stage("fetch"):
+        projects = fetch_table(conn, "projects", fetch_projects, filters)
+        track_rows(stats, "projects", projects)
+    print(f"   找到 {len(projects)} 個專案")
+    projects = skip_unchanged(projects, "projects", fingerprint_stats, enabled=use_fingerprints, skipped_ids=skipped_ids)
+    normalize_texts(projects, "projects", text_stats)
+    resolve_people(projects, "projects", people_stats)
+    with profiling.stage("transform_project"):
         for project in projects:
-            item = transform_project(project)
-            if upsert_external_item(token, item):
-                results["success"] += 1
-                print(f"   ✅ {item['id']}")
-            else:
-                results["failed"] += 1
-                results["errors"].append(item["id"])
-        
-        # 2. 同步 Milestones
-        print("\n📌 同步 Milestones...")
-        milestones = fetch_milestones(conn)
-        print(f"   找到 {len(milestones)} 個里程碑")
-        
+            if _acl_engine is not None:
+                _acl_engine.update_project(project["id"], project.get("managers"), project.get("team_members"))
+            emit_item(items, transform_project(project, item_acl([project["id"]])))
+    del projects
+    yield items
+    items = []
+    profiling.snapshot("transform_project")
+    
+    # 2. Milestones
+    print("\n📌 讀取 Milestones...")
+    with profiling.stage("fetch"):
+        milestones = fetch_table(conn, "milestones", fetch_milestones, filters)
+        track_rows(stats, "milestones", milestones)
+        load_project_members(conn, [m["project_id"] for m in milestones])
+    print(f"   找到 {len(milestones)} 個里程碑")
+    milestones = skip_unchanged(milestones, "milestones", fingerprint_stats, enabled=use_fingerprints, skipped_ids=skipped_ids)
+    normalize_texts(milestones, "milestones", text_stats)
+    resolve_people(milestones, "milestones", people_stats)
+    with profiling.stage("transform_milestone"):
         for milestone in milestones:
-            item = transform_milestone(milestone)
-            if upsert_external_item(token, item):
-                results["success"] += 1
-                print(f"   ✅ {item['id']}")
-            else:
-                results["failed"] += 1
-                results["errors"].append(item["id"])
-        
-        # 3. 同步 Risks
-        print("\n⚠️ 同步 Risks...")
-        risks = fetch_risks(conn)
+            owners = [milestone["assigned_to"]] if milestone.get("assigned_to") else []
+            item = transform_milestone(milestone, item_acl([milestone["project_id"]], owners))
+            emit_item(items, item)
+    del milestones
+    yield items
+    items = []
+    profiling.snapshot("transform_milestone")
+    
+    # 3. Risks
+    print("\n⚠️ 讀取 Risks...")
+    with profiling.stage("fetch"):
+        risks = fetch_table(conn, "risks", fetch_risks, filters)
+        track_rows(stats, "risks", risks)
         print(f"   找到 {len(risks)} 個風險")
         
         # 取得相關專案資訊
@@ -412,19 +895,25 @@ def sync_all_data():
         for risk in risks:
             all_risk_project_ids.extend(risk.get("project_ids") or [])
         project_map = fetch_project_names(conn, list(set(all_risk_project_ids)))
-        
+        load_project_members(conn, all_risk_project_ids)
+    risks = skip_unchanged(risks, "risks", fingerprint_stats, project_map, enabled=use_fingerprints, skipped_ids=skipped_ids)
+    normalize_texts(risks, "risks", text_stats)
+    resolve_people(risks, "risks", people_stats)
+    
+    with profiling.stage("transform_risk"):
         for risk in risks:
-            item = transform_risk(risk, project_map)
-            if upsert_external_item(token, item):
-                results["success"] += 1
-                print(f"   ✅ {item['id']}")
-            else:
-                results["failed"] += 1
-                results["errors"].append(item["id"])
-        
-        # 4. 同步 Issues
-        print("\n🔴 同步 Issues...")
-        issues = fetch_issues(conn)
+            item = transform_risk(risk, project_map, item_acl(risk.get("project_ids") or [], risk.get("owners")))
+            emit_item(items, item)
+    del risks
+    yield items
+    items = []
+    profiling.snapshot("transform_risk")
+    
+    # 4. Issues
+    print("\n🔴 讀取 Issues...")
+    with profiling.stage("fetch"):
+        issues = fetch_table(conn, "issues", fetch_issues, filters)
+        track_rows(stats, "issues", issues)
         print(f"   找到 {len(issues)} 個問題")
         
         # 取得相關專案資訊
@@ -432,25 +921,185 @@ def sync_all_data():
         for issue in issues:
             all_issue_project_ids.extend(issue.get("project_ids") or [])
         project_map = fetch_project_names(conn, list(set(all_issue_project_ids)))
-        
+        load_project_members(conn, all_issue_project_ids)
+    issues = skip_unchanged(issues, "issues", fingerprint_stats, project_map, enabled=use_fingerprints, skipped_ids=skipped_ids)
+    normalize_texts(issues, "issues", text_stats)
+    resolve_people(issues, "issues", people_stats)
+    
+    with profiling.stage("transform_issue"):
         for issue in issues:
-            item = transform_issue(issue, project_map)
-            if upsert_external_item(token, item):
+            item = transform_issue(issue, project_map, item_acl(issue.get("project_ids") or [], issue.get("owners")))
+            emit_item(items, item)
+    del issues
+    yield items
+    items = []
+    profiling.snapshot("transform_issue")
+    
+    if text_stats.get("texts"):
+        print(f"\n🧹 文字正規化 {text_stats['texts']} 段（快取 {text_stats['cached']}，新處理 {text_stats['normalized']}）")
+    if fingerprint_stats.get("rows"):
+        print(f"\n🧬 指紋比對 {fingerprint_stats['rows']} 列，{fingerprint_stats['skipped']} 列未變更，略過轉換與上傳")
+    if people_stats.get("ids"):
+        print(f"\n👥 人員解析 {people_stats['ids']} 位（快取 {people_stats['cached']}，"
+              f"查詢 {people_stats['looked_up']} 位 / {people_stats['batches']} 批，找不到 {people_stats['not_found']}）")
+    if _dead_letter is not None and _dead_letter.count:
+        print(f"\n🚫 累計 {_dead_letter.count} 個項目未通過 Schema 驗證"
+              + (f"，已寫入 {_dead_letter.path}" if _dead_letter.path else ""))
+
+
+def schedule_items(items: List[CompactItem]) -> List[CompactItem]:
+    """依優先順序策略排序，最重要的變更最先上傳"""
+    if not PRIORITY_SCHEDULING:
+        return items
+    from priority_scheduler import order_items
+    
+    return order_items(items)
+
+
+_mirror = None
+
+
+def get_mirror():
+    """啟用鏡像時回傳共用的 LocalMirror，否則為 None"""
+    global _mirror
+    if _mirror is None and MIRROR_PATH:
+        from local_mirror import LocalMirror
+        _mirror = LocalMirror(MIRROR_PATH)
+    return _mirror
+
+
+def commit_mirror(results: Dict, errors_before: int, replace_all: bool = False):
+    """上傳結束後把暫存的項目寫入鏡像，排除這次失敗的 id"""
+    mirror = get_mirror()
+    if mirror is None or not mirror.staged:
+        return
+    merged = mirror.commit_staged(results["errors"][errors_before:], replace_all=replace_all)
+    print(f"   🪞 鏡像已更新 {merged} 個項目（{mirror.path}）")
+
+
+def upload_items(token: str, items: List[CompactItem], results: Dict):
+    """序列化並上傳，結果累計到 results"""
+    upload_serialized(token, serialize_items(items), results)
+
+
+def count_payload(pairs: Iterable[Tuple[str, bytes]], results: Dict) -> Iterable[Tuple[str, bytes]]:
+    """累計送出的 payload 大小到 results["payload_bytes"]（執行紀錄使用）"""
+    results.setdefault("payload_bytes", 0)
+    for item_id, body in pairs:
+        results["payload_bytes"] += len(body)
+        yield item_id, body
+
+
+def add_batch_stats(results: Dict, stats: Dict):
+    for key in ("throttled", "retried"):
+        results[key] = results.get(key, 0) + stats[key]
+
+
+_freshness = None
+
+
+def get_freshness(token: str):
+    """--freshness 時整次執行共用一個追蹤器，結束時由 finish_freshness 輸出"""
+    global _freshness
+    if FRESHNESS and _freshness is None:
+        from freshness import FreshnessTracker
+        _freshness = FreshnessTracker(token)
+    return _freshness
+
+
+def finish_freshness():
+    global _freshness
+    if _freshness is None:
+        return
+    import freshness
+    
+    tracker, _freshness = _freshness, None
+    freshness.print_report(tracker.finish())
+
+
+def upload_serialized(token: str, pairs: Iterable[Tuple[str, bytes]], results: Dict):
+    """上傳已序列化的 (item_id, bytes) 串流，結果累計到 results"""
+    errors_before = len(results["errors"])
+    pairs = count_payload(pairs, results)
+    mirror = get_mirror()
+    if mirror is not None:
+        pairs = mirror.staging(pairs)
+    if _fingerprints is not None and _fingerprints.pending:
+        pairs = _fingerprints.staging(pairs)
+    tracker = get_freshness(token)
+    if tracker is not None:
+        pairs = tracker.watch(pairs)
+    
+    if USE_GRAPH_BATCH:
+        from graph_batch import GraphBatchClient
+        
+        # 批次上傳可能持續數小時，每批向 get_access_token 取得（快取、到期前更新）的 Token
+        client = GraphBatchClient(get_access_token, on_success=tracker.ack if tracker is not None else None)
+        client.upsert_many(pairs, results)
+        print_batch_stats(client.stats)
+        add_batch_stats(results, client.stats)
+    else:
+        for item_id, body in pairs:
+            if upsert_external_item_raw(token, item_id, body):
                 results["success"] += 1
-                print(f"   ✅ {item['id']}")
+                if tracker is not None:
+                    tracker.ack("PUT", item_id)
+                print(f"   ✅ {item_id}")
             else:
                 results["failed"] += 1
-                results["errors"].append(item["id"])
+                results["errors"].append(item_id)
+    commit_mirror(results, errors_before)
+    if _fingerprints is not None and _fingerprints.sent:
+        _fingerprints.commit(CONNECTION_ID, results["errors"][errors_before:])
+
+
+def delete_items(token: str, item_ids: List[str], results: Dict):
+    """刪除多個 External Item，結果累計到 results"""
+    errors_before = len(results["errors"])
+    if USE_GRAPH_BATCH:
+        from graph_batch import GraphBatchClient
         
-    finally:
-        conn.close()
+        client = GraphBatchClient(get_access_token)
+        client.delete_many(item_ids, results)
+        print_batch_stats(client.stats)
+        add_batch_stats(results, client.stats)
+    else:
+        for item_id in item_ids:
+            if delete_external_item(token, item_id):
+                results["success"] += 1
+            else:
+                results["failed"] += 1
+                results["errors"].append(item_id)
     
-    # 結果摘要
+    mirror = get_mirror()
+    if mirror is not None:
+        failed = set(results["errors"][errors_before:])
+        mirror.remove(i for i in item_ids if i not in failed)
+
+
+def print_batch_stats(stats: Dict):
+    print(f"   📦 $batch: {stats['batches']} 個請求 / {stats['sub_requests']} 個子請求"
+          f" | 重試 {stats['retried']} | 節流 {stats['throttled']}")
+
+
+# ============================================
+# 結果摘要
+# ============================================
+def print_summary(results: Dict):
     print("\n" + "=" * 60)
     print("📊 同步結果摘要")
     print("=" * 60)
     print(f"   ✅ 成功: {results['success']}")
     print(f"   ❌ 失敗: {results['failed']}")
+    if _acl_engine is not None:
+        stats = _acl_engine.stats
+        print(f"   🔒 ACL: {_acl_engine.interned_count} 組共用 | 快取命中 {stats['hits']} / 計算 {stats['misses']}")
+        if stats["no_members"]:
+            target = f"僅授權給群組 {ACL_FALLBACK_GROUP}" if ACL_FALLBACK_GROUP else "未上傳，已寫入 dead letter"
+            print(f"   ⚠️ {stats['no_members']} 個項目沒有可授權的成員，{target}")
+        if _acl_engine.invalid_ids:
+            sample = ", ".join(sorted(_acl_engine.invalid_ids)[:5])
+            print(f"   ⚠️ {len(_acl_engine.invalid_ids)} 個成員 id 不是 Entra ID object id，未列入 ACL（例如 {sample}）")
     
     if results["errors"]:
         print(f"\n   失敗項目:")
@@ -458,9 +1107,392 @@ def sync_all_data():
             print(f"      - {err}")
         if len(results["errors"]) > 10:
             print(f"      ... 還有 {len(results['errors']) - 10} 個")
+
+
+# ============================================
+# 主要同步邏輯
+# ============================================
+def sync_all_data():
+    print("=" * 60)
+    print("步驟 4：同步資料到 Microsoft Graph Connector")
+    print("=" * 60)
+    
+    # 取得 Token
+    print("\n🔑 取得 Access Token...")
+    token = get_access_token()
+    print("✅ Token 取得成功")
+    
+    # 連接資料庫
+    print("\n📦 連接資料庫...")
+    try:
+        conn = get_db_connection()
+        print("✅ 資料庫連接成功")
+    except Exception as e:
+        print(f"❌ 資料庫連接失敗: {e}")
+        print("\n請確認 DATABASE_CONFIG 設定正確，或使用環境變數：")
+        print("  DB_HOST, DB_PORT, DB_NAME, DB_USER, DB_PASSWORD")
+        return
+    
+    results = {"success": 0, "failed": 0, "errors": []}
+    stats: Dict = {}
+    
+    if SQL_JSON:
+        upload_from_sql(token, conn, None, results)
+    elif PRIORITY_SCHEDULING:
+        # 全域排序需要先取得所有項目
+        try:
+            items = schedule_items(build_items(conn, None, stats))
+        finally:
+            conn.close()
+        results["rows"] = rows_read(stats)
+        
+        print(f"\n📤 上傳 {len(items)} 個項目...")
+        upload_items(token, items, results)
+    else:
+        # 不排序時每種資料轉換完就開始上傳，同時只保留一種資料的項目
+        print("\n📤 邊讀取邊上傳...")
+        try:
+            upload_serialized(token, serialize_items(c for batch in iter_item_batches(conn, None, stats)
+                                                     for c in batch), results)
+        finally:
+            conn.close()
+        results["rows"] = rows_read(stats)
+    profiling.snapshot("upload")
+    
+    print_summary(results)
     
     print("\n🎉 同步完成！")
     print("   資料現在可以在 Microsoft Search 和 Copilot 中搜尋")
+    return results
+
+
+def upload_from_sql(token: str, conn, filters: Optional[Dict], results: Dict):
+    """
+    SQL JSON 模式：資料庫產生的 bytes 邊讀邊上傳，連線在上傳結束後關閉
+    此模式仍以 Schema 驗證器檢查每個項目，但不經過文字正規化與優先順序排序
+    """
+    import sql_items
+    
+    print("\n📤 以 SQL JSON 模式讀取並上傳...")
+    stats: Dict = {}
+    try:
+        conflicts = sql_json_conflicts()
+        if conflicts:
+            raise ValueError(f"SQL JSON 模式無法套用 {'、'.join(conflicts)}，輸出會與一般同步不同")
+        upload_serialized(token, sql_items.iter_item_bytes(conn, filters, stats), results)
+    finally:
+        conn.close()
+    results["rows"] = rows_read(stats)
+
+
+def sql_json_conflicts() -> List[str]:
+    """已啟用、會改變項目內容但 SQL JSON 模式無法套用的設定"""
+    conflicts = []
+    if TEXT_NORMALIZE:
+        conflicts.append("TEXT_NORMALIZE（文字正規化）")
+    if PEOPLE_SOURCE:
+        conflicts.append("PEOPLE_SOURCE（人員解析）")
+    return conflicts
+
+
+def verify_sql_json(filters: Optional[Dict] = None) -> int:
+    """比對 SQL JSON 模式與 build_items 的輸出是否逐位元組相同"""
+    import sql_items
+    
+    print("=" * 60)
+    print("檢查 SQL JSON 模式與一般同步的輸出")
+    print("=" * 60)
+    conflicts = sql_json_conflicts()
+    if conflicts:
+        print(f"\n❌ 已啟用 {'、'.join(conflicts)}，SQL JSON 模式無法套用，輸出必然不同；"
+              "請先停用（例如 TEXT_NORMALIZE=0）")
+        return 1
+    conn = get_db_connection()
+    try:
+        problems = sql_items.verify(conn, filters)
+    finally:
+        conn.close()
+    if problems:
+        print(f"\n❌ 發現 {len(problems)} 個差異，請勿啟用 SQL_JSON")
+        return 1
+    print("\n✅ 輸出完全相同")
+    return 0
+
+
+# ============================================
+# 增量同步
+# ============================================
+def collect_incremental(conn, state: Dict, stats: Optional[Dict] = None) -> Tuple[List[CompactItem], Dict]:
+    """
+    增量同步要上傳的項目（已排序）與讀取統計；不修改狀態檔
+    專案名稱/代碼變更時一併包含受影響的子項目；stats 可由呼叫端傳入（見 iter_item_batches 的 "unchanged"）
+    """
+    import sync_state
+    
+    since = sync_state.get_watermark(state)
+    print(f"\n⏱️ 增量同步，watermark: {since.isoformat() if since else '無（完整同步）'}")
+    
+    # 尚未有相依基準時（例如剛升級）先記錄所有專案目前的 label
+    if since is not None and "project_labels" not in state:
+        state["project_labels"] = load_project_labels(conn)
+    known_labels = state.setdefault("project_labels", {})
+    
+    stats = {} if stats is None else stats
+    stats["recent"] = {}
+    if since is None:
+        items = build_items(conn, None, stats)
+    else:
+        # 重新讀取 watermark 前的重疊區間；上次已處理、updated_at 未變的資料列不再上傳
+        items = build_items(conn, {"not_before": since - timedelta(seconds=INCREMENTAL_OVERLAP_SECONDS)}, stats)
+        seen = state.get("overlap_seen") or {}
+        fetched = len(items)
+        items = [c for c in items if seen.get(c.id) != c.get("lastModifiedDateTime")]
+        if fetched != len(items):
+            print(f"\n🔁 重疊區間內 {fetched - len(items)} 個項目上次已同步，略過")
+    
+    # 專案名稱/代碼（或 ACL 成員）變更時，子項目內複製的欄位也需要更新
+    fetched_labels = stats.get("project_labels", {})
+    changed = [pid for pid, label in fetched_labels.items()
+               if pid in known_labels and known_labels[pid] != label]
+    if changed:
+        print(f"\n🔗 {len(changed)} 個專案的名稱/代碼變更，重新產生其子項目...")
+        emitted = {c.id for c in items}
+        child_stats: Dict = {}
+        children = build_items(conn, {"project_ids": changed, "types": {"milestones", "risks", "issues"}}, child_stats)
+        stats["dependent_rows"] = rows_read(child_stats)
+        dependents = [c for c in children if c.id not in emitted]
+        print(f"   另外重新上傳 {len(dependents)} 個子項目")
+        items.extend(dependents)
+    return schedule_items(items), stats
+
+
+def run_incremental(token: str, conn, state: Optional[Dict] = None) -> Dict:
+    """
+    只同步 updated_at 大於 watermark 的資料（另重新讀取 INCREMENTAL_OVERLAP_SECONDS 的重疊區間）；全部成功才推進 watermark，
+    有失敗時下次會從同一個 watermark 重新同步
+    專案的 projectName / projectCode 被複製到子項目中，專案變更時只重新產生受影響的子項目
+    """
+    import coalesce
+    import sync_state
+    
+    state = sync_state.load_state() if state is None else state
+    items, stats = collect_incremental(conn, state)
+    known_labels = state["project_labels"]
+    fetched_labels = stats.get("project_labels", {})
+    
+    # 上傳失敗時 watermark 不前進，這次延後的變更下次會再讀到，合併狀態也需還原
+    coalesce_before = copy.deepcopy(state.get("coalesce"))
+    coalescer = coalesce.get_coalescer(state)
+    if coalescer is not None:
+        items = coalesce_items(conn, coalescer, items, stats)
+    
+    results = {"success": 0, "failed": 0, "errors": [],
+               "rows": rows_read(stats) + stats.get("dependent_rows", 0)}
+    if items:
+        print(f"\n📤 上傳 {len(items)} 個項目...")
+        upload_items(token, items, results)
+    if coalescer is not None:
+        coalescer.record_uploads([c.id for c in items], results["errors"])
+        coalescer.prune()
+        results["coalesced"] = coalescer.stats["deferred"]
+        results["coalesce_saved"] = coalescer.stats["saved"]
+    
+    if resolve_connection_id() != CONNECTION_ID:
+        # 執行期間已切換到新的 Connection（blue/green 重建索引），
+        # 不覆寫切換時設定的 watermark，下次會對新的 Connection 補上這段變更
+        print("⚠️ 同步期間 Connection 已切換，不更新 watermark")
+    elif results["failed"] == 0:
+        if stats.get("max_updated_at") is not None:
+            sync_state.set_watermark(state, stats["max_updated_at"], overlap_seen(stats))
+        known_labels.update(fetched_labels)
+        sync_state.save_state(state)
+    elif coalescer is not None:
+        if coalesce_before is None:
+            state.pop("coalesce", None)
+        else:
+            state["coalesce"] = coalesce_before
+    results["watermark"] = state.get("watermark")
+    return results
+
+
+def overlap_seen(stats: Dict) -> Dict[str, str]:
+    """
+    新 watermark 的重疊區間內這次已處理的資料列：item id -> lastModifiedDateTime
+    下次增量同步會重新讀到這些資料列，updated_at 相同時略過；較晚 commit 的資料列不在其中，會被上傳
+    """
+    cutoff = stats["max_updated_at"] - timedelta(seconds=INCREMENTAL_OVERLAP_SECONDS)
+    return {item_id: to_iso_string(updated_at) for item_id, updated_at in stats.get("recent", {}).items()
+            if updated_at >= cutoff}
+
+
+def coalesce_items(conn, coalescer, items: List[CompactItem], stats: Optional[Dict] = None) -> List[CompactItem]:
+    """
+    延後仍在合併時間窗內的變更，並重新讀取時間窗已結束的延後項目（最新狀態只上傳一次）
+    stats 為增量同步的統計，重新讀取的列數計入 dependent_rows
+    """
+    from coalesce import ids_filter
+    
+    upload = coalescer.defer(items)
+    due = coalescer.due({c.id for c in items})
+    if due:
+        print(f"\n🧊 {len(due)} 個延後的項目合併時間窗已結束，重新讀取最新狀態...")
+        flush_stats: Dict = {}
+        flushed = build_items(conn, ids_filter(due), flush_stats)
+        if stats is not None:
+            stats["dependent_rows"] = stats.get("dependent_rows", 0) + rows_read(flush_stats)
+        coalescer.flush(due, flushed)
+        upload = schedule_items(upload + flushed)
+    stats = coalescer.stats
+    if stats["deferred"] or stats["flushed"]:
+        print(f"\n🧊 合併更新：延後 {stats['deferred']} 個項目（共 {coalescer.pending_count()} 個等待中），"
+              f"合併上傳 {stats['flushed']} 個，節省 {stats['saved']} 次上傳"
+              f"（累計 {coalescer.data['saved_total'] + stats['saved']} 次）")
+    return upload
+
+
+def sync_incremental():
+    print("=" * 60)
+    print("步驟 4：增量同步資料到 Microsoft Graph Connector")
+    print("=" * 60)
+    
+    token = get_access_token()
+    print("✅ Token 取得成功")
+    
+    conn = get_db_connection()
+    try:
+        results = run_incremental(token, conn)
+    finally:
+        conn.close()
+    
+    print_summary(results)
+    return results
+
+
+# ============================================
+# 選擇性重新同步
+# ============================================
+ENTITY_TYPES = ("projects", "milestones", "risks", "issues")
+ID_PREFIXES = {"project-": "projects", "milestone-": "milestones", "risk-": "risks", "issue-": "issues"}
+
+
+def parse_selection(only: Optional[str] = None, ids: Optional[str] = None,
+                    ids_file: Optional[str] = None, projects: Optional[str] = None,
+                    since: Optional[str] = None, until: Optional[str] = None) -> Dict:
+    """
+    將命令列參數轉為 build_items 的 filters
+    ids 可寫成 External Item id（risk-42）或原始 id；原始 id 套用到 --only 指定的所有類型
+    """
+    filters: Dict = {}
+    types = None
+    if only:
+        types = {t.strip() for t in only.split(",") if t.strip()}
+        unknown = types - set(ENTITY_TYPES)
+        if unknown:
+            raise ValueError(f"未知的資料類型：{', '.join(sorted(unknown))}（可用：{', '.join(ENTITY_TYPES)}）")
+    
+    tokens = [t.strip() for t in (ids or "").split(",") if t.strip()]
+    if ids_file:
+        with open(ids_file, encoding="utf-8") as f:
+            tokens += [line.strip() for line in f if line.strip() and not line.startswith("#")]
+    if tokens:
+        by_type: Dict[str, List[str]] = {}
+        for token in tokens:
+            kind = next((k for p, k in ID_PREFIXES.items() if token.startswith(p)), None)
+            if kind is not None:
+                by_type.setdefault(kind, []).append(token.split("-", 1)[1])
+            elif types:
+                for kind in types:
+                    by_type.setdefault(kind, []).append(token)
+            else:
+                raise ValueError(f"無法判斷 id {token} 的類型，請加上前綴（如 risk-{token}）或使用 --only")
+        filters["ids"] = by_type
+        types = set(by_type) if types is None else types & set(by_type)
+    
+    if projects:
+        filters["project_ids"] = [p.strip() for p in projects.split(",") if p.strip()]
+    if since:
+        filters["since"] = datetime.fromisoformat(since)
+    if until:
+        filters["until"] = datetime.fromisoformat(until)
+    if types is not None:
+        filters["types"] = types
+    return filters
+
+
+def sync_selected(filters: Dict):
+    """只同步 filters 選取的資料，走與完整同步相同的讀取、轉換與上傳流程（不影響 watermark）"""
+    print("=" * 60)
+    print("選擇性重新同步")
+    print("=" * 60)
+    for key, value in filters.items():
+        print(f"   {key}: {sorted(value) if isinstance(value, set) else value}")
+    
+    token = get_access_token()
+    conn = get_db_connection()
+    results = {"success": 0, "failed": 0, "errors": []}
+    if SQL_JSON:
+        upload_from_sql(token, conn, filters, results)
+        print_summary(results)
+        return results
+    stats: Dict = {}
+    try:
+        # 明確指定的資料通常是要修正 Graph 端的內容，一律重新上傳，不依指紋略過
+        items = schedule_items(build_items(conn, filters, stats, use_fingerprints=False))
+    finally:
+        conn.close()
+    results["rows"] = rows_read(stats)
+    
+    if items:
+        print(f"\n📤 上傳 {len(items)} 個項目...")
+        upload_items(token, items, results)
+    print_summary(results)
+    return results
+
+
+# ============================================
+# 離線匯出 / 重播
+# ============================================
+def export_all_data(out_dir: str, filters: Optional[Dict] = None):
+    """從資料庫讀取並轉換後寫入 spool 目錄，不需要 Graph 連線；filters 可只匯出部分資料"""
+    import spool
+    
+    print("=" * 60)
+    print(f"匯出資料到 spool：{out_dir}")
+    print("=" * 60)
+    
+    conn = get_db_connection()
+    try:
+        items = schedule_items(build_items(conn, filters))
+    finally:
+        conn.close()
+    
+    index = spool.export_items(items, out_dir)
+    compressed = sum(c["compressed_bytes"] for c in index["chunks"])
+    print(f"\n✅ 匯出完成：{index['total']} 個項目，{len(index['chunks'])} 個分塊，{compressed / 1024 / 1024:.1f} MB")
+
+
+def replay_spool(spool_dir: str, concurrency: Optional[int] = None):
+    """將 spool 目錄中的項目並行上傳"""
+    import spool
+    
+    concurrency = concurrency or spool.DEFAULT_CONCURRENCY
+    print("=" * 60)
+    print(f"重播 spool：{spool_dir}（並行數 {concurrency}）")
+    print("=" * 60)
+    
+    index = spool.load_index(spool_dir)
+    print(f"   共 {index['total']} 個項目，{len(index['chunks'])} 個分塊（匯出於 {index['created_at']}）")
+    
+    get_access_token()
+    print("✅ Token 取得成功")
+    
+    results = {"success": 0, "failed": 0, "errors": []}
+    # 重播可能持續數小時，每次請求向 get_access_token 取得仍有效的 Token
+    spool.replay(get_access_token, spool_dir, results, concurrency=concurrency, use_batch=USE_GRAPH_BATCH,
+                 mirror=get_mirror())
+    commit_mirror(results, 0)
+    print_summary(results)
+    return results
 
 
 # ============================================
@@ -574,15 +1606,187 @@ def sync_test_data():
     print("   你可以到 Microsoft Search 搜尋 '測試專案' 來驗證")
 
 
+# ============================================
+# 執行紀錄
+# ============================================
+def dead_letter_count() -> int:
+    return _dead_letter.count if _dead_letter is not None else 0
+
+
+def record_run(mode: str, started_at: datetime, duration: float, results: Optional[Dict],
+               skipped: int = 0, error: Optional[str] = None):
+    """寫入執行紀錄並與前幾次同模式執行比較；紀錄失敗不影響同步結果"""
+    if not RUN_HISTORY:
+        return
+    try:
+        import run_history
+        
+        results = results or {}
+        run = {
+            "started_at": started_at.isoformat(),
+            "mode": mode,
+            "duration_seconds": round(duration, 3),
+            "rows": results.get("rows", 0),
+            "success": results.get("success", 0),
+            "failed": results.get("failed", 0),
+            "skipped": skipped,
+            "throttled": results.get("throttled", 0),
+            "retried": results.get("retried", 0),
+            "payload_bytes": results.get("payload_bytes", 0),
+            "stages": {k: round(v, 3) for k, v in profiling.stage_seconds().items()},
+            "error": error,
+        }
+        history = run_history.RunHistory()
+        try:
+            run_id = history.record(run)
+            reasons = run_history.check_latest(history, run_id, mode)
+        finally:
+            history.close()
+        print(f"\n📈 執行紀錄 #{run_id}（{mode}，{duration:.1f}s）")
+        if reasons:
+            print("⚠️ 效能退步：" + "；".join(reasons))
+    except Exception as e:
+        print(f"⚠️ 無法寫入執行紀錄: {e}")
+
+
 # ============================================
 # 執行
 # ============================================
-if __name__ == "__main__":
-    import sys
+def main(argv: Optional[List[str]] = None):
+    import argparse
+    import time
+    global PRIORITY_SCHEDULING, USE_GRAPH_BATCH, MIRROR_PATH, SQL_JSON, FRESHNESS, PEOPLE_SOURCE, ROW_FINGERPRINTS, TEXT_NORMALIZE
+    
+    parser = argparse.ArgumentParser(prog="data_sync.py", description="同步資料到 Microsoft Graph Connector")
+    parser.add_argument("--test", action="store_true", help="測試模式：使用假資料")
+    parser.add_argument("--incremental", action="store_true", help="只同步上次 watermark 之後變更的資料")
+    parser.add_argument("--only", metavar="TYPES", help="只同步指定類型，例如 risks,issues")
+    parser.add_argument("--ids", help="只同步指定 id，逗號分隔（risk-42 或搭配 --only 的原始 id）")
+    parser.add_argument("--ids-file", metavar="FILE", help="從檔案讀取 id（每行一個）")
+    parser.add_argument("--project", metavar="IDS", help="重新同步專案及其所有 milestones / risks / issues")
+    parser.add_argument("--since", help="只同步 updated_at 晚於此時間的資料（ISO 格式）")
+    parser.add_argument("--until", help="只同步 updated_at 不晚於此時間的資料（ISO 格式）")
+    parser.add_argument("--export", metavar="DIR", help="只匯出到 spool 目錄，不上傳")
+    parser.add_argument("--replay", metavar="DIR", help="上傳先前匯出的 spool 目錄")
+    parser.add_argument("--no-priority", action="store_true", help="依資料表順序上傳，不做優先順序排序")
+    parser.add_argument("--no-batch", action="store_true", help="逐筆 PUT，不使用 Graph $batch")
+    parser.add_argument("--profile", nargs="?", const="", metavar="DIR",
+                        help="分階段收集 CPU profile 與 tracemalloc 快照（預設輸出到 profile-<時間>）")
+    parser.add_argument("--concurrency", type=int, help="重播時的並行上傳數（預設 REPLAY_CONCURRENCY 或 16）")
+    parser.add_argument("--sql-json", action="store_true",
+                        help="由 PostgreSQL 直接產生項目 JSON 並串流上傳（完整與選擇性同步；環境中需設定 SQL_JSON=1 或 TEXT_NORMALIZE=0）")
+    parser.add_argument("--verify-sql-json", action="store_true",
+                        help="比對 SQL JSON 模式與一般同步的輸出後結束（可搭配選擇性同步的參數）")
+    parser.add_argument("--mirror", nargs="?", const="mirror.db", metavar="PATH",
+                        help="將成功上傳的項目寫入本機 SQLite 全文檢索鏡像（預設 mirror.db）")
+    parser.add_argument("--people", metavar="SOURCE",
+                        help="將負責人與成員的使用者 id 解析為名稱與信箱（file:<路徑>、mock 或 module:<模組>:<名稱>）")
+    parser.add_argument("--skip-unchanged", action="store_true",
+                        help="只轉換並上傳資料列指紋與上次上傳時不同的項目（ROW_FINGERPRINTS=1）")
+    parser.add_argument("--partitions", type=int, metavar="N",
+                        help="大型資料表分為 N 個 id 範圍平行讀取（預設 EXTRACT_PARTITIONS 或 4，1 表示不分區）")
+    parser.add_argument("--plan", action="store_true",
+                        help="只讀取、轉換並與鏡像比對，列出各 itemType 的 PUT / DELETE 數量、大小與預估耗時，不上傳")
+    parser.add_argument("--freshness", action="store_true",
+                        help="量測資料列變更 → ack → 可讀回的延遲（抽樣 GET，結束時輸出百分位數）")
+    args = parser.parse_args(argv)
+    
+    if args.no_priority:
+        PRIORITY_SCHEDULING = False
+    if args.no_batch:
+        USE_GRAPH_BATCH = False
+    if args.mirror:
+        MIRROR_PATH = args.mirror
+    if args.sql_json and not SQL_JSON and os.environ.get("TEXT_NORMALIZE") != "0":
+        # 文字正規化只依環境變數決定：只在這次加上 --sql-json，之後的增量同步仍會正規化，
+        # 同一項目在兩種路徑上傳的內容就會不同
+        parser.error("--sql-json 需要所有同步（含增量同步與常駐服務）都停用文字正規化，"
+                     "請在環境中設定 SQL_JSON=1 或 TEXT_NORMALIZE=0")
+    if args.sql_json:
+        SQL_JSON = True
+    if args.verify_sql_json and "TEXT_NORMALIZE" not in os.environ:
+        # 以 SQL_JSON=1 時的預設設定比對：不做 SQL 無法重現的文字正規化
+        TEXT_NORMALIZE = False
+    if args.freshness:
+        FRESHNESS = True
+    if args.skip_unchanged:
+        ROW_FINGERPRINTS = True
+    if args.people:
+        PEOPLE_SOURCE = args.people
+    if PEOPLE_SOURCE and not (args.test or args.replay):
+        try:
+            get_people_resolver()
+        except (ValueError, OSError, ImportError, AttributeError) as e:
+            parser.error(f"無法載入人員目錄來源：{e}")
+    if (SQL_JSON or args.verify_sql_json) and not (args.test or args.replay) and sql_json_conflicts():
+        parser.error(f"SQL JSON 模式無法套用 {'、'.join(sql_json_conflicts())}，"
+                     "請停用後再使用 --sql-json / --verify-sql-json / SQL_JSON=1")
+    if args.partitions is not None:
+        import partitioned_fetch
+        partitioned_fetch.EXTRACT_PARTITIONS = max(1, args.partitions)
+    
+    if args.plan and (args.test or args.export or args.replay or args.verify_sql_json):
+        parser.error("--plan 不能與 --test、--export、--replay、--verify-sql-json 同時使用")
     
-    if len(sys.argv) > 1 and sys.argv[1] == "--test":
-        # 測試模式：使用假資料
-        sync_test_data()
+    try:
+        selection = parse_selection(args.only, args.ids, args.ids_file, args.project, args.since, args.until)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if args.profile is not None:
+        out_dir = args.profile or f"profile-{datetime.now().strftime('%Y%m%d-%H%M%S')}"
+        profiling.start(out_dir)
+    
+    if args.incremental:
+        mode = "incremental"
+    elif args.replay:
+        mode = "replay"
     else:
-        # 正式模式：從資料庫同步
-        sync_all_data()
\ No newline at end of file
+        mode = ("selected" if selection else "full") + ("-sql" if SQL_JSON else "")
+    if args.plan:
+        import sync_plan
+        sync_plan.plan_sync(mode, selection or None)
+        return
+    if args.test or args.verify_sql_json or args.export:
+        mode = None
+    if mode and args.profile is None:
+        profiling.start_timing()
+    
+    started_at = datetime.now().astimezone()
+    started = time.perf_counter()
+    dead_before = dead_letter_count()
+    results = None
+    error = None
+    try:
+        if args.test:
+            # 測試模式：使用假資料
+            sync_test_data()
+        elif args.verify_sql_json:
+            return verify_sql_json(selection or None)
+        elif args.incremental:
+            results = sync_incremental()
+        elif args.export:
+            export_all_data(args.export, selection or None)
+        elif args.replay:
+            results = replay_spool(args.replay, args.concurrency)
+        elif selection:
+            results = sync_selected(selection)
+        else:
+            # 正式模式：從資料庫同步
+            results = sync_all_data()
+    except BaseException as e:
+        error = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else e}"
+        raise
+    finally:
+        # 讀回等待時間不計入同步耗時
+        duration = time.perf_counter() - started
+        finish_freshness()
+        if mode:
+            record_run(mode, started_at, duration, results, dead_letter_count() - dead_before, error)
+        summary_path = profiling.stop()
+        if summary_path:
+            print(f"\n🔬 Profile 已輸出：{summary_path}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,34 @@
+"""
+Dead letter 輸出
+無法上傳的項目以 NDJSON 逐行附加到檔案，保留原因與完整內容以便修正後重送
+"""
+import json
+import os
+import threading
+from datetime import datetime, timezone
+from typing import Dict
+
+DEAD_LETTER_PATH = os.environ.get("DEAD_LETTER_PATH", "dead_letter.ndjson")
+
+
+class DeadLetterWriter:
+    """path 為空時只計數不寫檔（--plan）"""
+
+    def __init__(self, path: str = DEAD_LETTER_PATH):
+        self.path = path
+        self.count = 0
+        self._lock = threading.Lock()
+
+    def write(self, item: Dict, reason: str):
+        record = {
+            "id": item.get("id"),
+            "reason": reason,
+            "at": datetime.now(timezone.utc).isoformat(),
+            "item": item,
+        }
+        line = json.dumps(record, ensure_ascii=False, default=str)
+        with self._lock:
+            if self.path:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(line + "\n")
+            self.count += 1
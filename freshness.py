@@ -0,0 +1,245 @@
+"""
+端到端新鮮度延遲追蹤（--freshness）
+記錄每個項目的 updated_at、上傳成功（ack）的時間，並抽樣以 GET 讀回項目，
+直到 Connection 回傳的 lastModifiedDateTime 不早於這次上傳的為止（依時間比較，不比對字串），
+依 itemType 統計「資料列變更 → ack」與「資料列變更 → 可讀回」的延遲百分位數
+
+真實租用戶與 mock_graph.py 皆適用（以 GRAPH_API_BASE 指定）
+"""
+import json
+import os
+import random
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future, ThreadPoolExecutor, wait
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+FRESHNESS_PATH = os.environ.get("FRESHNESS_PATH", "freshness.db")
+FRESHNESS_SAMPLE_RATE = float(os.environ.get("FRESHNESS_SAMPLE_RATE", "0.05"))
+# 讀回是逐一輪詢，樣本過多時排隊本身會拉長量到的延遲
+FRESHNESS_MAX_SAMPLES = int(os.environ.get("FRESHNESS_MAX_SAMPLES", "200"))
+FRESHNESS_CONCURRENCY = int(os.environ.get("FRESHNESS_CONCURRENCY", "8"))
+FRESHNESS_POLL_INTERVAL = float(os.environ.get("FRESHNESS_POLL_INTERVAL", "2"))
+# 每個樣本自 ack 起最多等待的秒數；結束時最多再等待 FRESHNESS_MAX_WAIT 秒，其餘樣本視為逾時
+FRESHNESS_READBACK_TIMEOUT = float(os.environ.get("FRESHNESS_READBACK_TIMEOUT", "600"))
+FRESHNESS_MAX_WAIT = float(os.environ.get("FRESHNESS_MAX_WAIT", str(FRESHNESS_READBACK_TIMEOUT)))
+
+PERCENTILES = (50, 90, 99)
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS samples (
+    run_started_at TEXT NOT NULL,
+    item_id TEXT NOT NULL,
+    item_type TEXT,
+    updated_at REAL,
+    acked_at REAL NOT NULL,
+    read_back_at REAL
+);
+CREATE INDEX IF NOT EXISTS samples_by_run ON samples (run_started_at);
+"""
+
+
+def parse_timestamp(value: Optional[str]) -> Optional[float]:
+    """lastModifiedDateTime → epoch 秒；沒有時區的值與 to_iso_string 相同視為 UTC"""
+    if not value:
+        return None
+    try:
+        dt = datetime.fromisoformat(value.replace("Z", "+00:00"))
+    except ValueError:
+        return None
+    if dt.tzinfo is None:
+        dt = dt.replace(tzinfo=timezone.utc)
+    return dt.timestamp()
+
+
+def percentile(values: List[float], p: float) -> float:
+    ordered = sorted(values)
+    index = min(len(ordered) - 1, max(0, round(p / 100 * (len(ordered) - 1))))
+    return ordered[index]
+
+
+class FreshnessTracker:
+    def __init__(self, token: str, connection_id: Optional[str] = None,
+                 sample_rate: float = FRESHNESS_SAMPLE_RATE, max_samples: int = FRESHNESS_MAX_SAMPLES):
+        import data_sync
+
+        self.token = token
+        self.connection_id = connection_id or data_sync.CONNECTION_ID
+        self.sample_rate = sample_rate
+        self.max_samples = max_samples
+        self.started_at = datetime.now(timezone.utc).isoformat()
+        # item_id -> [itemType, updated_at, lastModifiedDateTime 原文, acked_at, read_back_at]
+        self.items: Dict[str, List] = {}
+        self._readbacks: List[Future] = []
+        self._pool = ThreadPoolExecutor(max_workers=max(1, FRESHNESS_CONCURRENCY))
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+
+    # ============================================
+    # 上傳端的掛勾
+    # ============================================
+    def watch(self, pairs: Iterable[Tuple[str, bytes]]) -> Iterator[Tuple[str, bytes]]:
+        """包裝上傳用的 (item_id, bytes) 串流，記下各項目的 itemType 與 lastModifiedDateTime"""
+        for item_id, body in pairs:
+            props = json.loads(body).get("properties", {})
+            modified = props.get("lastModifiedDateTime")
+            with self._lock:
+                self.items[item_id] = [props.get("itemType"), parse_timestamp(modified), modified, None, None]
+            yield item_id, body
+
+    def ack(self, method: str, item_id: str):
+        """上傳成功時呼叫（GraphBatchClient 的 on_success 或逐筆上傳）"""
+        if method != "PUT":
+            return
+        now = time.time()
+        with self._lock:
+            entry = self.items.get(item_id)
+            if entry is None:
+                return
+            entry[3] = now
+            sampled = (len(self._readbacks) < self.max_samples and entry[1] is not None
+                       and random.random() < self.sample_rate)
+            if sampled:
+                self._readbacks.append(self._pool.submit(self._read_back, item_id, entry[1],
+                                                         now + FRESHNESS_READBACK_TIMEOUT))
+
+    # ============================================
+    # 抽樣讀回
+    # ============================================
+    def _read_back(self, item_id: str, modified: float, deadline: float):
+        """
+        輪詢直到讀回的 lastModifiedDateTime ≥ 這次上傳的時間；
+        Graph 回傳的格式（小數位數、Z 或 +00:00）可能與上傳的不同，因此比較時間而非字串，
+        之後的同步已寫入更新的版本時也算可讀回
+        """
+        import data_sync
+
+        url = f"{data_sync.GRAPH_API_BASE}/external/connections/{self.connection_id}/items/{item_id}"
+        headers = {"Authorization": f"Bearer {self.token}"}
+        while time.time() < deadline and not self._stop.is_set():
+            try:
+                response = data_sync.get_http_session().get(url, headers=headers)
+                if response.ok:
+                    props = response.json().get("properties", {})
+                    # 舊版本的項目也會回傳 200，需等到內容不早於這次上傳的版本
+                    read = parse_timestamp(props.get("lastModifiedDateTime"))
+                    if read is not None and read >= modified:
+                        with self._lock:
+                            self.items[item_id][4] = time.time()
+                        return
+            except Exception:
+                pass
+            self._stop.wait(FRESHNESS_POLL_INTERVAL)
+
+    def finish(self) -> Dict:
+        """等待讀回結束、寫入樣本並回傳各 itemType 的延遲統計"""
+        if self._readbacks:
+            print(f"\n⏱️ 等待 {len(self._readbacks)} 個抽樣項目可讀回（最多 {_format_seconds(FRESHNESS_MAX_WAIT)}）...")
+        _, pending = wait(self._readbacks, timeout=FRESHNESS_MAX_WAIT)
+        # 超過總等待時間：停止輪詢中的讀回，尚未開始的不再執行，未讀回的樣本視為逾時
+        self._stop.set()
+        self._pool.shutdown(cancel_futures=True)
+        if pending:
+            print(f"   ⚠️ {len(pending)} 個抽樣項目在時限內未能讀回")
+        self.save()
+        return summarize(self.items.values())
+
+    def save(self, path: str = FRESHNESS_PATH):
+        rows = [(self.started_at, item_id, e[0], e[1], e[3], e[4])
+                for item_id, e in self.items.items() if e[3] is not None]
+        conn = sqlite3.connect(path)
+        try:
+            conn.executescript(_SCHEMA)
+            with conn:
+                conn.executemany("INSERT INTO samples VALUES (?, ?, ?, ?, ?, ?)", rows)
+        finally:
+            conn.close()
+
+
+# ============================================
+# 統計
+# ============================================
+def summarize(entries: Iterable) -> Dict:
+    """
+    entries 為 (itemType, updated_at, _, acked_at, read_back_at)；
+    回傳 itemType -> {"ack": [...], "read_back": [...], "ack_to_read_back": [...], "items", "sampled", "timed_out"}
+    """
+    by_type: Dict[str, Dict] = {}
+    for item_type, updated_at, _, acked_at, read_back_at in entries:
+        if acked_at is None:
+            continue
+        stats = by_type.setdefault(item_type or "unknown", {
+            "items": 0, "ack": [], "read_back": [], "ack_to_read_back": [],
+        })
+        stats["items"] += 1
+        if updated_at is not None:
+            stats["ack"].append(acked_at - updated_at)
+            if read_back_at is not None:
+                stats["read_back"].append(read_back_at - updated_at)
+        if read_back_at is not None:
+            stats["ack_to_read_back"].append(read_back_at - acked_at)
+    return by_type
+
+
+def _format_seconds(seconds: float) -> str:
+    if abs(seconds) >= 3600:
+        return f"{seconds / 3600:.1f}h"
+    if abs(seconds) >= 60:
+        return f"{seconds / 60:.1f}m"
+    return f"{seconds:.1f}s"
+
+
+def print_report(by_type: Dict):
+    print("\n⏱️ 新鮮度延遲（資料列 updated_at → ack / 可讀回）")
+    header = "  ".join(f"p{p:<6}" for p in PERCENTILES)
+    print(f"   {'itemType':<11}{'指標':<18}{'筆數':>7}  {header} max")
+    for item_type, stats in sorted(by_type.items()):
+        for label, key in (("變更 → ack", "ack"), ("變更 → 可讀回", "read_back"), ("ack → 可讀回", "ack_to_read_back")):
+            values = stats[key]
+            if not values:
+                continue
+            cells = "  ".join(f"{_format_seconds(percentile(values, p)):<7}" for p in PERCENTILES)
+            print(f"   {item_type:<11}{label:<18}{len(values):>7}  {cells} {_format_seconds(max(values))}")
+
+
+def load_samples(path: str = FRESHNESS_PATH, runs: int = 1) -> List[Tuple]:
+    conn = sqlite3.connect(path)
+    try:
+        conn.executescript(_SCHEMA)
+        started = [r[0] for r in conn.execute(
+            "SELECT DISTINCT run_started_at FROM samples ORDER BY run_started_at DESC LIMIT ?", (runs,))]
+        if not started:
+            return []
+        return list(conn.execute(
+            f"SELECT item_type, updated_at, NULL, acked_at, read_back_at FROM samples "
+            f"WHERE run_started_at IN ({','.join('?' * len(started))})", started))
+    finally:
+        conn.close()
+
+
+# ============================================
+# 執行（freshness 子命令）
+# ============================================
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="freshness.py", description="檢視先前量測的新鮮度延遲百分位數")
+    parser.add_argument("--runs", type=int, default=1, help="合併最近幾次量測")
+    parser.add_argument("--path", default=FRESHNESS_PATH, help="樣本檔路徑")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.path):
+        print(f"尚無量測資料：{args.path}（同步時加上 --freshness）")
+        return 0
+    samples = load_samples(args.path, args.runs)
+    if not samples:
+        print("尚無量測資料")
+        return 0
+    print_report(summarize(samples))
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
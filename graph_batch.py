@@ -0,0 +1,219 @@
+"""
+Microsoft Graph JSON $batch 上傳
+將 External Item 的 PUT / DELETE 打包成每批最多 20 個子請求，
+依子請求狀態對應回項目 id，只重試失敗（429 / 5xx）的子請求
+Token 可傳入字串或取得 Token 的函式；傳入函式時每批重新讀取，收到 401 會換新 Token 重送一次
+"""
+import json
+import os
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple, Union
+
+import profiling
+
+# Graph $batch 每批上限為 20 個子請求
+MAX_BATCH_SIZE = 20
+BATCH_SIZE = min(MAX_BATCH_SIZE, int(os.environ.get("GRAPH_BATCH_SIZE", "20")))
+BATCH_CONCURRENCY = int(os.environ.get("GRAPH_BATCH_CONCURRENCY", "4"))
+MAX_RETRIES = int(os.environ.get("GRAPH_BATCH_MAX_RETRIES", "5"))
+
+RETRYABLE_STATUS = {429, 500, 502, 503, 504}
+
+# (method, item_id, body)；DELETE 的 body 為 None
+Operation = Tuple[str, str, Optional[bytes]]
+# 固定的 Token，或每次呼叫回傳目前有效 Token 的函式（例如 data_sync.get_access_token）
+TokenSource = Union[str, Callable[[], str]]
+
+
+def resolve_token(token: TokenSource) -> str:
+    return token() if callable(token) else token
+
+
+class GraphBatchClient:
+    def __init__(self, token: TokenSource, connection_id: Optional[str] = None,
+                 batch_size: int = BATCH_SIZE, concurrency: int = BATCH_CONCURRENCY,
+                 max_retries: int = MAX_RETRIES,
+                 on_success: Optional[Callable[[str, str], None]] = None):
+        """on_success(method, item_id) 於每個子請求成功時呼叫（例如新鮮度追蹤）"""
+        from data_sync import CONNECTION_ID, GRAPH_API_BASE
+
+        self._token = token
+        self.connection_id = connection_id or CONNECTION_ID
+        self.batch_url = f"{GRAPH_API_BASE}/$batch"
+        self.batch_size = max(1, min(MAX_BATCH_SIZE, batch_size))
+        self.concurrency = max(1, concurrency)
+        self.max_retries = max_retries
+        self.on_success = on_success
+        self.stats = {"batches": 0, "sub_requests": 0, "retried": 0, "throttled": 0}
+        self._lock = threading.Lock()
+
+    # ============================================
+    # 對外介面
+    # ============================================
+    def upsert_many(self, items: Iterable[Tuple[str, bytes]], results: Dict):
+        """items 為 (item_id, 已序列化的 JSON bytes)"""
+        self._run((("PUT", item_id, body) for item_id, body in items), results)
+
+    def delete_many(self, item_ids: Iterable[str], results: Dict):
+        self._run((("DELETE", item_id, None) for item_id in item_ids), results)
+
+    # ============================================
+    # 批次處理
+    # ============================================
+    def _run(self, operations: Iterable[Operation], results: Dict):
+        with ThreadPoolExecutor(max_workers=self.concurrency) as pool:
+            pending = set()
+            for batch in _chunked(operations, self.batch_size):
+                if len(pending) >= self.concurrency * 2:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        future.result()
+                pending.add(pool.submit(self._send_with_retry, batch, results))
+            for future in pending:
+                future.result()
+
+    def _send_with_retry(self, batch: List[Operation], results: Dict):
+        remaining = batch
+        for attempt in range(self.max_retries + 1):
+            retry, wait_seconds = self._send(remaining, results, final=attempt == self.max_retries)
+            if not retry:
+                return
+            with self._lock:
+                self.stats["retried"] += len(retry)
+            time.sleep(max(wait_seconds, min(2 ** attempt, 30)))
+            remaining = retry
+
+    def _send(self, batch: List[Operation], results: Dict, final: bool) -> Tuple[List[Operation], float]:
+        """送出一批，回傳（需重試的子請求, 建議等待秒數）"""
+        from data_sync import get_http_session
+
+        with self._lock:
+            self.stats["batches"] += 1
+            self.stats["sub_requests"] += len(batch)
+
+        try:
+            body = self._envelope(batch)
+            with profiling.stage("upload"):
+                token = self.token
+                response = get_http_session().post(self.batch_url, headers=self._headers(token), data=body)
+                if response.status_code == 401 and callable(self._token):
+                    # Token 在長時間上傳中過期或被撤銷：作廢後取得新的 Token 重送一次
+                    from data_sync import expire_access_token
+
+                    expire_access_token(token)
+                    response = get_http_session().post(self.batch_url, headers=self._headers(self.token), data=body)
+        except Exception as e:
+            if final:
+                self._record(batch, results, [f"連線錯誤: {e}"] * len(batch))
+                return [], 0
+            return batch, 0
+
+        # 整批被節流或伺服器錯誤：全部重試
+        if response.status_code in RETRYABLE_STATUS:
+            if response.status_code == 429:
+                with self._lock:
+                    self.stats["throttled"] += len(batch)
+            if final:
+                self._record(batch, results, [f"HTTP {response.status_code}"] * len(batch))
+                return [], 0
+            return batch, _retry_after(response.headers)
+        if not response.ok:
+            self._record(batch, results, [f"HTTP {response.status_code}: {response.text[:200]}"] * len(batch))
+            return [], 0
+
+        try:
+            by_id = {r["id"]: r for r in response.json().get("responses", [])}
+        except (ValueError, AttributeError, KeyError, TypeError) as e:
+            # 代理伺服器回傳截斷或 HTML 的內容：與連線錯誤相同，整批重試
+            if final:
+                self._record(batch, results, [f"無法解析批次回應: {e}"] * len(batch))
+                return [], 0
+            return batch, 0
+        retry: List[Operation] = []
+        wait_seconds = 0.0
+        outcomes: List[Optional[str]] = []
+        for index, op in enumerate(batch):
+            sub = by_id.get(str(index))
+            status = sub.get("status", 0) if sub else 0
+            if 200 <= status < 300 or (op[0] == "DELETE" and status == 404):
+                outcomes.append(None)
+            elif (status in RETRYABLE_STATUS or sub is None) and not final:
+                if status == 429:
+                    with self._lock:
+                        self.stats["throttled"] += 1
+                retry.append(op)
+                outcomes.append("retry")
+                wait_seconds = max(wait_seconds, _retry_after((sub or {}).get("headers") or {}))
+            else:
+                outcomes.append(f"{status}: {_error_message(sub)}")
+
+        done = [(op, outcome) for op, outcome in zip(batch, outcomes) if outcome != "retry"]
+        self._record([op for op, _ in done], results, [outcome for _, outcome in done])
+        return retry, wait_seconds
+
+    @property
+    def token(self) -> str:
+        return resolve_token(self._token)
+
+    @staticmethod
+    def _headers(token: str) -> Dict[str, str]:
+        return {
+            "Authorization": f"Bearer {token}",
+            "Content-Type": "application/json; charset=utf-8",
+        }
+
+    def _envelope(self, batch: List[Operation]) -> bytes:
+        """直接拼接已序列化的 body，避免重新解析 JSON"""
+        parts = []
+        for index, (method, item_id, body) in enumerate(batch):
+            url = f"/external/connections/{self.connection_id}/items/{item_id}"
+            head = f'{{"id":"{index}","method":"{method}","url":{json.dumps(url)}'.encode("utf-8")
+            if body is None:
+                parts.append(head + b"}")
+            else:
+                parts.append(head + b',"headers":{"Content-Type":"application/json"},"body":' + body + b"}")
+        return b'{"requests":[' + b",".join(parts) + b"]}"
+
+    def _record(self, batch: List[Operation], results: Dict, errors: List[Optional[str]]):
+        with self._lock:
+            for (method, item_id, _), error in zip(batch, errors):
+                if error is None:
+                    results["success"] += 1
+                    if self.on_success is not None:
+                        self.on_success(method, item_id)
+                else:
+                    results["failed"] += 1
+                    results["errors"].append(item_id)
+                    print(f"   ❌ {method} 失敗 {item_id}: {error}")
+
+
+def _chunked(operations: Iterable[Operation], size: int) -> Iterator[List[Operation]]:
+    batch: List[Operation] = []
+    for op in operations:
+        batch.append(op)
+        if len(batch) >= size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def _retry_after(headers) -> float:
+    for key, value in headers.items():
+        if key.lower() == "retry-after":
+            try:
+                return float(value)
+            except (TypeError, ValueError):
+                return 0.0
+    return 0.0
+
+
+def _error_message(sub: Optional[Dict]) -> str:
+    if not sub:
+        return "批次回應中缺少此子請求"
+    body = sub.get("body")
+    if isinstance(body, dict):
+        return (body.get("error") or {}).get("message", "")
+    return str(body)[:200]
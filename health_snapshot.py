@@ -0,0 +1,172 @@
+"""
+多 Connection 健康快照
+列出所有 External Connections 後，並行查詢各 Connection 的 Schema 與 Operation 狀態，
+結果快取一小段時間，輸出一份精簡的 JSON 供監控抓取
+
+用法：python health_snapshot.py [--ttl 秒數] [--no-cache] [--pretty]
+"""
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
+from typing import Dict, List, Optional, Tuple
+
+HEALTH_CACHE_PATH = os.environ.get("HEALTH_CACHE_PATH", ".health_cache.json")
+HEALTH_CACHE_TTL = int(os.environ.get("HEALTH_CACHE_TTL", "30"))
+HEALTH_CONCURRENCY = int(os.environ.get("HEALTH_CONCURRENCY", "8"))
+HEALTH_TIMEOUT = int(os.environ.get("HEALTH_TIMEOUT", "10"))
+
+
+# ============================================
+# Graph 查詢
+# ============================================
+def _get(token: str, url: str) -> Tuple[Optional[Dict], Optional[str]]:
+    """回傳 (JSON, 錯誤)；404 視為沒有資料"""
+    import data_sync
+
+    try:
+        response = data_sync.get_http_session().get(
+            url, headers={"Authorization": f"Bearer {token}"}, timeout=HEALTH_TIMEOUT
+        )
+    except Exception as e:
+        return None, f"{type(e).__name__}: {e}"
+    if response.status_code == 404:
+        return None, None
+    if not response.ok:
+        return None, f"HTTP {response.status_code}"
+    return response.json(), None
+
+
+def _schema_summary(data: Optional[Dict]) -> Optional[Dict]:
+    if data is None:
+        return None
+    return {"properties": len(data.get("properties", []))}
+
+
+def _operations_summary(data: Optional[Dict]) -> Optional[Dict]:
+    if data is None:
+        return None
+    operations = data.get("value", [])
+    counts: Dict[str, int] = {}
+    for op in operations:
+        status = op.get("status", "unknown")
+        counts[status] = counts.get(status, 0) + 1
+    summary = {"total": len(operations), "by_status": counts}
+    if operations:
+        latest = operations[-1]
+        summary["latest"] = {"id": latest.get("id"), "status": latest.get("status")}
+        error = latest.get("error")
+        if isinstance(error, dict) and error.get("message"):
+            summary["latest"]["error"] = error["message"]
+    return summary
+
+
+def _connection_status(entry: Dict) -> str:
+    if entry["errors"]:
+        return "error"
+    if entry["state"] != "ready" or entry["schema"] is None:
+        return "degraded"
+    latest = (entry["operations"] or {}).get("latest")
+    if latest and latest.get("status") == "failed":
+        return "degraded"
+    return "ok"
+
+
+def collect_snapshot(token: str, concurrency: int = HEALTH_CONCURRENCY) -> Dict:
+    import data_sync
+
+    started = time.perf_counter()
+    base = f"{data_sync.GRAPH_API_BASE}/external/connections"
+    listing, error = _get(token, base)
+    snapshot = {
+        "generated_at": datetime.now(timezone.utc).isoformat(),
+        "active_connection": data_sync.resolve_connection_id(),
+        "connections": [],
+    }
+    if error or listing is None:
+        snapshot["status"] = "error"
+        snapshot["error"] = error or "無法列出 Connections"
+        snapshot["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+        return snapshot
+
+    connections = listing.get("value", [])
+    # 每個 Connection 的 schema 與 operations 查詢全部一起並行
+    calls = [(c["id"], kind, f"{base}/{c['id']}/{kind}")
+             for c in connections for kind in ("schema", "operations")]
+    with ThreadPoolExecutor(max_workers=max(1, concurrency)) as pool:
+        responses = list(pool.map(lambda call: _get(token, call[2]), calls))
+    by_call = {(cid, kind): response for (cid, kind, _), response in zip(calls, responses)}
+
+    entries: List[Dict] = []
+    for c in connections:
+        schema, schema_error = by_call[(c["id"], "schema")]
+        operations, operations_error = by_call[(c["id"], "operations")]
+        entry = {
+            "id": c["id"],
+            "name": c.get("name"),
+            "state": c.get("state"),
+            "schema": _schema_summary(schema),
+            "operations": _operations_summary(operations),
+            "errors": [f"{kind}: {e}" for kind, e in (("schema", schema_error), ("operations", operations_error)) if e],
+        }
+        entry["status"] = _connection_status(entry)
+        entries.append(entry)
+
+    snapshot["connections"] = entries
+    statuses = {e["status"] for e in entries}
+    active = next((e for e in entries if e["id"] == snapshot["active_connection"]), None)
+    if active is None:
+        snapshot["status"] = "error"
+        snapshot["error"] = f"找不到使用中的 Connection：{snapshot['active_connection']}"
+    elif "error" in statuses or "degraded" in statuses:
+        snapshot["status"] = "degraded"
+    else:
+        snapshot["status"] = "ok"
+    snapshot["elapsed_ms"] = round((time.perf_counter() - started) * 1000)
+    return snapshot
+
+
+# ============================================
+# 快取
+# ============================================
+def get_snapshot(ttl: int = HEALTH_CACHE_TTL, path: str = HEALTH_CACHE_PATH) -> Dict:
+    """快取未過期時直接回傳（標示 cached 與 age_seconds），否則重新查詢並寫回"""
+    import sync_state
+
+    if ttl > 0:
+        cached = sync_state.load_state(path)
+        age = time.time() - cached.get("fetched_at", 0)
+        if "snapshot" in cached and 0 <= age < ttl:
+            return {**cached["snapshot"], "cached": True, "age_seconds": round(age, 1)}
+
+    import data_sync
+
+    snapshot = collect_snapshot(data_sync.get_access_token())
+    if ttl > 0:
+        sync_state.save_state({"fetched_at": time.time(), "snapshot": snapshot}, path)
+    return {**snapshot, "cached": False, "age_seconds": 0}
+
+
+# ============================================
+# 執行
+# ============================================
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="health_snapshot.py", description="所有 Connections 的健康快照（JSON）")
+    parser.add_argument("--ttl", type=int, default=HEALTH_CACHE_TTL, help="快取秒數（0 表示不快取）")
+    parser.add_argument("--no-cache", action="store_true", help="忽略並且不寫入快取")
+    parser.add_argument("--pretty", action="store_true", help="縮排輸出")
+    args = parser.parse_args(argv)
+
+    snapshot = get_snapshot(0 if args.no_cache else args.ttl)
+    if args.pretty:
+        print(json.dumps(snapshot, indent=2, ensure_ascii=False))
+    else:
+        print(json.dumps(snapshot, ensure_ascii=False, separators=(",", ":")))
+    return 0 if snapshot["status"] == "ok" else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
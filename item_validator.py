@@ -0,0 +1,136 @@
+"""
+上傳前的 External Item 驗證
+由 schema_register.SCHEMA 預先編譯出各屬性的檢查函式，
+不符合 Schema 的項目不送出，改寫入 dead letter 並附上明確原因
+"""
+import math
+import os
+import re
+from typing import Callable, Dict, Optional
+
+from schema_register import OPTIONAL_PROPERTIES, SCHEMA
+
+MAX_STRING_LENGTH = int(os.environ.get("VALIDATOR_MAX_STRING_LENGTH", "32000"))
+MAX_ITEM_ID_LENGTH = 128
+INT64_MIN, INT64_MAX = -(2 ** 63), 2 ** 63 - 1
+
+_DATETIME_RE = re.compile(
+    r"^\d{4}-\d{2}-\d{2}T\d{2}:\d{2}(:\d{2}(\.\d{1,7})?)?(Z|[+-]\d{2}:\d{2})$"
+)
+
+# 回傳 None 代表通過，否則為錯誤原因
+Checker = Callable[[object], Optional[str]]
+
+
+# ============================================
+# 各型別檢查
+# ============================================
+def _type_name(value) -> str:
+    return "null" if value is None else type(value).__name__
+
+
+def _make_string_checker(max_length: int) -> Checker:
+    def check(value):
+        if type(value) is not str:
+            return f"預期 String，得到 {_type_name(value)}"
+        if len(value) > max_length:
+            return f"長度 {len(value)} 超過上限 {max_length}"
+        return None
+    return check
+
+
+def _check_int64(value):
+    if type(value) is not int:
+        return f"預期 Int64，得到 {_type_name(value)}"
+    if not INT64_MIN <= value <= INT64_MAX:
+        return f"超出 Int64 範圍：{value}"
+    return None
+
+
+def _check_double(value):
+    if type(value) not in (int, float):
+        return f"預期 Double，得到 {_type_name(value)}"
+    if not math.isfinite(value):
+        return f"Double 不可為 {value}"
+    return None
+
+
+def _check_boolean(value):
+    if type(value) is not bool:
+        return f"預期 Boolean，得到 {_type_name(value)}"
+    return None
+
+
+def _check_datetime(value):
+    if type(value) is not str:
+        return f"預期 DateTime 字串，得到 {_type_name(value)}"
+    if not _DATETIME_RE.match(value):
+        return f"不是含時區的 ISO 8601 DateTime：{value[:40]!r}"
+    return None
+
+
+def _make_collection_checker(max_length: int) -> Checker:
+    def check(value):
+        if type(value) is not list:
+            return f"預期 StringCollection，得到 {_type_name(value)}"
+        for index, element in enumerate(value):
+            if type(element) is not str:
+                return f"第 {index} 個元素預期 String，得到 {_type_name(element)}"
+            if len(element) > max_length:
+                return f"第 {index} 個元素長度 {len(element)} 超過上限 {max_length}"
+        return None
+    return check
+
+
+# ============================================
+# 編譯驗證器
+# ============================================
+def compile_validator(schema: Dict = SCHEMA, max_string_length: int = MAX_STRING_LENGTH) -> Callable[[Dict], Optional[str]]:
+    """依 Schema 建立 validate(item)，回傳 None 代表通過，否則為第一個錯誤的原因"""
+    by_type = {
+        "String": _make_string_checker(max_string_length),
+        "Int64": _check_int64,
+        "Double": _check_double,
+        "Boolean": _check_boolean,
+        "DateTime": _check_datetime,
+        "StringCollection": _make_collection_checker(max_string_length),
+    }
+    checkers: Dict[str, Checker] = {}
+    for prop in schema["properties"]:
+        if prop["type"] not in by_type:
+            raise ValueError(f"不支援的 Schema 型別：{prop['name']} ({prop['type']})")
+        checkers[prop["name"]] = by_type[prop["type"]]
+
+    def validate(item: Dict) -> Optional[str]:
+        item_id = item.get("id")
+        if type(item_id) is not str or not item_id:
+            return "id 必須是非空字串"
+        if len(item_id) > MAX_ITEM_ID_LENGTH:
+            return f"id 長度 {len(item_id)} 超過上限 {MAX_ITEM_ID_LENGTH}"
+
+        for name, value in item.get("properties", {}).items():
+            checker = checkers.get(name)
+            if checker is None:
+                return f"{name}: 不在 Schema 中"
+            if value is None:
+                # 選填屬性沒有值時應省略（見 data_sync.omit_empty_optional），不送出 null
+                if name in OPTIONAL_PROPERTIES:
+                    return f"{name}: 選填屬性沒有值時應省略，不可為 null"
+                return f"{name}: 必要屬性不可為 null"
+            error = checker(value)
+            if error is not None:
+                return f"{name}: {error}"
+
+        content = item.get("content")
+        if content is not None and type(content.get("value")) is not str:
+            return f"content.value: 預期 String，得到 {_type_name(content.get('value'))}"
+
+        acl = item.get("acl")
+        if not acl:
+            return "acl 不可為空"
+        for entry in acl:
+            if not entry.get("type") or not entry.get("value") or entry.get("accessType") not in ("grant", "deny"):
+                return f"acl 項目格式錯誤：{entry}"
+        return None
+
+    return validate
@@ -0,0 +1,237 @@
+"""
+本機 SQLite 全文檢索鏡像
+記錄每個成功上傳到 Graph 的項目（屬性、內容、ACL 與內容雜湊），
+可在本機以 FTS5 於毫秒內查詢 Copilot 將看到的資料，也作為比對差異與清單的快速查詢來源
+
+上傳前先暫存到 TEMP 資料表，上傳結束後排除失敗的項目再一次合併，
+中途中斷時鏡像不會記錄沒有送達的內容
+"""
+import hashlib
+import json
+import os
+import sqlite3
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+LOCAL_MIRROR_PATH = os.environ.get("LOCAL_MIRROR_PATH", "")
+# trigram 斷詞可直接比對中文子字串，但查詢詞至少需 3 個字元，較短的詞改用 LIKE
+MIN_MATCH_LENGTH = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS items (
+    id TEXT PRIMARY KEY,
+    item_type TEXT,
+    hash TEXT NOT NULL,
+    properties TEXT NOT NULL,
+    content TEXT,
+    acl TEXT,
+    pushed_at TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS items_by_type ON items (item_type);
+CREATE VIRTUAL TABLE IF NOT EXISTS items_fts USING fts5(
+    id UNINDEXED, item_type UNINDEXED, title, project, body, tokenize = 'trigram'
+);
+"""
+
+
+def body_hash(body: bytes) -> str:
+    return hashlib.sha256(body).hexdigest()
+
+
+class LocalMirror:
+    def __init__(self, path: str):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SCHEMA)
+        self.conn.execute(
+            "CREATE TEMP TABLE IF NOT EXISTS staged ("
+            "id TEXT PRIMARY KEY, item_type TEXT, hash TEXT, properties TEXT, content TEXT, acl TEXT, "
+            "title TEXT, project TEXT, body TEXT)"
+        )
+        self.staged = 0
+
+    def close(self):
+        self.conn.close()
+
+    # ============================================
+    # 寫入
+    # ============================================
+    def staging(self, items: Iterable[Tuple[str, bytes]]) -> Iterator[Tuple[str, bytes]]:
+        """包裝上傳用的 (item_id, bytes) 串流，經過的項目同時暫存"""
+        for item_id, body in items:
+            self.stage(item_id, body)
+            yield item_id, body
+
+    def stage(self, item_id: str, body: bytes):
+        item = json.loads(body)
+        props = item.get("properties", {})
+        content = (item.get("content") or {}).get("value")
+        project = " ".join(str(props.get(k) or "") for k in ("projectName", "projectCode")).strip()
+        self.conn.execute(
+            "INSERT OR REPLACE INTO staged VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)",
+            (item_id, props.get("itemType"), body_hash(body),
+             json.dumps(props, ensure_ascii=False), content,
+             json.dumps(item.get("acl"), ensure_ascii=False),
+             props.get("title") or "", project,
+             "\n".join(s for s in (props.get("description"), content) if s)),
+        )
+        self.staged += 1
+
+    def commit_staged(self, failed: Iterable[str] = (), replace_all: bool = False) -> int:
+        """
+        合併暫存的項目（排除上傳失敗的 id），回傳合併筆數
+        replace_all 用於重建索引：鏡像改為只包含這次上傳的內容
+        """
+        now = datetime.now(timezone.utc).isoformat()
+        with self.conn:
+            self.conn.executemany("DELETE FROM staged WHERE id = ?", ((i,) for i in failed))
+            if replace_all:
+                self.conn.execute("DELETE FROM items")
+                self.conn.execute("DELETE FROM items_fts")
+            else:
+                self.conn.execute("DELETE FROM items_fts WHERE id IN (SELECT id FROM staged)")
+            self.conn.execute(
+                "INSERT OR REPLACE INTO items SELECT id, item_type, hash, properties, content, acl, ? FROM staged",
+                (now,),
+            )
+            self.conn.execute(
+                "INSERT INTO items_fts SELECT id, item_type, title, project, body FROM staged"
+            )
+            merged = self.conn.execute("SELECT count(*) FROM staged").fetchone()[0]
+            self.conn.execute("DELETE FROM staged")
+        self.staged = 0
+        return merged
+
+    def discard_staged(self):
+        with self.conn:
+            self.conn.execute("DELETE FROM staged")
+        self.staged = 0
+
+    def remove(self, item_ids: Iterable[str]):
+        """記錄已從 Connection 刪除的項目"""
+        with self.conn:
+            for item_id in item_ids:
+                self.conn.execute("DELETE FROM items WHERE id = ?", (item_id,))
+                self.conn.execute("DELETE FROM items_fts WHERE id = ?", (item_id,))
+
+    # ============================================
+    # 查詢
+    # ============================================
+    def search(self, query: str, item_type: Optional[str] = None, limit: int = 20) -> List[Dict]:
+        """
+        空白分隔的詞全部需要出現（AND）；以 bm25 排序，
+        title 權重最高，其次專案名稱/代碼
+        """
+        match_terms, like_terms = [], []
+        for term in query.split():
+            (match_terms if len(term) >= MIN_MATCH_LENGTH else like_terms).append(term)
+
+        where, params = [], []
+        if match_terms:
+            where.append("items_fts MATCH ?")
+            params.append(" AND ".join('"' + t.replace('"', '""') + '"' for t in match_terms))
+        for term in like_terms:
+            where.append("(title LIKE ? OR project LIKE ? OR body LIKE ?)")
+            params.extend([f"%{term}%"] * 3)
+        if item_type:
+            where.append("item_type = ?")
+            params.append(item_type)
+
+        if match_terms:
+            select = "snippet(items_fts, 4, '[', ']', '…', 16) AS snippet"
+            order = "bm25(items_fts, 0, 0, 10.0, 5.0, 1.0)"
+        else:
+            select = "substr(body, 1, 80) AS snippet"
+            order = "id"
+        sql = (f"SELECT id, item_type, title, project, {select} FROM items_fts"
+               + (" WHERE " + " AND ".join(where) if where else "")
+               + f" ORDER BY {order} LIMIT ?")
+        params.append(limit)
+        columns = ("id", "item_type", "title", "project", "snippet")
+        return [dict(zip(columns, row)) for row in self.conn.execute(sql, params)]
+
+    def get(self, item_id: str) -> Optional[Dict]:
+        row = self.conn.execute(
+            "SELECT id, item_type, hash, properties, content, acl, pushed_at FROM items WHERE id = ?",
+            (item_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        return {
+            "id": row[0], "item_type": row[1], "hash": row[2],
+            "properties": json.loads(row[3]), "content": row[4],
+            "acl": json.loads(row[5]) if row[5] else None, "pushed_at": row[6],
+        }
+
+    def hashes(self, item_type: Optional[str] = None) -> Dict[str, str]:
+        """id -> 已上傳內容的 sha256，供比對差異"""
+        if item_type:
+            rows = self.conn.execute("SELECT id, hash FROM items WHERE item_type = ?", (item_type,))
+        else:
+            rows = self.conn.execute("SELECT id, hash FROM items")
+        return dict(rows)
+
+    def ids(self, item_type: Optional[str] = None) -> List[str]:
+        if item_type:
+            rows = self.conn.execute("SELECT id FROM items WHERE item_type = ? ORDER BY id", (item_type,))
+        else:
+            rows = self.conn.execute("SELECT id FROM items ORDER BY id")
+        return [row[0] for row in rows]
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT item_type, count(*) FROM items GROUP BY item_type ORDER BY item_type"))
+
+
+# ============================================
+# 執行（query 子命令）
+# ============================================
+def main(argv=None):
+    import argparse
+    import time
+
+    parser = argparse.ArgumentParser(prog="local_mirror.py", description="查詢本機鏡像的已上傳項目")
+    parser.add_argument("query", nargs="?", help="搜尋字詞（空白分隔，全部需符合）")
+    parser.add_argument("--type", dest="item_type", help="只搜尋指定 itemType（project / milestone / risk / issue）")
+    parser.add_argument("--limit", type=int, default=20)
+    parser.add_argument("--id", dest="item_id", help="顯示單一項目的完整內容")
+    parser.add_argument("--stats", action="store_true", help="各 itemType 的項目數")
+    parser.add_argument("--mirror", default=LOCAL_MIRROR_PATH or "mirror.db", help="鏡像檔路徑")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.mirror):
+        print(f"❌ 找不到鏡像檔：{args.mirror}（同步時加上 --mirror 或設定 LOCAL_MIRROR_PATH）")
+        return 1
+
+    mirror = LocalMirror(args.mirror)
+    try:
+        if args.stats:
+            for item_type, count in mirror.counts().items():
+                print(f"   {item_type or '(未知)':<12}{count:>10}")
+            return 0
+        if args.item_id:
+            item = mirror.get(args.item_id)
+            if item is None:
+                print(f"❌ 鏡像中沒有 {args.item_id}")
+                return 1
+            print(json.dumps(item, indent=2, ensure_ascii=False))
+            return 0
+        if not args.query:
+            parser.error("請提供搜尋字詞，或使用 --id / --stats")
+
+        started = time.perf_counter()
+        hits = mirror.search(args.query, args.item_type, args.limit)
+        elapsed = (time.perf_counter() - started) * 1000
+        for hit in hits:
+            print(f"{hit['id']:<24} [{hit['item_type']}] {hit['title']}")
+            if hit["project"]:
+                print(f"   專案：{hit['project']}")
+            if hit["snippet"]:
+                print(f"   {hit['snippet'].replace(chr(10), ' ')}")
+        print(f"\n🔍 {len(hits)} 筆結果（{elapsed:.1f} ms）")
+        return 0
+    finally:
+        mirror.close()
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,205 @@
+"""
+本機 Mock Graph API
+在 localhost 模擬 External Connection 的項目 PUT / GET / DELETE、分頁列出與 $batch，
+上傳後需經過一段可設定的索引延遲才能讀回新版本，並可模擬節流（429），
+供新鮮度量測、批次上傳與重試邏輯在沒有租用戶的環境下測試
+
+用法：python mock_graph.py [--port 8765]
+     GRAPH_API_BASE=http://127.0.0.1:8765/v1.0 GRAPH_ACCESS_TOKEN=mock python data_sync.py --freshness
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qsl, quote
+
+MOCK_PORT = int(os.environ.get("MOCK_GRAPH_PORT", "8765"))
+# 上傳後需經過 delay ± jitter 秒才能讀回新版本
+MOCK_INDEX_DELAY = float(os.environ.get("MOCK_INDEX_DELAY", "2"))
+MOCK_INDEX_JITTER = float(os.environ.get("MOCK_INDEX_JITTER", "1"))
+MOCK_THROTTLE_RATE = float(os.environ.get("MOCK_THROTTLE_RATE", "0"))
+
+_ITEM_PATH = re.compile(r"^/external/connections/([^/]+)/items/([^/?]+)$")
+_CONNECTION_PATH = re.compile(r"^/external/connections/([^/?]+)$")
+_ITEMS_PATH = re.compile(r"^/external/connections/([^/]+)/items$")
+
+
+class MockGraph:
+    def __init__(self, index_delay: float = MOCK_INDEX_DELAY, index_jitter: float = MOCK_INDEX_JITTER,
+                 throttle_rate: float = MOCK_THROTTLE_RATE):
+        self.index_delay = index_delay
+        self.index_jitter = index_jitter
+        self.throttle_rate = throttle_rate
+        # connection id -> item id -> [(可讀回的時間, 項目 JSON 或 None 表示已刪除)]
+        self.items: Dict[str, Dict[str, List[Tuple[float, Optional[Dict]]]]] = {}
+        self.stats = {"put": 0, "get": 0, "delete": 0, "batches": 0, "throttled": 0}
+        self._lock = threading.Lock()
+
+    def _visible_at(self) -> float:
+        return time.time() + max(0.0, self.index_delay + random.uniform(-self.index_jitter, self.index_jitter))
+
+    def _current(self, versions: List[Tuple[float, Optional[Dict]]]) -> Optional[Dict]:
+        now = time.time()
+        visible = [item for at, item in versions if at <= now]
+        # 只保留最後一個已可讀回的版本與尚未可讀回的版本
+        pending = [(at, item) for at, item in versions if at > now]
+        if visible:
+            versions[:] = [(0.0, visible[-1])] + pending
+            return visible[-1]
+        return None
+
+    # ============================================
+    # 單一請求
+    # ============================================
+    def list_items(self, connection_id: str, query: Dict[str, str], base_url: str) -> Dict:
+        """依 id 排序分頁；$skiptoken 為上一頁最後的 id，刪除項目不影響後續分頁"""
+        top = int(query.get("$top", "100"))
+        after = query.get("$skiptoken", "")
+        with self._lock:
+            items = self.items.get(connection_id, {})
+            ids = sorted(i for i in items if i > after and self._current(items[i]) is not None)
+        page = ids[:top]
+        data: Dict = {"value": [{"id": item_id} for item_id in page]}
+        if len(ids) > top:
+            data["@odata.nextLink"] = (f"{base_url}/external/connections/{connection_id}/items"
+                                       f"?$select=id&$top={top}&$skiptoken={quote(page[-1])}")
+        return data
+
+    def handle(self, method: str, path: str, body: Optional[Dict]) -> Tuple[int, Optional[Dict]]:
+        if self.throttle_rate and method != "GET" and random.random() < self.throttle_rate:
+            with self._lock:
+                self.stats["throttled"] += 1
+            return 429, {"error": {"code": "TooManyRequests", "message": "mock throttling"}}
+
+        match = _ITEM_PATH.match(path)
+        if match:
+            connection_id, item_id = match.groups()
+            with self._lock:
+                items = self.items.setdefault(connection_id, {})
+                if method == "PUT":
+                    self.stats["put"] += 1
+                    items.setdefault(item_id, []).append((self._visible_at(), body))
+                    return 200, None
+                if method == "DELETE":
+                    self.stats["delete"] += 1
+                    if item_id not in items:
+                        return 404, {"error": {"code": "ItemNotFound", "message": item_id}}
+                    items[item_id].append((self._visible_at(), None))
+                    return 204, None
+                if method == "GET":
+                    self.stats["get"] += 1
+                    item = self._current(items.get(item_id, []))
+                    if item is None:
+                        return 404, {"error": {"code": "ItemNotFound", "message": item_id}}
+                    return 200, {**item, "id": item_id}
+
+        if method == "GET" and path == "/external/connections":
+            with self._lock:
+                ids = sorted(self.items)
+            return 200, {"value": [{"id": cid, "name": cid, "state": "ready"} for cid in ids]}
+        match = _CONNECTION_PATH.match(path)
+        if method == "GET" and match:
+            return 200, {"id": match.group(1), "name": match.group(1), "state": "ready"}
+        return 404, {"error": {"code": "NotFound", "message": f"{method} {path}"}}
+
+    def handle_batch(self, envelope: Dict) -> Dict:
+        with self._lock:
+            self.stats["batches"] += 1
+        responses = []
+        for request in envelope.get("requests", []):
+            status, body = self.handle(request["method"], request["url"], request.get("body"))
+            response = {"id": request["id"], "status": status, "headers": {}}
+            if status == 429:
+                response["headers"]["Retry-After"] = "1"
+            if body is not None:
+                response["body"] = body
+            responses.append(response)
+        return {"responses": responses}
+
+
+def make_handler(graph: MockGraph):
+    class Handler(BaseHTTPRequestHandler):
+        def _respond(self, status: int, body: Optional[Dict]):
+            data = json.dumps(body, ensure_ascii=False).encode("utf-8") if body is not None else b""
+            self.send_response(status)
+            if body is not None:
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+            if status == 429:
+                self.send_header("Retry-After", "1")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def _dispatch(self, method: str):
+            path, _, query = self.path.partition("?")
+            if path.startswith("/v1.0"):
+                path = path[len("/v1.0"):]
+            length = int(self.headers.get("Content-Length") or 0)
+            body = json.loads(self.rfile.read(length)) if length else None
+            items_path = _ITEMS_PATH.match(path)
+            if method == "GET" and items_path:
+                base_url = f"http://{self.headers.get('Host')}/v1.0"
+                self._respond(200, graph.list_items(items_path.group(1), dict(parse_qsl(query)), base_url))
+            elif method == "POST" and path == "/$batch":
+                self._respond(200, graph.handle_batch(body or {}))
+            else:
+                self._respond(*graph.handle(method, path, body))
+
+        def do_GET(self):
+            self._dispatch("GET")
+
+        def do_PUT(self):
+            self._dispatch("PUT")
+
+        def do_DELETE(self):
+            self._dispatch("DELETE")
+
+        def do_POST(self):
+            self._dispatch("POST")
+
+        def log_message(self, format, *args):
+            pass
+
+    return Handler
+
+
+def serve(port: int = MOCK_PORT, graph: Optional[MockGraph] = None) -> ThreadingHTTPServer:
+    """在背景執行緒啟動並回傳伺服器（測試時可在同一程序內使用）"""
+    server = ThreadingHTTPServer(("127.0.0.1", port), make_handler(graph or MockGraph()))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+# ============================================
+# 執行（mock 子命令）
+# ============================================
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="mock_graph.py", description="本機 Mock Graph API")
+    parser.add_argument("--port", type=int, default=MOCK_PORT)
+    parser.add_argument("--index-delay", type=float, default=MOCK_INDEX_DELAY, help="上傳後可讀回的延遲秒數")
+    parser.add_argument("--index-jitter", type=float, default=MOCK_INDEX_JITTER, help="延遲的隨機變動秒數")
+    parser.add_argument("--throttle-rate", type=float, default=MOCK_THROTTLE_RATE, help="寫入請求回傳 429 的比例")
+    args = parser.parse_args(argv)
+
+    graph = MockGraph(args.index_delay, args.index_jitter, args.throttle_rate)
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), make_handler(graph))
+    print(f"🧪 Mock Graph API：http://127.0.0.1:{args.port}/v1.0")
+    print(f"   GRAPH_API_BASE=http://127.0.0.1:{args.port}/v1.0 GRAPH_ACCESS_TOKEN=mock python data_sync.py")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"\n📊 {graph.stats}")
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,142 @@
+"""
+單一資料表的分區平行讀取
+以抽樣估計 id 的分位數作為 keyset 邊界，將一個資料表切成數個 id 範圍，
+各範圍以各自的資料庫連線平行執行同一個 fetch_*，結果依 id 範圍順序合併後交給轉換階段
+
+所有分區共用同一個匯出的快照（pg_export_snapshot），讀到的資料與單一查詢一致，
+增量同步的 watermark 不會因為各分區讀取時間不同而漏掉變更
+
+常駐服務以 use_pool 設定連線池後，協調與各分區的連線都向連線池借用
+"""
+import os
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import data_sync
+
+EXTRACT_PARTITIONS = int(os.environ.get("EXTRACT_PARTITIONS", "4"))
+# 只對這些資料表分區（最大的兩張表）
+PARTITIONED_TABLES = {t.strip() for t in os.environ.get("PARTITIONED_TABLES", "milestones,issues").split(",") if t.strip()}
+# 估計筆數少於此值時，分區的連線成本高於好處，直接以單一查詢讀取
+PARTITION_MIN_ROWS = int(os.environ.get("PARTITION_MIN_ROWS", "50000"))
+# 估計邊界時抽樣的大約筆數
+PARTITION_SAMPLE_ROWS = int(os.environ.get("PARTITION_SAMPLE_ROWS", "10000"))
+
+IdRange = Tuple[Optional[str], Optional[str]]
+
+# 常駐服務的連線池；None 時各自建立並關閉連線
+_pool = None
+
+
+def use_pool(pool):
+    """之後的分區讀取向 pool 借用連線（None 表示各自建立連線）"""
+    global _pool
+    _pool = pool
+
+
+def _connect():
+    return _pool.getconn() if _pool is not None else data_sync.get_db_connection()
+
+
+def _release(conn, broken: bool = False):
+    # 連線池歸還時會 rollback 未結束的交易；隔離等級只以 SET TRANSACTION 設定，不影響之後借用的人
+    if _pool is not None:
+        _pool.putconn(conn, close=broken or conn.closed)
+    else:
+        conn.close()
+
+
+def _begin_snapshot_transaction(conn):
+    """開始可匯出 / 匯入快照的唯讀 REPEATABLE READ 交易（只作用於這個交易，不改變連線的設定）"""
+    conn.rollback()
+    with conn.cursor() as cur:
+        cur.execute("SET TRANSACTION ISOLATION LEVEL REPEATABLE READ, READ ONLY")
+
+
+def estimated_rows(conn, table: str) -> float:
+    """pg_class.reltuples；從未 ANALYZE 的資料表為 -1"""
+    with conn.cursor() as cur:
+        cur.execute("SELECT reltuples FROM pg_class WHERE oid = %s::regclass", (table,))
+        return float(cur.fetchone()["reltuples"])
+
+
+def sample_boundaries(conn, table: str, partitions: int) -> List[str]:
+    """
+    以 TABLESAMPLE SYSTEM（依資料頁抽樣，不掃描整張表）估計 id 的 1/n、2/n ... 分位數
+    邊界以文字回傳（uuid 等型別在 build_filter 轉回 id 的型別）
+    """
+    rows = estimated_rows(conn, table)
+    if 0 <= rows < PARTITION_MIN_ROWS:
+        return []
+    percent = 1.0 if rows < 0 else min(100.0, 100.0 * PARTITION_SAMPLE_ROWS / max(rows, 1.0))
+    fractions = [i / partitions for i in range(1, partitions)]
+    with conn.cursor() as cur:
+        cur.execute(
+            f"SELECT unnest(percentile_disc(%s::float8[]) WITHIN GROUP (ORDER BY id))::text AS bound "
+            f"FROM {table} TABLESAMPLE SYSTEM (%s)",
+            (fractions, percent),
+        )
+        bounds = [row["bound"] for row in cur.fetchall() if row["bound"] is not None]
+    # 抽樣過少時分位數可能重複
+    return [b for i, b in enumerate(bounds) if i == 0 or b != bounds[i - 1]]
+
+
+def id_ranges(boundaries: List[str]) -> List[IdRange]:
+    edges: List[Optional[str]] = [None, *boundaries, None]
+    return list(zip(edges[:-1], edges[1:]))
+
+
+def _fetch_range(fetch: Callable, table: str, filters: Optional[Dict], id_range: IdRange,
+                 snapshot: Optional[str]) -> List[Dict]:
+    import psycopg2
+
+    conn = _connect()
+    broken = False
+    try:
+        if snapshot:
+            _begin_snapshot_transaction(conn)
+            with conn.cursor() as cur:
+                cur.execute("SET TRANSACTION SNAPSHOT %s", (snapshot,))
+        range_filters = {**(filters or {}), "id_ranges": {table: id_range}}
+        return fetch(conn, range_filters)
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        _release(conn, broken)
+
+
+def fetch_partitioned(fetch: Callable, table: str, filters: Optional[Dict] = None,
+                      partitions: int = EXTRACT_PARTITIONS) -> Optional[List[Dict]]:
+    """
+    分區平行讀取；資料表太小或無法切出多個範圍時回傳 None，由呼叫端改用單一查詢
+    """
+    import psycopg2
+
+    coordinator = _connect()
+    broken = False
+    try:
+        boundaries = sample_boundaries(coordinator, table, partitions)
+        if not boundaries:
+            return None
+        # 匯出快照需在 REPEATABLE READ 交易中，且交易需保持開啟直到各分區都已設定快照
+        _begin_snapshot_transaction(coordinator)
+        with coordinator.cursor() as cur:
+            cur.execute("SELECT pg_export_snapshot() AS snapshot")
+            snapshot = cur.fetchone()["snapshot"]
+
+        ranges = id_ranges(boundaries)
+        print(f"   🔀 {table} 分為 {len(ranges)} 個 id 範圍平行讀取")
+        with ThreadPoolExecutor(max_workers=len(ranges)) as pool:
+            futures = [pool.submit(_fetch_range, fetch, table, filters, r, snapshot) for r in ranges]
+            parts = [future.result() for future in futures]
+    except (psycopg2.OperationalError, psycopg2.InterfaceError):
+        broken = True
+        raise
+    finally:
+        _release(coordinator, broken)
+
+    rows: List[Dict] = []
+    for part in parts:
+        rows.extend(part)
+    return rows
@@ -0,0 +1,254 @@
+"""
+人員解析
+owners、managers、teamMembers 在 Portal 中是內部使用者 id，直接上傳時 Copilot 無法以人名查詢。
+此模組在同步時收集各資料表出現的 id，只對快取中沒有或已過期的 id 分批查詢目錄來源，
+結果存在 LRU + TTL 快取並寫入本機 SQLite，同一個人在 TTL 內只查詢一次
+
+目錄來源以 PEOPLE_SOURCE 指定：
+  file:<路徑>         JSON（{id: {"displayName", "mail"}}）或 CSV（id,displayName,mail）
+  mock                以 id 產生假資料（測試與量測用）
+  module:<模組>:<名稱>  自訂來源，名稱需為接受 id 清單、回傳 {id: {"displayName", "mail"}} 的函式
+"""
+import csv
+import importlib
+import json
+import os
+import sqlite3
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, List, Optional, Set
+
+PEOPLE_CACHE_PATH = os.environ.get("PEOPLE_CACHE_PATH", "people_cache.db")
+PEOPLE_CACHE_SIZE = int(os.environ.get("PEOPLE_CACHE_SIZE", "50000"))
+PEOPLE_CACHE_TTL = float(os.environ.get("PEOPLE_CACHE_TTL", "86400"))
+PEOPLE_BATCH_SIZE = int(os.environ.get("PEOPLE_BATCH_SIZE", "100"))
+
+# 各資料表中存放使用者 id 的欄位，與對應的 External Item 屬性
+PEOPLE_FIELDS = {
+    "projects": ("managers", "team_members"),
+    "milestones": ("assigned_to",),
+    "risks": ("owners",),
+    "issues": ("owners",),
+}
+PEOPLE_PROPERTIES = ("owners", "managers", "teamMembers")
+
+# 目錄來源：接受 id 清單，回傳找到的 id -> {"displayName", "mail"}
+DirectorySource = Callable[[List[str]], Dict[str, Dict]]
+
+
+# ============================================
+# 目錄來源
+# ============================================
+def file_source(path: str) -> DirectorySource:
+    """整個檔案讀入記憶體；查詢只是字典查找"""
+    if path.lower().endswith(".csv"):
+        with open(path, encoding="utf-8-sig", newline="") as f:
+            people = {row["id"]: {"displayName": row.get("displayName") or "", "mail": row.get("mail") or ""}
+                      for row in csv.DictReader(f) if row.get("id")}
+    else:
+        with open(path, encoding="utf-8") as f:
+            people = {str(k): v for k, v in json.load(f).items()}
+
+    def lookup(ids: List[str]) -> Dict[str, Dict]:
+        return {i: people[i] for i in ids if i in people}
+
+    return lookup
+
+
+class MockDirectory:
+    """以 id 產生假資料；calls 記錄查詢次數，可確認快取與分批是否生效"""
+
+    def __init__(self, latency: float = 0.0):
+        self.latency = latency
+        self.calls = 0
+
+    def __call__(self, ids: List[str]) -> Dict[str, Dict]:
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        return {i: {"displayName": f"使用者 {i}", "mail": f"user{i}@example.com"} for i in ids}
+
+
+def load_source(spec: str) -> DirectorySource:
+    if spec == "mock":
+        return MockDirectory(float(os.environ.get("PEOPLE_MOCK_LATENCY", "0")))
+    kind, _, rest = spec.partition(":")
+    if kind == "file" and rest:
+        return file_source(rest)
+    if kind == "module" and ":" in rest:
+        module_name, attr = rest.rsplit(":", 1)
+        return getattr(importlib.import_module(module_name), attr)
+    raise ValueError(f"無法辨識的 PEOPLE_SOURCE：{spec}（可用 file:<路徑>、mock、module:<模組>:<名稱>）")
+
+
+# ============================================
+# LRU + TTL 快取
+# ============================================
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS people (
+    id TEXT PRIMARY KEY,
+    display_name TEXT,
+    mail TEXT,
+    resolved_at REAL NOT NULL,
+    found INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT);
+"""
+
+
+class PeopleCache:
+    """
+    id -> {"displayName", "mail"}，目錄中找不到的 id 記為 None（同樣受 TTL 限制，避免每次重查）
+    以 OrderedDict 維持最近使用順序，超過容量時淘汰最久未使用的；
+    這次同步用到的 id（pinned）不會被淘汰，人數超過容量時快取暫時放大到這次的人數，
+    否則後面資料表預先查詢的 id 可能在轉換前就被擠出，變回原始 id；
+    快取記錄目錄來源，更換 PEOPLE_SOURCE 後先前的結果不再使用
+    """
+
+    def __init__(self, path: str = PEOPLE_CACHE_PATH, capacity: int = PEOPLE_CACHE_SIZE,
+                 ttl: float = PEOPLE_CACHE_TTL, source: str = ""):
+        self.path = path
+        self.source = source
+        self.capacity = capacity
+        self.ttl = ttl
+        # id -> (resolved_at, person 或 None)
+        self.entries: "OrderedDict[str, tuple]" = OrderedDict()
+        self.pinned: Set[str] = set()
+        self.load()
+
+    def load(self):
+        if not os.path.exists(self.path):
+            return
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.executescript(_SCHEMA)
+            row = conn.execute("SELECT value FROM meta WHERE key = 'source'").fetchone()
+            if (row[0] if row else "") != self.source:
+                return
+            # 檔案中依最近使用順序寫入，讀回後順序不變
+            for person_id, name, mail, resolved_at, found in conn.execute("SELECT * FROM people ORDER BY rowid"):
+                person = {"displayName": name or "", "mail": mail or ""} if found else None
+                self.entries[person_id] = (resolved_at, person)
+        finally:
+            conn.close()
+
+    def save(self):
+        rows = [(person_id, p and p.get("displayName"), p and p.get("mail"), resolved_at, p is not None)
+                for person_id, (resolved_at, p) in self.entries.items()]
+        conn = sqlite3.connect(self.path)
+        try:
+            conn.executescript(_SCHEMA)
+            with conn:
+                conn.execute("DELETE FROM people")
+                conn.executemany("INSERT INTO people VALUES (?, ?, ?, ?, ?)", rows)
+                conn.execute("INSERT OR REPLACE INTO meta VALUES ('source', ?)", (self.source,))
+        finally:
+            conn.close()
+
+    def fresh(self, person_id: str, now: float) -> bool:
+        entry = self.entries.get(person_id)
+        return entry is not None and now - entry[0] < self.ttl
+
+    def get(self, person_id: str) -> Optional[Dict]:
+        entry = self.entries.get(person_id)
+        if entry is None:
+            return None
+        self.entries.move_to_end(person_id)
+        return entry[1]
+
+    def put(self, person_id: str, person: Optional[Dict], now: float):
+        self.entries[person_id] = (now, person)
+        self.entries.move_to_end(person_id)
+        limit = max(self.capacity, len(self.pinned))
+        while len(self.entries) > limit:
+            oldest = next(iter(self.entries))
+            if oldest in self.pinned:
+                # 這次同步仍會用到，視為最近使用
+                self.entries.move_to_end(oldest)
+            else:
+                del self.entries[oldest]
+
+
+# ============================================
+# 解析
+# ============================================
+def format_person(person: Dict) -> str:
+    name = (person.get("displayName") or "").strip()
+    mail = (person.get("mail") or "").strip()
+    if name and mail:
+        return f"{name} <{mail}>"
+    return name or mail
+
+
+class PeopleResolver:
+    def __init__(self, source: DirectorySource, cache: Optional[PeopleCache] = None,
+                 batch_size: int = PEOPLE_BATCH_SIZE):
+        self.source = source
+        self.cache = cache if cache is not None else PeopleCache()
+        self.batch_size = max(1, batch_size)
+
+    def prefetch(self, ids: Iterable[str], stats: Optional[Dict] = None):
+        """
+        只查詢快取中沒有或已過期的 id；查詢失敗時保留過期的舊值，下次再查
+        stats 累計 ids（這次同步不重複的人數）、cached（快取命中）、looked_up、batches、not_found
+        """
+        now = time.time()
+        unique = {str(i) for i in ids if i not in (None, "")}
+        missing = sorted(i for i in unique if not self.cache.fresh(i, now))
+        # 同一次同步中先前資料表已出現的 id 不重複計算
+        seen = stats.setdefault("seen", set()) if stats is not None else set()
+        new = unique - seen
+        seen.update(new)
+        # 這次同步的 id 在轉換完成前都不淘汰；下一次同步以新的 seen 取代
+        self.cache.pinned = seen
+        counts = {"ids": len(new), "cached": len(new - set(missing)),
+                  "looked_up": 0, "batches": 0, "not_found": 0}
+        for start in range(0, len(missing), self.batch_size):
+            batch = missing[start:start + self.batch_size]
+            try:
+                found = self.source(batch)
+            except Exception as e:
+                print(f"⚠️ 人員目錄查詢失敗（{len(batch)} 位，沿用舊值或原始 id）: {e}")
+                continue
+            counts["batches"] += 1
+            counts["looked_up"] += len(batch)
+            for person_id in batch:
+                person = found.get(person_id)
+                if person is None:
+                    counts["not_found"] += 1
+                self.cache.put(person_id, person, now)
+        if counts["looked_up"]:
+            self.cache.save()
+        if stats is not None:
+            for key, value in counts.items():
+                stats[key] = stats.get(key, 0) + value
+
+    def resolve(self, person_id) -> str:
+        """找不到時保留原本的 id"""
+        person = self.cache.get(str(person_id))
+        return (format_person(person) if person else "") or str(person_id)
+
+    def apply(self, item: Dict):
+        """就地將項目的 owners / managers / teamMembers 換成「名稱 <信箱>」"""
+        properties = item["properties"]
+        for name in PEOPLE_PROPERTIES:
+            values = properties.get(name)
+            if values:
+                properties[name] = [self.resolve(v) for v in values]
+
+
+def collect_ids(rows: Iterable[Dict], fields: Iterable[str]) -> List[str]:
+    fields = tuple(fields)
+    ids = set()
+    for row in rows:
+        for field in fields:
+            value = row.get(field)
+            if isinstance(value, (list, tuple)):
+                ids.update(value)
+            elif value not in (None, ""):
+                ids.add(value)
+    return list(ids)
+
+
+def create_resolver(spec: str) -> PeopleResolver:
+    return PeopleResolver(load_source(spec), PeopleCache(source=spec))
@@ -0,0 +1,89 @@
+"""
+上傳優先順序排程
+依 updated_at 新舊、是否為關鍵路徑、嚴重程度/影響與項目類型計算分數，
+讓最重要的變更最先上傳、最先可被搜尋
+"""
+import json
+import os
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+# 預設策略；可用 PRIORITY_POLICY 環境變數指定 JSON 檔覆寫部分設定
+DEFAULT_PRIORITY_POLICY = {
+    # 新鮮度：剛更新的項目得到 recency_weight 分，每經過一個半衰期減半
+    "recency_weight": 50.0,
+    "recency_half_life_hours": 6.0,
+    "critical_path_weight": 30.0,
+    # 等級分數，套用到 level_fields 中的欄位（乘上各欄位倍率）
+    "level_scores": {"critical": 25.0, "high": 15.0, "medium": 5.0, "low": 0.0},
+    "level_fields": {"severity": 1.0, "impact": 1.0, "probability": 0.5, "priority": 0.5},
+    "item_type_weights": {"risk": 10.0, "issue": 10.0, "milestone": 5.0, "project": 0.0},
+}
+
+
+def load_policy(path: Optional[str] = None) -> Dict:
+    """讀取策略：以 JSON 檔內容覆寫預設值（巢狀 dict 逐鍵合併）"""
+    policy = {k: (dict(v) if isinstance(v, dict) else v) for k, v in DEFAULT_PRIORITY_POLICY.items()}
+    path = path or os.environ.get("PRIORITY_POLICY")
+    if not path:
+        return policy
+
+    with open(path, encoding="utf-8") as f:
+        overrides = json.load(f)
+    for key, value in overrides.items():
+        if key not in policy:
+            raise ValueError(f"未知的優先順序設定：{key}")
+        if isinstance(policy[key], dict):
+            policy[key].update(value)
+        else:
+            policy[key] = value
+    return policy
+
+
+def _prop(item, name: str):
+    if isinstance(item, dict):
+        return item["properties"].get(name)
+    return item.get(name)
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        if value.endswith("Z"):
+            value = value[:-1] + "+00:00"
+        dt = datetime.fromisoformat(value)
+    except ValueError:
+        return None
+    return dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)
+
+
+# ============================================
+# 計分與排序
+# ============================================
+def score_item(item, policy: Dict, now: datetime) -> float:
+    score = policy["item_type_weights"].get(_prop(item, "itemType"), 0.0)
+
+    updated = _parse_time(_prop(item, "lastModifiedDateTime"))
+    if updated is not None:
+        age_hours = max(0.0, (now - updated).total_seconds() / 3600)
+        score += policy["recency_weight"] * 0.5 ** (age_hours / policy["recency_half_life_hours"])
+
+    if _prop(item, "isCriticalPath"):
+        score += policy["critical_path_weight"]
+
+    level_scores = policy["level_scores"]
+    for field, factor in policy["level_fields"].items():
+        level = _prop(item, field)
+        if level:
+            score += level_scores.get(str(level).lower(), 0.0) * factor
+    return score
+
+
+def order_items(items: List, policy: Optional[Dict] = None, now: Optional[datetime] = None) -> List:
+    """依分數由高到低排序（同分維持原本順序）"""
+    policy = policy or load_policy()
+    now = now or datetime.now(timezone.utc)
+    scores = [score_item(item, policy, now) for item in items]
+    order = sorted(range(len(items)), key=scores.__getitem__, reverse=True)
+    return [items[i] for i in order]
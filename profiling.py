@@ -0,0 +1,224 @@
+"""
+同步熱點分析（--profile）
+依階段（fetch、transform_*、serialization、upload）收集 cProfile 與 tracemalloc 快照，
+並輸出最耗時函式與最大記憶體配置位置的摘要
+
+未啟用時 stage() / snapshot() 皆為空操作，不影響一般執行；
+start_timing() 只累計各階段耗時（不收集 profile），供執行紀錄使用
+"""
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import tracemalloc
+from contextlib import contextmanager, nullcontext
+from typing import Dict, List, Optional, Tuple
+
+# tracemalloc 只記錄 1 層呼叫堆疊以降低額外負擔；設為 0 可完全關閉記憶體追蹤
+TRACEMALLOC_FRAMES = int(os.environ.get("PROFILE_TRACEMALLOC_FRAMES", "1"))
+TOP_N = int(os.environ.get("PROFILE_TOP_N", "15"))
+
+# Python 3.12 起 cProfile 改用 sys.monitoring，同一時間整個行程只能有一個啟用中的 Profile，
+# 且會記錄所有執行緒的呼叫：只在呼叫 start() 的執行緒收集 profile，其他執行緒（$batch、
+# 重播、分區讀取）只量測各階段耗時，其呼叫會計入主執行緒當下的階段
+PER_THREAD_PROFILES = sys.version_info < (3, 12)
+
+_active: Optional["StageProfiler"] = None
+_timer: Optional["StageTimer"] = None
+
+
+class StageTimer:
+    """只量測各階段淨耗時的輕量版本（巢狀規則與 StageProfiler 相同）"""
+
+    def __init__(self):
+        self.seconds: Dict[str, float] = {}
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    @contextmanager
+    def stage(self, name: str):
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        now = time.perf_counter()
+        if stack:
+            outer_name, outer_start = stack[-1]
+            self._add_time(outer_name, now - outer_start)
+        stack.append((name, now))
+        try:
+            yield
+        finally:
+            stack.pop()
+            end = time.perf_counter()
+            self._add_time(name, end - now)
+            if stack:
+                stack[-1] = (stack[-1][0], end)
+
+    def _add_time(self, name: str, seconds: float):
+        with self._lock:
+            self.seconds[name] = self.seconds.get(name, 0.0) + seconds
+
+
+class StageProfiler:
+    def __init__(self, out_dir: str):
+        self.out_dir = out_dir
+        self.started = time.perf_counter()
+        self._owner = threading.get_ident()
+        # (stage, thread id) -> cProfile.Profile；各執行緒各自一份，輸出時合併
+        self._profiles: Dict[Tuple[str, int], cProfile.Profile] = {}
+        self._seconds: Dict[str, float] = {}
+        self._calls: Dict[str, int] = {}
+        self._snapshots: List[Tuple[str, tracemalloc.Snapshot]] = []
+        self._local = threading.local()
+        self._lock = threading.Lock()
+
+    # ============================================
+    # 階段量測
+    # ============================================
+    @contextmanager
+    def stage(self, name: str):
+        """巢狀階段會暫停外層階段，各階段時間為不含內層的淨時間"""
+        stack = getattr(self._local, "stack", None)
+        if stack is None:
+            stack = self._local.stack = []
+
+        now = time.perf_counter()
+        if stack:
+            outer_name, outer_profile, outer_start = stack[-1]
+            if outer_profile is not None:
+                outer_profile.disable()
+            self._add_time(outer_name, now - outer_start)
+
+        profile = self._enable(name)
+        stack.append((name, profile, now))
+        try:
+            yield
+        finally:
+            if profile is not None:
+                profile.disable()
+            stack.pop()
+            end = time.perf_counter()
+            self._add_time(name, end - now, calls=1)
+            if stack:
+                outer_name = stack[-1][0]
+                stack[-1] = (outer_name, self._enable(outer_name), end)
+
+    def snapshot(self, label: str):
+        if tracemalloc.is_tracing():
+            self._snapshots.append((label, tracemalloc.take_snapshot()))
+
+    def _enable(self, name: str) -> Optional[cProfile.Profile]:
+        """啟用此執行緒在該階段的 Profile；無法收集時回傳 None，該階段只量測耗時"""
+        thread_id = threading.get_ident()
+        if not PER_THREAD_PROFILES and thread_id != self._owner:
+            return None
+        key = (name, thread_id)
+        profile = self._profiles.get(key) or cProfile.Profile()
+        try:
+            profile.enable()
+        except ValueError:
+            # 行程中已有其他 profiler 啟用（例如以 python -m cProfile 執行）
+            return None
+        with self._lock:
+            self._profiles[key] = profile
+        return profile
+
+    def _add_time(self, name: str, seconds: float, calls: int = 0):
+        with self._lock:
+            self._seconds[name] = self._seconds.get(name, 0.0) + seconds
+            self._calls[name] = self._calls.get(name, 0) + calls
+
+    # ============================================
+    # 輸出
+    # ============================================
+    def write_report(self) -> str:
+        os.makedirs(self.out_dir, exist_ok=True)
+        lines = [f"總耗時: {time.perf_counter() - self.started:.2f}s", ""]
+
+        lines.append("=== 各階段耗時（淨時間，多執行緒階段為各執行緒加總）===")
+        if not PER_THREAD_PROFILES:
+            lines.append("（Python 3.12+：函式 profile 只來自主執行緒，背景執行緒的呼叫計入主執行緒當下的階段）")
+        for name, seconds in sorted(self._seconds.items(), key=lambda kv: -kv[1]):
+            lines.append(f"{name:<24} {seconds:10.3f}s  {self._calls.get(name, 0):>10} 次")
+
+        for name in sorted({stage for stage, _ in self._profiles}):
+            profiles = [p for (stage, _), p in self._profiles.items() if stage == name]
+            stats = pstats.Stats(profiles[0])
+            for extra in profiles[1:]:
+                stats.add(extra)
+            stats.dump_stats(os.path.join(self.out_dir, f"{name}.prof"))
+
+            buffer = io.StringIO()
+            stats.stream = buffer
+            stats.sort_stats("tottime").print_stats(TOP_N)
+            lines += ["", f"=== [{name}] 最耗時函式（tottime）==="]
+            output = buffer.getvalue().splitlines()
+            header = next((i for i, l in enumerate(output) if "ncalls" in l), 0)
+            lines += [l for l in output[header:] if l.strip()]
+
+        previous = None
+        for index, (label, snap) in enumerate(self._snapshots):
+            snap.dump(os.path.join(self.out_dir, f"{index:02d}-{label}.snapshot"))
+            if previous is None:
+                top = snap.statistics("lineno")[:TOP_N]
+                lines += ["", f"=== [{label}] 記憶體配置最多的位置 ==="]
+            else:
+                top = snap.compare_to(previous, "lineno")[:TOP_N]
+                lines += ["", f"=== [{label}] 相較前一快照增加最多的位置 ==="]
+            lines += [str(stat) for stat in top]
+            previous = snap
+
+        summary_path = os.path.join(self.out_dir, "summary.txt")
+        with open(summary_path, "w", encoding="utf-8") as f:
+            f.write("\n".join(lines) + "\n")
+        return summary_path
+
+
+# ============================================
+# 模組層級介面
+# ============================================
+def start(out_dir: str) -> StageProfiler:
+    global _active
+    if TRACEMALLOC_FRAMES > 0 and not tracemalloc.is_tracing():
+        tracemalloc.start(TRACEMALLOC_FRAMES)
+    _active = StageProfiler(out_dir)
+    return _active
+
+
+def stop() -> Optional[str]:
+    """輸出報告並停止收集，回傳摘要檔路徑"""
+    global _active
+    profiler, _active = _active, None
+    if profiler is None:
+        return None
+    path = profiler.write_report()
+    if tracemalloc.is_tracing():
+        tracemalloc.stop()
+    return path
+
+
+def start_timing():
+    global _timer
+    _timer = StageTimer()
+
+
+def stage_seconds() -> Dict[str, float]:
+    """目前各階段累計的淨耗時（--profile 時取自 StageProfiler）"""
+    if _active is not None:
+        return dict(_active._seconds)
+    return dict(_timer.seconds) if _timer is not None else {}
+
+
+def stage(name: str):
+    if _active is not None:
+        return _active.stage(name)
+    return _timer.stage(name) if _timer is not None else nullcontext()
+
+
+def snapshot(label: str):
+    if _active is not None:
+        _active.snapshot(label)
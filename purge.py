@@ -0,0 +1,247 @@
+"""
+快速清空 Connection 的所有項目
+以分頁列出（@odata.nextLink）取得項目 id，每頁以 $batch 高並行刪除，
+Connection 與 Schema 保持不變，不必重新建立並等待 Schema 佈建
+
+每頁刪除完即寫入檢查點，中斷後再次執行會從下一頁繼續（--restart 重新開始）。
+Graph 端不支援列出項目時，可改由本機鏡像（--source mirror）提供已上傳的 id
+
+用法：python purge.py [--connection ID] [--source listing|mirror] [--concurrency N] [--yes]
+"""
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import data_sync
+import sync_state
+from graph_batch import TokenSource, resolve_token
+
+PURGE_CHECKPOINT_PATH = os.environ.get("PURGE_CHECKPOINT_PATH", ".purge_checkpoint.json")
+PURGE_CONCURRENCY = int(os.environ.get("PURGE_CONCURRENCY", "16"))
+PURGE_PAGE_SIZE = int(os.environ.get("PURGE_PAGE_SIZE", "1000"))
+# 刪除後列表可能仍短暫出現已刪除的項目，最多重新列出幾輪確認
+PURGE_MAX_PASSES = int(os.environ.get("PURGE_MAX_PASSES", "3"))
+PURGE_PASS_DELAY = float(os.environ.get("PURGE_PASS_DELAY", "5"))
+
+# 端點不支援列出項目時的回應
+_UNSUPPORTED_STATUS = {400, 404, 405, 501}
+
+
+class ListingUnsupported(Exception):
+    pass
+
+
+# ============================================
+# 列出項目 id
+# ============================================
+def list_item_pages(token: TokenSource, connection_id: str,
+                    next_link: Optional[str] = None) -> Iterator[Tuple[List[str], Optional[str]]]:
+    """逐頁回傳 (id 清單, 下一頁連結)；從 next_link 開始時可接續先前的列表"""
+    url = next_link or (f"{data_sync.GRAPH_API_BASE}/external/connections/{connection_id}/items"
+                        f"?$select=id&$top={PURGE_PAGE_SIZE}")
+    first = True
+    while url:
+        headers = {"Authorization": f"Bearer {resolve_token(token)}"}
+        response = data_sync.get_http_session().get(url, headers=headers)
+        if first and response.status_code in _UNSUPPORTED_STATUS:
+            raise ListingUnsupported(f"HTTP {response.status_code}: {response.text[:200]}")
+        if not response.ok:
+            raise Exception(f"列出項目失敗 HTTP {response.status_code}: {response.text[:200]}")
+        first = False
+        data = response.json()
+        url = data.get("@odata.nextLink")
+        yield [item["id"] for item in data.get("value", [])], url
+
+
+def mirror_pages() -> Iterator[Tuple[List[str], None]]:
+    """
+    本機鏡像中的 id，逐頁回傳 (id 清單, None)
+    刪除成功的 id 會立即自鏡像移除，中斷後再次執行只會讀到尚未刪除的，因此不需要游標
+    """
+    mirror = data_sync.get_mirror()
+    if mirror is None:
+        raise Exception("未啟用本機鏡像（--mirror 或 LOCAL_MIRROR_PATH）")
+    ids = mirror.ids()
+    for start in range(0, len(ids), PURGE_PAGE_SIZE):
+        yield ids[start:start + PURGE_PAGE_SIZE], None
+
+
+# ============================================
+# 檢查點
+# ============================================
+def load_checkpoint(connection_id: str, source: str, restart: bool) -> Dict:
+    checkpoint = sync_state.load_state(PURGE_CHECKPOINT_PATH)
+    if restart or checkpoint.get("connection_id") != connection_id or checkpoint.get("source") != source:
+        return {
+            "connection_id": connection_id,
+            "source": source,
+            "started_at": datetime.now(timezone.utc).isoformat(),
+            "passes": 1,
+            "cursor": None,
+            "deleted": 0,
+            "rechecked": 0,
+            "failed": 0,
+        }
+    print(f"↩️ 從檢查點繼續：已刪除 {checkpoint['deleted']} 個項目（第 {checkpoint['passes']} 輪）")
+    return checkpoint
+
+
+def clear_checkpoint():
+    if os.path.exists(PURGE_CHECKPOINT_PATH):
+        os.remove(PURGE_CHECKPOINT_PATH)
+
+
+# ============================================
+# 刪除
+# ============================================
+def delete_page(token: TokenSource, connection_id: str, ids: List[str], concurrency: int) -> Dict:
+    from graph_batch import GraphBatchClient
+
+    results = {"success": 0, "failed": 0, "errors": []}
+    client = GraphBatchClient(token, connection_id=connection_id, concurrency=concurrency)
+    client.delete_many(ids, results)
+    results["throttled"] = client.stats["throttled"]
+
+    mirror = data_sync.get_mirror()
+    if mirror is not None:
+        failed = set(results["errors"])
+        mirror.remove(i for i in ids if i not in failed)
+    return results
+
+
+def run_pass(token: TokenSource, checkpoint: Dict, concurrency: int, started: float) -> int:
+    """
+    刪除一輪，回傳這一輪看到的項目數
+    第二輪起看到的多半是列表尚未反映刪除的項目（刪除回 404 也算成功），計入 rechecked 而非 deleted
+    """
+    connection_id = checkpoint["connection_id"]
+    if checkpoint["source"] == "mirror":
+        pages = mirror_pages()
+    else:
+        pages = list_item_pages(token, connection_id, checkpoint["cursor"])
+    counter = "deleted" if checkpoint["passes"] == 1 else "rechecked"
+
+    seen = 0
+    for ids, cursor in pages:
+        if ids:
+            results = delete_page(token, connection_id, ids, concurrency)
+            seen += len(ids)
+            checkpoint[counter] += results["success"]
+            checkpoint["failed"] += results["failed"]
+            elapsed = time.perf_counter() - started
+            done = checkpoint["deleted"] + checkpoint["rechecked"]
+            print(f"   🗑️ 已刪除 {checkpoint['deleted']} 個項目（本頁 {results['success']}/{len(ids)}"
+                  + (f"，節流 {results['throttled']}" if results["throttled"] else "")
+                  + f"，{done / elapsed if elapsed > 0 else 0:.0f} 個/秒）")
+        checkpoint["cursor"] = cursor
+        sync_state.save_state(checkpoint, PURGE_CHECKPOINT_PATH)
+    return seen
+
+
+def clear_fingerprints(connection_id: str):
+    """清空後所有資料列都需重新上傳，不能再依指紋略過"""
+    from row_fingerprint import FINGERPRINT_PATH, FingerprintStore
+
+    if not os.path.exists(FINGERPRINT_PATH):
+        return
+    store = FingerprintStore(FINGERPRINT_PATH)
+    try:
+        store.clear(connection_id)
+    finally:
+        store.close()
+    print("ℹ️ 已清除此 Connection 的資料列指紋")
+
+
+def reset_watermark(connection_id: str):
+    """清空使用中的 Connection 後，增量同步需從頭重新上傳"""
+    if connection_id != data_sync.resolve_connection_id():
+        return
+    state = sync_state.load_state()
+    if state.get("watermark"):
+        state.pop("watermark", None)
+        state.pop("overlap_seen", None)
+        state.pop("project_labels", None)
+        sync_state.save_state(state)
+        print("ℹ️ 已清除增量同步的 watermark，下一次同步會重新上傳全部資料")
+
+
+def purge(connection_id: str, source: str = "listing", concurrency: int = PURGE_CONCURRENCY,
+          restart: bool = False) -> bool:
+    # 清除可能持續數小時，每頁與每批都向 get_access_token 取得仍有效的 Token
+    token = data_sync.get_access_token
+    checkpoint = load_checkpoint(connection_id, source, restart)
+    started = time.perf_counter()
+
+    clean = False
+    while True:
+        print(f"\n🔎 第 {checkpoint['passes']} 輪：{'列出' if source == 'listing' else '讀取鏡像中的'}項目並刪除...")
+        try:
+            seen = run_pass(token, checkpoint, concurrency, started)
+        except ListingUnsupported as e:
+            print(f"❌ 此端點不支援列出項目（{e}）")
+            print("   可改用 --source mirror，以本機鏡像記錄的 id 刪除")
+            clear_checkpoint()
+            return False
+        if source == "mirror":
+            # 刪除失敗的 id 仍留在鏡像中，再次執行即會重試
+            clean = checkpoint["failed"] == 0
+            break
+        if seen == 0:
+            clean = True
+            break
+        if checkpoint["passes"] >= PURGE_MAX_PASSES:
+            break
+        # 重新列出確認已清空；失敗數只計最後一輪（前一輪失敗的項目會再次出現並重試）
+        checkpoint["passes"] += 1
+        checkpoint["cursor"] = None
+        checkpoint["failed"] = 0
+        sync_state.save_state(checkpoint, PURGE_CHECKPOINT_PATH)
+        time.sleep(PURGE_PASS_DELAY)
+
+    elapsed = time.perf_counter() - started
+    print(f"\n📊 刪除 {checkpoint['deleted']} 個項目，重新確認 {checkpoint['rechecked']} 個，"
+          f"失敗 {checkpoint['failed']}，耗時 {elapsed:.1f}s")
+    if not clean:
+        print("⚠️ 仍有項目未刪除，可再次執行以重試")
+        return False
+    clear_checkpoint()
+    clear_fingerprints(connection_id)
+    reset_watermark(connection_id)
+    print(f"✅ {connection_id} 已清空（Connection 與 Schema 保留）")
+    return True
+
+
+# ============================================
+# 執行
+# ============================================
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="purge.py", description="刪除 Connection 中的所有項目（保留 Connection 與 Schema）")
+    parser.add_argument("--connection", help="Connection id（預設為使用中的 Connection）")
+    parser.add_argument("--source", choices=("listing", "mirror"), default="listing",
+                        help="項目 id 來源：Graph 分頁列表或本機鏡像")
+    parser.add_argument("--concurrency", type=int, default=PURGE_CONCURRENCY, help="同時進行的批次請求數")
+    parser.add_argument("--mirror", metavar="PATH", help="本機鏡像檔路徑（--source mirror 時使用，刪除的項目也會自鏡像移除）")
+    parser.add_argument("--restart", action="store_true", help="忽略檢查點，從頭開始")
+    parser.add_argument("--yes", action="store_true", help="不詢問確認")
+    args = parser.parse_args(argv)
+    if args.mirror:
+        data_sync.MIRROR_PATH = args.mirror
+
+    connection_id = args.connection or data_sync.resolve_connection_id()
+    if not args.yes:
+        answer = input(f"⚠️ 將刪除 {connection_id} 中的所有項目，請輸入 Connection id 確認：")
+        if answer.strip() != connection_id:
+            print("已取消")
+            return 1
+
+    print("=" * 60)
+    print(f"清空 Connection：{connection_id}")
+    print("=" * 60)
+    return 0 if purge(connection_id, args.source, args.concurrency, args.restart) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,221 @@
+"""
+Blue/green 完整重建索引
+建立新版本的 External Connection 並註冊 SCHEMA，舊 Connection 繼續提供搜尋的同時
+以最大並行度載入全部資料；與資料庫筆數核對無誤後切換使用中的 Connection，再刪除舊的
+
+用法：python reindex.py [--keep-old] [--force] [--concurrency N]
+"""
+import os
+from datetime import datetime, timezone
+from typing import Dict, Optional
+
+import data_sync
+import sync_state
+from graph_batch import TokenSource
+
+# Connection id 只能是英數字、3~32 字元：前綴 13 字元 + "V" + 12 位時間戳記
+CONNECTION_ID_PREFIX = "ProjectPortal"
+REINDEX_CONCURRENCY = int(os.environ.get("REINDEX_CONCURRENCY", "16"))
+SCHEMA_WAIT_MINUTES = int(os.environ.get("REINDEX_SCHEMA_WAIT_MINUTES", "20"))
+
+# 與 fetch_* 相同的資料範圍（milestones 只包含仍有所屬專案的資料）
+COUNT_QUERIES = {
+    "projects": "SELECT count(*) AS n FROM projects",
+    "milestones": "SELECT count(*) AS n FROM milestones m JOIN projects p ON m.project_id = p.id",
+    "risks": "SELECT count(*) AS n FROM risks",
+    "issues": "SELECT count(*) AS n FROM issues",
+}
+
+
+def new_connection_id(now: Optional[datetime] = None) -> str:
+    now = now or datetime.now(timezone.utc)
+    return f"{CONNECTION_ID_PREFIX}V{now:%Y%m%d%H%M}"
+
+
+def item_table(item_id: str) -> Optional[str]:
+    for prefix, table in data_sync.ID_PREFIXES.items():
+        if item_id.startswith(prefix):
+            return table
+    return None
+
+
+# ============================================
+# 建立新 Connection 並註冊 Schema
+# ============================================
+def create_versioned_connection(token: str, connection_id: str):
+    import connection_create
+    import schema_register
+
+    print(f"\n🔗 建立新的 Connection: {connection_id}")
+    connection_create.create_connection(token, {
+        **connection_create.CONNECTION,
+        "id": connection_id,
+        "name": f"{connection_create.CONNECTION['name']} ({connection_id[len(CONNECTION_ID_PREFIX) + 1:]})",
+    })
+
+    print(f"\n📝 註冊 Schema 到 {connection_id}")
+    operation_url = schema_register.register_schema(token, connection_id)
+    if not schema_register.wait_for_schema_ready(token, operation_url, max_wait_minutes=SCHEMA_WAIT_MINUTES):
+        raise Exception(f"Schema 在 {connection_id} 上未能完成建立")
+
+
+# ============================================
+# 載入與核對
+# ============================================
+def bulk_load(token: TokenSource, conn, connection_id: str, concurrency: int) -> Dict:
+    from graph_batch import GraphBatchClient
+
+    stats: Dict = {}
+    dead_before = data_sync.get_dead_letter().count
+    # 新的 Connection 是空的，所有資料列都需要上傳
+    items = data_sync.build_items(conn, None, stats, use_fingerprints=False)
+
+    expected: Dict[str, int] = {}
+    for c in items:
+        table = item_table(c.id)
+        expected[table] = expected.get(table, 0) + 1
+
+    results = {"success": 0, "failed": 0, "errors": []}
+    print(f"\n📤 以並行度 {concurrency} 上傳 {len(items)} 個項目到 {connection_id}...")
+    pairs = data_sync.serialize_items(items)
+    mirror = data_sync.get_mirror()
+    if mirror is not None:
+        # 鏡像在切換時才改為新 Connection 的內容
+        pairs = mirror.staging(pairs)
+    client = GraphBatchClient(token, connection_id=connection_id, concurrency=concurrency)
+    client.upsert_many(pairs, results)
+    data_sync.print_batch_stats(client.stats)
+
+    uploaded = dict(expected)
+    for item_id in results["errors"]:
+        table = item_table(item_id)
+        uploaded[table] = uploaded.get(table, 0) - 1
+
+    return {
+        "results": results,
+        "stats": stats,
+        "uploaded": uploaded,
+        "invalid": data_sync.get_dead_letter().count - dead_before,
+    }
+
+
+def verify_counts(conn, load: Dict) -> bool:
+    """
+    已上傳筆數 + 未通過驗證筆數需等於讀取到的資料列數；
+    資料庫目前筆數若較多，代表載入期間有新資料，切換後的增量同步會補上
+    """
+    from psycopg2.extras import RealDictCursor
+
+    fetched = load["stats"].get("fetched", {})
+    with conn.cursor(cursor_factory=RealDictCursor) as cur:
+        db_counts = {}
+        for table, query in COUNT_QUERIES.items():
+            cur.execute(query)
+            db_counts[table] = cur.fetchone()["n"]
+
+    print("\n🔍 核對筆數")
+    print(f"   {'類型':<12}{'資料庫':>10}{'讀取':>10}{'已上傳':>10}")
+    for table in COUNT_QUERIES:
+        print(f"   {table:<12}{db_counts[table]:>10}{fetched.get(table, 0):>10}{load['uploaded'].get(table, 0):>10}")
+
+    ok = True
+    total_uploaded = sum(load["uploaded"].values())
+    total_fetched = sum(fetched.values())
+    if load["results"]["failed"]:
+        print(f"   ❌ {load['results']['failed']} 個項目上傳失敗")
+        ok = False
+    if total_uploaded + load["invalid"] != total_fetched:
+        print(f"   ❌ 已上傳 {total_uploaded} + 未通過驗證 {load['invalid']} ≠ 讀取 {total_fetched}")
+        ok = False
+    for table, count in db_counts.items():
+        if count < fetched.get(table, 0):
+            print(f"   ❌ {table}: 資料庫目前只有 {count} 筆，少於載入時的 {fetched.get(table, 0)} 筆（載入期間有刪除）")
+            ok = False
+        elif count > fetched.get(table, 0):
+            print(f"   ℹ️ {table}: 載入期間新增 {count - fetched.get(table, 0)} 筆，切換後由增量同步補上")
+    if ok:
+        print("   ✅ 筆數一致")
+    return ok
+
+
+# ============================================
+# 切換與清理
+# ============================================
+def cutover(old_id: str, new_id: str, stats: Dict, results: Dict):
+    """
+    切換使用中的 Connection，並把 watermark 設為載入時看到的最大 updated_at，
+    載入之後的變更會由下一次增量同步寫入新的 Connection
+    """
+    state = sync_state.load_state()
+    if stats.get("max_updated_at") is not None:
+        sync_state.set_watermark(state, stats["max_updated_at"])
+    state["project_labels"] = stats.get("project_labels", {})
+    sync_state.save_state(state)
+    sync_state.save_active_connection(new_id, previous=old_id)
+    data_sync.CONNECTION_ID = new_id
+    data_sync.commit_mirror(results, 0, replace_all=True)
+    print(f"\n🔀 已切換使用中的 Connection：{old_id} → {new_id}")
+
+
+def run_reindex(keep_old: bool = False, force: bool = False,
+                concurrency: int = REINDEX_CONCURRENCY) -> bool:
+    import connection_create
+
+    old_id = data_sync.resolve_connection_id()
+    if os.environ.get("CONNECTION_ID"):
+        print("⚠️ 已設定 CONNECTION_ID 環境變數，切換後需一併更新才會生效")
+    new_id = new_connection_id()
+    if new_id == old_id:
+        raise Exception(f"新 Connection id 與目前相同：{new_id}，請稍後再試")
+
+    token = data_sync.get_access_token()
+    create_versioned_connection(token, new_id)
+
+    conn = data_sync.get_db_connection()
+    try:
+        # 載入可能持續數小時，傳入 get_access_token 讓每批取得仍有效的 Token
+        load = bulk_load(data_sync.get_access_token, conn, new_id, concurrency)
+        ok = verify_counts(conn, load)
+    finally:
+        conn.close()
+
+    data_sync.print_summary(load["results"])
+    if not ok and not force:
+        print(f"\n❌ 核對未通過，維持使用 {old_id}；新的 Connection {new_id} 保留供檢查")
+        if data_sync.get_mirror() is not None:
+            data_sync.get_mirror().discard_staged()
+        return False
+
+    cutover(old_id, new_id, load["stats"], load["results"])
+
+    if keep_old:
+        print(f"ℹ️ 保留舊的 Connection：{old_id}")
+    else:
+        # 載入耗時較久，token 可能已接近過期，重新取得
+        connection_create.delete_connection(data_sync.get_access_token(), old_id)
+        print(f"🗑️ 已刪除舊的 Connection：{old_id}")
+
+    print("\n🎉 重建索引完成！")
+    return True
+
+
+# ============================================
+# 執行
+# ============================================
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="reindex.py", description="Blue/green 完整重建索引")
+    parser.add_argument("--keep-old", action="store_true", help="切換後不刪除舊的 Connection")
+    parser.add_argument("--force", action="store_true", help="筆數核對未通過仍然切換")
+    parser.add_argument("--concurrency", type=int, default=REINDEX_CONCURRENCY, help="同時進行的批次請求數")
+    args = parser.parse_args(argv)
+
+    print("=" * 60)
+    print("Blue/green 完整重建索引")
+    print("=" * 60)
+    return 0 if run_reindex(args.keep_old, args.force, args.concurrency) else 1
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,99 @@
+"""
+資料列指紋
+以 fetch_* 讀到的原始欄位（加上轉換時會用到的專案名稱、ACL 與設定）計算指紋，
+與上次成功上傳時記錄的指紋相同的資料列不做文字正規化、人員解析、轉換、序列化，也不上傳。
+人員解析只以使用者 id 與 PEOPLE_SOURCE 計入，目錄中的名稱或信箱變更要等資料列變更時才會更新。
+穩定狀態下的完整同步大多數資料列沒有變更，CPU 時間主要只剩讀取與計算指紋
+
+指紋依 Connection 分開記錄在本機 SQLite；只有上傳成功的項目才會寫入，
+失敗、未通過驗證或被延後的項目下次仍會重新轉換
+"""
+import hashlib
+import os
+import sqlite3
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+FINGERPRINT_PATH = os.environ.get("FINGERPRINT_PATH", "fingerprints.db")
+
+# transform_* 或序列化格式變更時遞增，所有資料列都會重新轉換一次
+FINGERPRINT_VERSION = 3
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS fingerprints (
+    connection_id TEXT NOT NULL,
+    id TEXT NOT NULL,
+    fingerprint TEXT NOT NULL,
+    PRIMARY KEY (connection_id, id)
+);
+"""
+
+
+def row_fingerprint(row: Dict, salt: str, extra: str = "") -> str:
+    """RealDictRow 的欄位順序固定（依 SELECT），直接以 repr 組合所有值"""
+    data = f"{salt}\x1f{extra}\x1f{tuple(row.values())!r}".encode("utf-8")
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+
+class FingerprintStore:
+    def __init__(self, path: str = FINGERPRINT_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SCHEMA)
+        # 這次計算出、已變更的資料列：item id -> 指紋（上傳成功後才寫入）
+        self.pending: Dict[str, str] = {}
+        self.sent: List[str] = []
+
+    def close(self):
+        self.conn.close()
+
+    def load(self, connection_id: str, prefix: str) -> Dict[str, str]:
+        rows = self.conn.execute(
+            "SELECT id, fingerprint FROM fingerprints WHERE connection_id = ? AND id >= ? AND id < ?",
+            (connection_id, prefix, prefix[:-1] + chr(ord(prefix[-1]) + 1)),
+        )
+        return dict(rows)
+
+    def filter_changed(self, rows: List[Dict], connection_id: str, prefix: str, salt: str,
+                       extra: Optional[Callable[[Dict], str]] = None) -> List[Dict]:
+        """回傳指紋與記錄不同（或沒有記錄）的資料列"""
+        stored = self.load(connection_id, prefix)
+        changed = []
+        for row in rows:
+            item_id = f"{prefix}{row['id']}"
+            fingerprint = row_fingerprint(row, salt, extra(row) if extra is not None else "")
+            if stored.get(item_id) != fingerprint:
+                self.pending[item_id] = fingerprint
+                changed.append(row)
+        return changed
+
+    def discard(self, item_id: str):
+        """未通過驗證的項目不記錄指紋"""
+        self.pending.pop(item_id, None)
+
+    def staging(self, pairs: Iterable[Tuple[str, bytes]]) -> Iterator[Tuple[str, bytes]]:
+        """包裝上傳用的 (item_id, bytes) 串流，記下實際送出的項目"""
+        for item_id, body in pairs:
+            if item_id in self.pending:
+                self.sent.append(item_id)
+            yield item_id, body
+
+    def commit(self, connection_id: str, failed: Iterable[str] = ()) -> int:
+        """寫入上傳成功項目的指紋，回傳筆數"""
+        failed_ids = set(failed)
+        rows = [(connection_id, item_id, self.pending.pop(item_id))
+                for item_id in self.sent if item_id not in failed_ids and item_id in self.pending]
+        # 沒有送出的（延後、未通過驗證或上傳失敗）下次重新計算
+        self.sent = []
+        self.pending.clear()
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO fingerprints VALUES (?, ?, ?)", rows)
+        return len(rows)
+
+    def clear(self, connection_id: str):
+        with self.conn:
+            self.conn.execute("DELETE FROM fingerprints WHERE connection_id = ?", (connection_id,))
+        self.pending.clear()
+        self.sent = []
+
+    def counts(self) -> Dict[str, int]:
+        return dict(self.conn.execute("SELECT connection_id, count(*) FROM fingerprints GROUP BY connection_id"))
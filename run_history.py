@@ -0,0 +1,234 @@
+"""
+執行紀錄
+每次同步的統計（讀取列數、各階段耗時、items/sec、略過、失敗、節流與 payload 大小）寫入本機 SQLite，
+history 子命令可檢視趨勢，並標示相較前幾次同模式執行明顯變慢的紀錄
+"""
+import json
+import os
+import sqlite3
+import statistics
+from datetime import datetime
+from typing import Dict, List, Optional
+
+RUN_HISTORY_PATH = os.environ.get("RUN_HISTORY_PATH", "run_history.db")
+# 比前幾次的中位數慢超過此比例即視為退步
+REGRESSION_THRESHOLD = float(os.environ.get("RUN_HISTORY_REGRESSION_THRESHOLD", "0.25"))
+REGRESSION_WINDOW = int(os.environ.get("RUN_HISTORY_WINDOW", "5"))
+# 項目數（或讀取列數）太少時耗時主要是固定成本，不做比較
+MIN_ITEMS_FOR_COMPARISON = 50
+# 隨上傳項目數增加的階段；其餘階段（讀取、正規化、指紋、轉換等）隨讀取的列數增加，
+# 指紋略過未變更的資料列時上傳項目遠少於讀取列數，需分開換算
+ITEM_STAGES = ("serialization", "upload")
+# 佔總階段耗時不到此比例的階段只有幾毫秒，波動大，不做比較
+MIN_STAGE_SHARE = 0.05
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    started_at TEXT NOT NULL,
+    mode TEXT NOT NULL,
+    duration_seconds REAL NOT NULL,
+    items INTEGER NOT NULL,
+    rows INTEGER NOT NULL DEFAULT 0,
+    success INTEGER NOT NULL,
+    failed INTEGER NOT NULL,
+    skipped INTEGER NOT NULL,
+    throttled INTEGER NOT NULL,
+    retried INTEGER NOT NULL,
+    payload_bytes INTEGER NOT NULL,
+    stages TEXT NOT NULL,
+    error TEXT
+);
+CREATE INDEX IF NOT EXISTS runs_by_mode ON runs (mode, id);
+"""
+
+_COLUMNS = ("id", "started_at", "mode", "duration_seconds", "items", "rows", "success", "failed",
+            "skipped", "throttled", "retried", "payload_bytes", "stages", "error")
+
+
+class RunHistory:
+    def __init__(self, path: str = RUN_HISTORY_PATH):
+        self.path = path
+        self.conn = sqlite3.connect(path)
+        self.conn.executescript(_SCHEMA)
+        if "rows" not in {row[1] for row in self.conn.execute("PRAGMA table_info(runs)")}:
+            # 舊版紀錄沒有讀取列數，視為 0（比較時改以項目數換算）
+            with self.conn:
+                self.conn.execute("ALTER TABLE runs ADD COLUMN rows INTEGER NOT NULL DEFAULT 0")
+
+    def close(self):
+        self.conn.close()
+
+    def record(self, run: Dict) -> int:
+        with self.conn:
+            cur = self.conn.execute(
+                "INSERT INTO runs (started_at, mode, duration_seconds, items, rows, success, failed, skipped, "
+                "throttled, retried, payload_bytes, stages, error) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (run["started_at"], run["mode"], run["duration_seconds"],
+                 run.get("success", 0) + run.get("failed", 0), run.get("rows", 0),
+                 run.get("success", 0), run.get("failed", 0),
+                 run.get("skipped", 0), run.get("throttled", 0), run.get("retried", 0),
+                 run.get("payload_bytes", 0), json.dumps(run.get("stages", {})), run.get("error")),
+            )
+        return cur.lastrowid
+
+    def recent(self, limit: int = 20, mode: Optional[str] = None) -> List[Dict]:
+        """最近的紀錄，由舊到新"""
+        sql = f"SELECT {', '.join(_COLUMNS)} FROM runs"
+        params: List = []
+        if mode:
+            sql += " WHERE mode = ?"
+            params.append(mode)
+        sql += " ORDER BY id DESC LIMIT ?"
+        params.append(limit)
+        runs = []
+        for row in self.conn.execute(sql, params):
+            run = dict(zip(_COLUMNS, row))
+            run["stages"] = json.loads(run["stages"])
+            runs.append(run)
+        return runs[::-1]
+
+    def throughput(self, mode: Optional[str] = None, window: int = REGRESSION_WINDOW) -> Optional[float]:
+        """最近幾次成功執行的 items/sec 中位數（供估算耗時）"""
+        rates = [items_per_second(r) for r in self.recent(window * 3, mode)
+                 if not r["error"] and r["items"] >= MIN_ITEMS_FOR_COMPARISON]
+        rates = [r for r in rates if r][-window:]
+        return statistics.median(rates) if rates else None
+
+
+def items_per_second(run: Dict) -> Optional[float]:
+    if run["duration_seconds"] <= 0 or not run["items"]:
+        return None
+    return run["items"] / run["duration_seconds"]
+
+
+def rows_per_second(run: Dict) -> Optional[float]:
+    """整次執行的處理速度：讀取列數 / 耗時（沒有紀錄時以項目數代替）；指紋略過的資料列也計入"""
+    rows = run["rows"] or run["items"]
+    if run["duration_seconds"] <= 0 or not rows:
+        return None
+    return rows / run["duration_seconds"]
+
+
+def stage_units(run: Dict, stage: str) -> int:
+    """換算階段耗時的分母：上傳相關階段為項目數，其餘為讀取列數（沒有紀錄時以項目數代替）"""
+    if stage in ITEM_STAGES:
+        return run["items"]
+    return run["rows"] or run["items"]
+
+
+# ============================================
+# 退步偵測
+# ============================================
+def find_regressions(runs: List[Dict], threshold: float = REGRESSION_THRESHOLD,
+                     window: int = REGRESSION_WINDOW) -> Dict[int, List[str]]:
+    """
+    與同模式前 window 次執行的中位數比較：
+    每秒處理的列數下降，或任一主要階段每列（上傳相關階段為每個項目）的耗時增加超過 threshold 即列出原因
+    回傳 run id -> 原因
+    """
+    flagged: Dict[int, List[str]] = {}
+    by_mode: Dict[str, List[Dict]] = {}
+    for run in runs:
+        previous = [r for r in by_mode.get(run["mode"], []) if not r["error"]][-window:]
+        by_mode.setdefault(run["mode"], []).append(run)
+        if run["error"] or not previous:
+            continue
+
+        reasons = []
+        rate = rows_per_second(run)
+        baseline_rates = [r for r in map(rows_per_second, previous) if r]
+        if rate and baseline_rates and (run["rows"] or run["items"]) >= MIN_ITEMS_FOR_COMPARISON:
+            baseline = statistics.median(baseline_rates)
+            if rate < baseline * (1 - threshold):
+                reasons.append(f"每秒處理 {rate:.1f} 列（前 {len(baseline_rates)} 次中位數 {baseline:.1f}）")
+
+        total = sum(run["stages"].values())
+        for stage, seconds in run["stages"].items():
+            units = stage_units(run, stage)
+            if seconds < total * MIN_STAGE_SHARE or units < MIN_ITEMS_FOR_COMPARISON:
+                continue
+            per_unit = [r["stages"][stage] / stage_units(r, stage) for r in previous
+                        if stage in r["stages"] and stage_units(r, stage)]
+            if not per_unit:
+                continue
+            baseline = statistics.median(per_unit)
+            current = seconds / units
+            if baseline > 0 and current > baseline * (1 + threshold):
+                unit = "每項" if stage in ITEM_STAGES else "每列"
+                reasons.append(f"{stage} {unit} {current * 1000:.2f} ms（中位數 {baseline * 1000:.2f} ms）")
+        if reasons:
+            flagged[run["id"]] = reasons
+    return flagged
+
+
+def check_latest(history: "RunHistory", run_id: int, mode: str,
+                 threshold: float = REGRESSION_THRESHOLD, window: int = REGRESSION_WINDOW) -> List[str]:
+    runs = history.recent(window * 3 + 1, mode)
+    return find_regressions(runs, threshold, window).get(run_id, [])
+
+
+# ============================================
+# 執行（history 子命令）
+# ============================================
+def _format_bytes(n: int) -> str:
+    return f"{n / 1024 / 1024:.1f} MB" if n >= 1024 * 1024 else f"{n / 1024:.0f} KB"
+
+
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="run_history.py", description="檢視同步執行紀錄與效能退步")
+    parser.add_argument("--limit", type=int, default=20, help="顯示最近幾次")
+    parser.add_argument("--mode", help="只顯示指定模式（full / full-sql / incremental / selected / selected-sql / replay / service）")
+    parser.add_argument("--threshold", type=float, default=REGRESSION_THRESHOLD, help="退步門檻（0.25 = 慢 25%%）")
+    parser.add_argument("--window", type=int, default=REGRESSION_WINDOW, help="與前幾次執行的中位數比較")
+    parser.add_argument("--stages", action="store_true", help="顯示各階段耗時")
+    parser.add_argument("--check", action="store_true", help="最新一次執行退步時結束碼為 1（供 cron 告警）")
+    parser.add_argument("--history", default=RUN_HISTORY_PATH, help="執行紀錄檔路徑")
+    args = parser.parse_args(argv)
+
+    if not os.path.exists(args.history):
+        print(f"尚無執行紀錄：{args.history}")
+        return 0
+
+    history = RunHistory(args.history)
+    try:
+        # 多讀一些較舊的紀錄作為前幾筆的比較基準
+        runs = history.recent(args.limit + args.window, args.mode)
+    finally:
+        history.close()
+    flagged = find_regressions(runs, args.threshold, args.window)
+    shown = runs[-args.limit:]
+
+    print(f"{'#':>5}  {'開始時間':<19}  {'模式':<11} {'耗時':>8} {'讀取':>8} {'項目':>8} {'items/s':>8} "
+          f"{'失敗':>5} {'略過':>5} {'節流':>5} {'payload':>9}")
+    for run in shown:
+        rate = items_per_second(run)
+        started = datetime.fromisoformat(run["started_at"]).strftime("%Y-%m-%d %H:%M:%S")
+        mark = " ⚠️" if run["id"] in flagged else (" ❌" if run["error"] else "")
+        print(f"{run['id']:>5}  {started:<19}  {run['mode']:<11} {run['duration_seconds']:>7.1f}s "
+              f"{(run['rows'] or '-'):>8} {run['items']:>8} "
+              f"{(f'{rate:.1f}' if rate else '-'):>8} {run['failed']:>5} {run['skipped']:>5} {run['throttled']:>5} "
+              f"{_format_bytes(run['payload_bytes']):>9}{mark}")
+        if args.stages and run["stages"]:
+            stages = "  ".join(f"{k} {v:.2f}s" for k, v in sorted(run["stages"].items(), key=lambda kv: -kv[1]))
+            print(f"{'':>7}{stages}")
+
+    shown_ids = {run["id"] for run in shown}
+    regressions = {run_id: reasons for run_id, reasons in flagged.items() if run_id in shown_ids}
+    if regressions:
+        print(f"\n⚠️ {len(regressions)} 次執行較前 {args.window} 次中位數慢超過 {args.threshold:.0%}：")
+        for run_id, reasons in regressions.items():
+            print(f"   #{run_id}: " + "；".join(reasons))
+    errors = [run for run in shown if run["error"]]
+    for run in errors:
+        print(f"   ❌ #{run['id']}: {run['error']}")
+
+    if args.check and shown and shown[-1]["id"] in flagged:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
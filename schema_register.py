@@ -1,16 +1,13 @@
 """
 步驟 3：註冊 Schema（使用 requests）
 Schema 建立是非同步操作，需要 5-15 分鐘完成
+requests 於函式內載入，其他模組只引用 SCHEMA 時不需付出載入成本
 """
-import requests
 import json
 import time
 
 from config import CONFIG
 
-# 你在步驟 2 建立的 Connection ID
-CONNECTION_ID = "ProjectPortalConnection"
-
 # ============================================
 # Schema 定義
 # ============================================
@@ -265,11 +262,26 @@ SCHEMA = {
     ],
 }
 
+# 可以沒有值的屬性：沒有值時上傳前省略（不送出 null）；其他屬性都必須有值
+OPTIONAL_PROPERTIES = frozenset({
+    "createdDateTime", "lastModifiedBy", "startDate", "endDate", "dueDate",
+    "status", "priority", "severity", "probability", "impact", "budget", "budgetUsed",
+})
+
+
+def active_connection_id() -> str:
+    """與 data_sync 相同：CONNECTION_ID 環境變數 > blue/green 切換後的使用中 Connection > 步驟 2 建立的 Connection"""
+    import data_sync
+
+    return data_sync.resolve_connection_id()
+
 
 # ============================================
 # 取得 Access Token
 # ============================================
 def get_access_token():
+    import requests
+
     url = f"https://login.microsoftonline.com/{CONFIG['tenant_id']}/oauth2/v2.0/token"
 
     payload = {
@@ -293,8 +305,11 @@ def get_access_token():
 # ============================================
 # 註冊 Schema（非同步操作）
 # ============================================
-def register_schema(token):
-    url = f"https://graph.microsoft.com/v1.0/external/connections/{CONNECTION_ID}/schema"
+def register_schema(token, connection_id=None):
+    import requests
+
+    connection_id = connection_id or active_connection_id()
+    url = f"https://graph.microsoft.com/v1.0/external/connections/{connection_id}/schema"
 
     headers = {"Authorization": f"Bearer {token}", "Content-Type": "application/json"}
 
@@ -316,6 +331,8 @@ def register_schema(token):
 # 輪詢 Schema 建立狀態（已修正錯誤處理）
 # ============================================
 def poll_schema_status(token, operation_url):
+    import requests
+
     headers = {"Authorization": f"Bearer {token}"}
 
     response = requests.get(operation_url, headers=headers)
@@ -372,8 +389,11 @@ def wait_for_schema_ready(token, operation_url, max_wait_minutes=20, poll_interv
 # ============================================
 # 檢查現有 Schema
 # ============================================
-def get_current_schema(token):
-    url = f"https://graph.microsoft.com/v1.0/external/connections/{CONNECTION_ID}/schema"
+def get_current_schema(token, connection_id=None):
+    import requests
+
+    connection_id = connection_id or active_connection_id()
+    url = f"https://graph.microsoft.com/v1.0/external/connections/{connection_id}/schema"
     headers = {"Authorization": f"Bearer {token}"}
 
     response = requests.get(url, headers=headers)
@@ -396,13 +416,16 @@ def check_operation_status(operation_id=None):
     手動檢查 schema operation 狀態
     用法: check_operation_status("6068921f-5a6f-33d9-3966-1cac9df82949")
     """
+    import requests
+
     token = get_access_token()
+    connection_id = active_connection_id()
     
     if operation_id:
-        operation_url = f"https://graph.microsoft.com/v1.0/external/connections/{CONNECTION_ID}/operations/{operation_id}"
+        operation_url = f"https://graph.microsoft.com/v1.0/external/connections/{connection_id}/operations/{operation_id}"
     else:
         # 取得所有 operations
-        operation_url = f"https://graph.microsoft.com/v1.0/external/connections/{CONNECTION_ID}/operations"
+        operation_url = f"https://graph.microsoft.com/v1.0/external/connections/{connection_id}/operations"
     
     headers = {"Authorization": f"Bearer {token}"}
     response = requests.get(operation_url, headers=headers)
@@ -421,10 +444,11 @@ def main():
     print("=" * 60)
 
     token = get_access_token()
+    connection_id = active_connection_id()
 
     # 先檢查是否已有 Schema
     print("\n📋 檢查現有 Schema...")
-    existing = get_current_schema(token)
+    existing = get_current_schema(token, connection_id)
     if existing and existing.get("properties"):
         print(f"⚠️ 已存在 Schema，共 {len(existing['properties'])} 個欄位")
         confirm = input("是否要更新 Schema？(y/N): ")
@@ -433,10 +457,10 @@ def main():
             return
 
     # 註冊 Schema
-    print(f"\n📝 正在註冊 Schema 到 Connection: {CONNECTION_ID}")
+    print(f"\n📝 正在註冊 Schema 到 Connection: {connection_id}")
     print(f"   欄位數量: {len(SCHEMA['properties'])}")
 
-    operation_url = register_schema(token)
+    operation_url = register_schema(token, connection_id)
 
     # 等待完成
     success = wait_for_schema_ready(token, operation_url)
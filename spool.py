@@ -0,0 +1,204 @@
+"""
+離線匯出與重播
+在可連線資料庫的主機匯出壓縮的 NDJSON 分塊檔，再於可連線 Graph 的主機重播上傳
+"""
+import gzip
+import hashlib
+import json
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+INDEX_FILE = "index.json"
+DEFAULT_CHUNK_SIZE = int(os.environ.get("SPOOL_CHUNK_SIZE", "5000"))
+DEFAULT_CONCURRENCY = int(os.environ.get("REPLAY_CONCURRENCY", "16"))
+
+_ID_PREFIX = b'{"id":"'
+
+
+# ============================================
+# 匯出
+# ============================================
+def export_items(items: Iterable, out_dir: str, chunk_size: int = DEFAULT_CHUNK_SIZE) -> Dict:
+    """
+    將項目寫成 chunk-00000.ndjson.gz ... 並產生 index.json
+    items 可為 CompactItem 或 dict；回傳 index 內容
+    """
+    from data_sync import serialize_item
+
+    os.makedirs(out_dir, exist_ok=True)
+    chunks = []
+    writer: Optional[_ChunkWriter] = None
+
+    for item in items:
+        if not isinstance(item, dict):
+            item = item.to_item()
+        if writer is None:
+            writer = _ChunkWriter(out_dir, len(chunks))
+        writer.write(item["id"], item["properties"].get("itemType"), serialize_item(item))
+        if writer.count >= chunk_size:
+            chunks.append(writer.close())
+            writer = None
+
+    if writer is not None:
+        chunks.append(writer.close())
+
+    index = {
+        "version": 1,
+        "created_at": datetime.now(timezone.utc).isoformat(),
+        "total": sum(c["count"] for c in chunks),
+        "chunks": chunks,
+    }
+    tmp_path = os.path.join(out_dir, INDEX_FILE + ".tmp")
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(index, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, os.path.join(out_dir, INDEX_FILE))
+    return index
+
+
+class _ChunkWriter:
+    def __init__(self, out_dir: str, number: int):
+        self.file_name = f"chunk-{number:05d}.ndjson.gz"
+        self.path = os.path.join(out_dir, self.file_name)
+        self._fh = gzip.open(self.path, "wb", compresslevel=6)
+        self.count = 0
+        self.raw_bytes = 0
+        self.first_id = None
+        self.last_id = None
+        self.item_types: Dict[str, int] = {}
+
+    def write(self, item_id: str, item_type: Optional[str], body: bytes):
+        self._fh.write(body)
+        self._fh.write(b"\n")
+        self.count += 1
+        self.raw_bytes += len(body)
+        if self.first_id is None:
+            self.first_id = item_id
+        self.last_id = item_id
+        key = item_type or "unknown"
+        self.item_types[key] = self.item_types.get(key, 0) + 1
+
+    def close(self) -> Dict:
+        self._fh.close()
+        return {
+            "file": self.file_name,
+            "count": self.count,
+            "raw_bytes": self.raw_bytes,
+            "compressed_bytes": os.path.getsize(self.path),
+            "sha256": _file_sha256(self.path),
+            "first_id": self.first_id,
+            "last_id": self.last_id,
+            "item_types": self.item_types,
+        }
+
+
+def _file_sha256(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for block in iter(lambda: f.read(1 << 20), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+# ============================================
+# 讀取
+# ============================================
+def load_index(spool_dir: str) -> Dict:
+    with open(os.path.join(spool_dir, INDEX_FILE), encoding="utf-8") as f:
+        return json.load(f)
+
+
+def iter_spool(spool_dir: str) -> Iterator[Tuple[str, bytes]]:
+    """逐行串流讀取所有分塊，回傳 (item_id, JSON bytes)，不會整檔載入記憶體"""
+    for chunk in load_index(spool_dir)["chunks"]:
+        with gzip.open(os.path.join(spool_dir, chunk["file"]), "rb") as f:
+            for line in f:
+                line = line.rstrip(b"\n")
+                if line:
+                    yield line_item_id(line), line
+
+
+def line_item_id(line: bytes) -> str:
+    """匯出時 id 固定在第一個欄位，可直接切出；格式不符時才完整解析"""
+    if line.startswith(_ID_PREFIX):
+        end = line.find(b'"', len(_ID_PREFIX))
+        if end > 0 and b"\\" not in line[len(_ID_PREFIX):end]:
+            return line[len(_ID_PREFIX):end].decode("utf-8")
+    return json.loads(line)["id"]
+
+
+def audit_spool(spool_dir: str) -> List[str]:
+    """檢查每個分塊的 sha256 與筆數是否與 index 一致，回傳問題清單（空清單代表完整）"""
+    problems = []
+    index = load_index(spool_dir)
+    for chunk in index["chunks"]:
+        path = os.path.join(spool_dir, chunk["file"])
+        if not os.path.exists(path):
+            problems.append(f"{chunk['file']}: 檔案不存在")
+            continue
+
+        if _file_sha256(path) != chunk["sha256"]:
+            problems.append(f"{chunk['file']}: sha256 不符")
+            continue
+
+        with gzip.open(path, "rb") as f:
+            count = sum(1 for line in f if line.strip())
+        if count != chunk["count"]:
+            problems.append(f"{chunk['file']}: 筆數 {count}，index 記錄 {chunk['count']}")
+
+    if sum(c["count"] for c in index["chunks"]) != index["total"]:
+        problems.append("index total 與各分塊筆數總和不符")
+    return problems
+
+
+# ============================================
+# 重播上傳
+# ============================================
+def replay(token, spool_dir: str, results: Dict, concurrency: int = DEFAULT_CONCURRENCY,
+           use_batch: bool = False, mirror=None):
+    """
+    並行上傳 spool 中的項目，結果累計到 results（success / failed / errors）
+    同時進行中的請求數量受 concurrency 限制，讀取速度不會超過上傳速度
+    use_batch 時以 $batch 打包，concurrency 為同時進行的批次數
+    mirror 為 LocalMirror 時，讀出的項目同時暫存，由呼叫端上傳結束後合併
+    token 可為字串或取得 Token 的函式（graph_batch.TokenSource），後者每次請求重新讀取
+    """
+    source = iter_spool(spool_dir)
+    if mirror is not None:
+        source = mirror.staging(source)
+
+    if use_batch:
+        from graph_batch import GraphBatchClient
+        from data_sync import print_batch_stats
+
+        client = GraphBatchClient(token, concurrency=concurrency)
+        client.upsert_many(source, results)
+        print_batch_stats(client.stats)
+        return
+
+    from data_sync import upsert_external_item_raw
+    from graph_batch import resolve_token
+
+    lock = threading.Lock()
+
+    def push(item_id: str, body: bytes):
+        ok = upsert_external_item_raw(resolve_token(token), item_id, body)
+        with lock:
+            if ok:
+                results["success"] += 1
+            else:
+                results["failed"] += 1
+                results["errors"].append(item_id)
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        pending = set()
+        for item_id, body in source:
+            if len(pending) >= concurrency * 2:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    future.result()
+            pending.add(pool.submit(push, item_id, body))
+        for future in pending:
+            future.result()
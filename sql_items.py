@@ -0,0 +1,476 @@
+"""
+SQL JSON 擷取模式
+由 PostgreSQL 直接組出每個 External Item 的 JSON，Python 只補上 ACL、以 Schema 驗證後將 bytes 串流給上傳端，
+省去逐列轉換、to_iso_string、組合 content 與序列化的成本
+
+輸出需與 transform_* → CompactItem → serialize_item 逐位元組相同（屬性依 SCHEMA 順序、
+精簡分隔符號、不跳脫非 ASCII），因此以 to_json 逐欄組合文字，而非 json_build_object
+（其文字輸出帶有空白，且 jsonb 會重排鍵的順序）。
+日期、浮點數與 str(None) 的格式依欄位實際型別模擬 Python 的輸出，可用 --verify-sql-json 比對。
+"""
+import json
+import os
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import data_sync
+import profiling
+from compact_item import PROPERTY_NAMES
+from schema_register import OPTIONAL_PROPERTIES
+
+SQL_FETCH_SIZE = int(os.environ.get("SQL_JSON_FETCH_SIZE", "2000"))
+
+# 資料表 -> {欄位: format_type}
+_column_types: Dict[str, Dict[str, str]] = {}
+
+
+def column_types(conn, table: str) -> Dict[str, str]:
+    if table not in _column_types:
+        with conn.cursor() as cur:
+            cur.execute(
+                "SELECT attname, format_type(atttypid, atttypmod) AS type FROM pg_attribute "
+                "WHERE attrelid = %s::regclass AND attnum > 0 AND NOT attisdropped",
+                (table,)
+            )
+            _column_types[table] = {row["attname"]: row["type"] for row in cur.fetchall()}
+    return _column_types[table]
+
+
+def _kind(pg_type: Optional[str]) -> str:
+    pg_type = pg_type or ""
+    if pg_type.startswith("timestamp"):
+        return "timestamptz" if pg_type.endswith("with time zone") else "timestamp"
+    if pg_type == "real":
+        return "real"
+    if pg_type == "double precision":
+        return "float"
+    if pg_type == "boolean":
+        return "bool"
+    return pg_type or "text"
+
+
+# ============================================
+# 模擬 Python 格式的 SQL 運算式
+# ============================================
+class _Table:
+    """產生單一資料表欄位運算式的輔助物件"""
+
+    def __init__(self, conn, table: str, alias: str):
+        self.alias = alias
+        self.types = column_types(conn, table)
+
+    def col(self, name: str) -> str:
+        return f"{self.alias}.{name}"
+
+    def kind(self, name: str) -> str:
+        return _kind(self.types.get(name))
+
+    def py_float(self, name: str) -> str:
+        """Python float 的 repr（整數值帶 .0）；real 先轉文字，與 psycopg2 解析的值相同"""
+        cast = "::text::float8" if self.kind(name) == "real" else "::float8"
+        v = f"({self.col(name)}){cast}"
+        return (f"(CASE WHEN {v} = trunc({v}) AND abs({v}) < 1e16 "
+                f"THEN trunc({v})::numeric::text || '.0' ELSE {v}::text END)")
+
+    def py_text(self, name: str, sep: str = " ") -> str:
+        """
+        str(值) 的文字（NULL 保持 NULL）；sep="T" 時為 to_iso_string 的格式
+        datetime 有微秒才輸出 .ffffff，帶時區時為 +HH:MM，無時區的 ISO 格式補 Z
+        """
+        c, kind = self.col(name), self.kind(name)
+        if kind in ("timestamptz", "timestamp"):
+            layout = "'YYYY-MM-DD\"T\"HH24:MI:SS'" if sep == "T" else "'YYYY-MM-DD HH24:MI:SS'"
+            expr = (f"to_char({c}, {layout}) || CASE WHEN to_char({c}, 'US') <> '000000' "
+                    f"THEN '.' || to_char({c}, 'US') ELSE '' END")
+            if kind == "timestamptz":
+                expr += f" || to_char({c}, 'TZH:TZM')"
+            elif sep == "T":
+                expr += " || 'Z'"
+            return f"({expr})"
+        if kind in ("float", "real"):
+            return self.py_float(name)
+        if kind == "bool":
+            return f"(CASE WHEN {c} THEN 'True' WHEN NOT {c} THEN 'False' END)"
+        return f"({c})::text"
+
+    def py_str(self, name: str) -> str:
+        """f-string 中的 {值}：NULL 為 'None'"""
+        return f"COALESCE({self.py_text(name)}, 'None')"
+
+    def or_default(self, name: str, default: str) -> str:
+        """值 or default（文字欄位）"""
+        return f"COALESCE(NULLIF({self.col(name)}::text, ''), '{default}')"
+
+    def json(self, name: str) -> str:
+        if self.kind(name) in ("float", "real"):
+            return f"COALESCE({self.py_float(name)}, 'null')"
+        return _json(self.col(name))
+
+    def json_iso(self, name: str) -> str:
+        return _json(self.py_text(name, "T"))
+
+    def json_or_empty_list(self, name: str) -> str:
+        return f"COALESCE(to_json({self.col(name)})::text, '[]')"
+
+    def json_or_false(self, name: str) -> str:
+        return f"to_json(COALESCE({self.col(name)}, false))::text"
+
+    def json_float_or_null(self, name: str) -> str:
+        """float(值) if 值 else None"""
+        c = self.col(name)
+        return f"(CASE WHEN {c} IS NULL OR {c} = 0 THEN 'null' ELSE {self.py_float(name)} END)"
+
+    def json_or_zero(self, name: str) -> str:
+        """值 or 0"""
+        c = self.col(name)
+        value = self.py_float(name) if self.kind(name) in ("float", "real") else f"{c}::text"
+        return f"(CASE WHEN {c} IS NULL OR {c} = 0 THEN '0' ELSE {value} END)"
+
+
+def _json(expr: str) -> str:
+    return f"COALESCE(to_json({expr})::text, 'null')"
+
+
+def _lines(*parts: str) -> str:
+    """content 的 "\\n".join([...])"""
+    return " || E'\\n' || ".join(f"({p})" for p in parts)
+
+
+def _item_body(item_id: str, item_type: str, properties: Dict[str, str], content: str) -> str:
+    """組出 {"id":..,"properties":{..},"content":{..} 的文字（acl 與結尾由 Python 補上）"""
+    fields = [f"'\"itemType\":\"{item_type}\"'"]
+    for name in PROPERTY_NAMES:
+        if name not in properties:
+            continue
+        if name in OPTIONAL_PROPERTIES:
+            # 與 data_sync.omit_empty_optional 相同：沒有值的選填屬性省略
+            fields.append(f"COALESCE(',\"{name}\":' || NULLIF({properties[name]}, 'null'), '')")
+        else:
+            fields.append(f"',\"{name}\":' || {properties[name]}")
+    fields = " || ".join(fields)
+    return (f"'{{\"id\":' || to_json({item_id})::text || ',\"properties\":{{' || {fields}"
+            f" || '}},\"content\":{{\"type\":\"text\",\"value\":' || to_json({content})::text || '}}'")
+
+
+# ============================================
+# 各資料類型的查詢
+# ============================================
+def project_query(conn, where: str) -> str:
+    p = _Table(conn, "projects", "p")
+    pc = _Table(conn, "project_categories", "pc")
+    properties = {
+        "title": p.json("name"),
+        "description": _json(f"COALESCE({p.col('description')}::text, '')"),
+        "url": _json(f"%(base)s || '/projects/' || {p.col('id')}::text"),
+        "lastModifiedDateTime": p.json_iso("updated_at"),
+        "createdDateTime": p.json_iso("created_at"),
+        "projectCode": p.json("code"),
+        "projectName": p.json("name"),
+        "projectId": p.json("id"),
+        "status": p.json("status"),
+        "priority": _json(p.or_default("priority", "medium")),
+        "progress": p.json_or_zero("progress"),
+        "startDate": p.json_iso("start_date"),
+        "endDate": p.json_iso("end_date"),
+        "category": _json(f"COALESCE({pc.col('label')}::text, '')"),
+        "managers": p.json_or_empty_list("managers"),
+        "teamMembers": p.json_or_empty_list("team_members"),
+        "tags": p.json_or_empty_list("tags"),
+        "budget": p.json_float_or_null("budget"),
+        "budgetUsed": p.json_float_or_null("budget_used"),
+    }
+    content = _lines(
+        f"'專案名稱: ' || {p.py_str('name')}",
+        f"'專案代碼: ' || {p.py_str('code')}",
+        f"'狀態: ' || {p.py_str('status')}",
+        f"'進度: ' || {p.py_str('progress')} || '%%'",
+        f"'優先級: ' || {p.py_str('priority')}",
+        f"COALESCE({p.col('description')}::text, '')",
+    )
+    return f"""
+            SELECT
+                'project-' || p.id::text AS item_id,
+                {_item_body("'project-' || p.id::text", "project", properties, content)} AS body,
+                p.id, p.name, p.code, p.managers, p.team_members, p.updated_at
+            FROM projects p
+            LEFT JOIN project_categories pc ON p.category_id = pc.id
+        """ + where
+
+
+def milestone_query(conn, where: str) -> str:
+    m = _Table(conn, "milestones", "m")
+    p = _Table(conn, "projects", "p")
+    item_id = "'milestone-' || m.id::text"
+    properties = {
+        "title": m.json("title"),
+        "description": _json(f"COALESCE({m.col('description')}::text, '')"),
+        "url": _json("%(base)s || '/projects/' || m.project_id::text || '/milestones/' || m.id::text"),
+        "lastModifiedDateTime": m.json_iso("updated_at"),
+        "createdDateTime": m.json_iso("created_at"),
+        "projectCode": _json(f"COALESCE({p.col('code')}::text, '')"),
+        "projectName": _json(f"COALESCE({p.col('name')}::text, '')"),
+        "projectId": m.json("project_id"),
+        "status": m.json("status"),
+        "priority": _json(m.or_default("priority", "medium")),
+        "dueDate": m.json_iso("due_date"),
+        "category": _json(f"COALESCE({m.col('category')}::text, '')"),
+        "phase": _json(f"COALESCE({m.col('phase')}::text, '')"),
+        "owners": ("(CASE WHEN m.assigned_to IS NULL OR m.assigned_to::text = '' THEN '[]' "
+                   "ELSE to_json(ARRAY[m.assigned_to])::text END)"),
+        "isCriticalPath": m.json_or_false("is_critical_path"),
+    }
+    content = _lines(
+        f"'里程碑: ' || {m.py_str('title')}",
+        f"'專案: ' || {p.py_str('name')} || ' (' || {p.py_str('code')} || ')'",
+        f"'狀態: ' || {m.py_str('status')}",
+        f"'截止日期: ' || {m.py_str('due_date')}",
+        f"'階段: ' || {m.or_default('phase', 'N/A')}",
+        f"COALESCE({m.col('description')}::text, '')",
+    )
+    return f"""
+            SELECT
+                {item_id} AS item_id,
+                {_item_body(item_id, "milestone", properties, content)} AS body,
+                m.project_id, m.assigned_to, m.updated_at
+            FROM milestones m
+            JOIN projects p ON m.project_id = p.id
+        """ + where
+
+
+def _linked_projects(alias: str) -> str:
+    """依 project_ids 的順序串接專案名稱與代碼（與 transform 中的 project_map 相同）"""
+    return f"""
+            LEFT JOIN LATERAL (
+                SELECT string_agg(lp.name::text, ', ' ORDER BY u.ord) AS names,
+                       string_agg(lp.code::text, ', ' ORDER BY u.ord) AS codes
+                FROM unnest({alias}.project_ids) WITH ORDINALITY AS u(pid, ord)
+                JOIN projects lp ON lp.id = u.pid
+            ) linked ON true"""
+
+
+def _first_project_id(alias: str) -> str:
+    """project_ids[0] if project_ids else \"\" """
+    ids = f"{alias}.project_ids"
+    return (f"(CASE WHEN COALESCE(cardinality({ids}), 0) = 0 THEN '\"\"' "
+            f"ELSE {_json(f'{ids}[array_lower({ids}, 1)]')} END)")
+
+
+def risk_query(conn, where: str) -> str:
+    r = _Table(conn, "risks", "r")
+    item_id = "'risk-' || r.id::text"
+    properties = {
+        "title": r.json("title"),
+        "description": _json(f"COALESCE({r.col('description')}::text, '')"),
+        "url": _json("%(base)s || '/risks/' || r.id::text"),
+        "lastModifiedDateTime": r.json_iso("updated_at"),
+        "createdDateTime": r.json_iso("created_at"),
+        "projectCode": _json("COALESCE(linked.codes, '')"),
+        "projectName": _json("COALESCE(linked.names, '')"),
+        "projectId": _first_project_id("r"),
+        "status": r.json("status"),
+        "dueDate": r.json_iso("deadline"),
+        "probability": r.json("probability"),
+        "impact": r.json("impact"),
+        "owners": r.json_or_empty_list("owners"),
+        "isCriticalPath": r.json_or_false("is_critical_path"),
+        "mitigation": _json(f"COALESCE({r.col('mitigation')}::text, '')"),
+    }
+    content = _lines(
+        f"'風險: ' || {r.py_str('title')}",
+        "'專案: ' || COALESCE(linked.names, '')",
+        f"'狀態: ' || {r.py_str('status')}",
+        f"'機率: ' || {r.py_str('probability')} || ' | 影響: ' || {r.py_str('impact')}",
+        f"'截止日期: ' || {r.py_str('deadline')}",
+        f"'緩解措施: ' || {r.or_default('mitigation', 'N/A')}",
+        f"COALESCE({r.col('description')}::text, '')",
+    )
+    return f"""
+            SELECT
+                {item_id} AS item_id,
+                {_item_body(item_id, "risk", properties, content)} AS body,
+                r.project_ids, r.owners, r.updated_at
+            FROM risks r{_linked_projects("r")}
+        """ + where
+
+
+def issue_query(conn, where: str) -> str:
+    i = _Table(conn, "issues", "i")
+    item_id = "'issue-' || i.id::text"
+    properties = {
+        "title": i.json("title"),
+        "description": _json(f"COALESCE({i.col('description')}::text, '')"),
+        "url": _json("%(base)s || '/issues/' || i.id::text"),
+        "lastModifiedDateTime": i.json_iso("updated_at"),
+        "createdDateTime": i.json_iso("created_at"),
+        "projectCode": _json("COALESCE(linked.codes, '')"),
+        "projectName": _json("COALESCE(linked.names, '')"),
+        "projectId": _first_project_id("i"),
+        "status": i.json("status"),
+        "dueDate": i.json_iso("due_date"),
+        "severity": _json(i.or_default("severity", "medium")),
+        "owners": i.json_or_empty_list("owners"),
+        "isCriticalPath": i.json_or_false("is_critical_path"),
+        "rootCause": _json(f"COALESCE({i.col('root_cause')}::text, '')"),
+    }
+    content = _lines(
+        f"'問題: ' || {i.py_str('title')}",
+        "'專案: ' || COALESCE(linked.names, '')",
+        f"'狀態: ' || {i.py_str('status')}",
+        f"'嚴重程度: ' || {i.py_str('severity')}",
+        f"'截止日期: ' || {i.py_str('due_date')}",
+        f"'根本原因: ' || {i.or_default('root_cause', 'N/A')}",
+        f"COALESCE({i.col('description')}::text, '')",
+    )
+    return f"""
+            SELECT
+                {item_id} AS item_id,
+                {_item_body(item_id, "issue", properties, content)} AS body,
+                i.project_ids, i.owners, i.updated_at
+            FROM issues i{_linked_projects("i")}
+        """ + where
+
+
+# (資料表, 別名, 查詢產生函式, 顯示名稱)
+QUERIES = (
+    ("projects", "p", project_query, "📁 Projects"),
+    ("milestones", "m", milestone_query, "📌 Milestones"),
+    ("risks", "r", risk_query, "⚠️ Risks"),
+    ("issues", "i", issue_query, "🔴 Issues"),
+)
+
+
+# ============================================
+# 串流輸出
+# ============================================
+def _acl_for_row(table: str, row: Dict) -> List[Dict]:
+    if table == "projects":
+        return data_sync.item_acl([row["id"]])
+    if table == "milestones":
+        owners = [row["assigned_to"]] if row.get("assigned_to") else []
+        return data_sync.item_acl([row["project_id"]], owners)
+    return data_sync.item_acl(row.get("project_ids") or [], row.get("owners"))
+
+
+def _track(stats: Optional[Dict], table: str, row: Dict):
+    """逐列版本的 data_sync.track_rows"""
+    if stats is None:
+        return
+    fetched = stats.setdefault("fetched", {})
+    fetched[table] = fetched.get(table, 0) + 1
+    latest = row.get("updated_at")
+    if latest is not None and (stats.get("max_updated_at") is None or latest > stats["max_updated_at"]):
+        stats["max_updated_at"] = latest
+    if table == "projects":
+        stats.setdefault("project_labels", {})[str(row["id"])] = data_sync.project_label(row)
+
+
+def iter_item_bytes(conn, filters: Optional[Dict] = None,
+                    stats: Optional[Dict] = None) -> Iterator[Tuple[str, bytes]]:
+    """
+    依序產生 (item_id, 上傳用 JSON bytes)；以 server-side cursor 分批讀取，
+    ACL 由 ACL 引擎計算後以快取的 bytes 接在結尾
+    """
+    acl_bytes: Dict[int, Tuple[List[Dict], bytes]] = {}
+    params = {"base": data_sync.APP_BASE_URL}
+
+    for table, alias, build_query, label in QUERIES:
+        if not data_sync.wants_type(filters, table):
+            continue
+        print(f"\n{label}（SQL JSON）...")
+        where, where_params = data_sync.build_filter(conn, table, alias, filters)
+        # build_filter 使用位置參數，改為具名參數以便與 %(base)s 並用
+        for index, value in enumerate(where_params):
+            where = where.replace("%s", f"%(f{index})s", 1)
+            params[f"f{index}"] = value
+        query = build_query(conn, where)
+
+        count = 0
+        with conn.cursor(name=f"sql_items_{table}") as cur:
+            cur.itersize = SQL_FETCH_SIZE
+            with profiling.stage("fetch"):
+                cur.execute(query, params)
+            while True:
+                with profiling.stage("fetch"):
+                    rows = cur.fetchmany(SQL_FETCH_SIZE)
+                if not rows:
+                    break
+                if table != "projects":
+                    project_ids = []
+                    for row in rows:
+                        project_ids.extend([row["project_id"]] if table == "milestones" else row.get("project_ids") or [])
+                    data_sync.load_project_members(conn, project_ids)
+                for row in rows:
+                    if table == "projects" and data_sync._acl_engine is not None:
+                        data_sync._acl_engine.update_project(row["id"], row.get("managers"), row.get("team_members"))
+                    _track(stats, table, row)
+                    acl = _acl_for_row(table, row)
+                    if not acl:
+                        data_sync.reject_item(json.loads(row["body"] + ',"acl":[]}'), data_sync.NO_ACL_REASON)
+                        continue
+                    if data_sync._validate_item is not None:
+                        # 與 emit_item 相同的 Schema 驗證；需解析一次 JSON，VALIDATE_ITEMS=0 可省略
+                        with profiling.stage("validate"):
+                            item = json.loads(row["body"] + "}")
+                            item["acl"] = acl
+                            reason = data_sync._validate_item(item)
+                        if reason is not None:
+                            data_sync.reject_item(item, reason)
+                            continue
+                    cached = acl_bytes.get(id(acl))
+                    if cached is None:
+                        cached = (acl, json.dumps(acl, ensure_ascii=False, separators=(",", ":")).encode("utf-8"))
+                        acl_bytes[id(acl)] = cached
+                    count += 1
+                    yield row["item_id"], row["body"].encode("utf-8") + b',"acl":' + cached[1] + b"}"
+        print(f"   輸出 {count} 個項目")
+
+
+# ============================================
+# 與一般同步路徑的一致性檢查
+# ============================================
+def python_item_bytes(conn, filters: Optional[Dict] = None) -> Dict[str, bytes]:
+    """以正式同步的 build_items 產生 bytes（含正規化、人員解析與 Schema 驗證，不比對指紋）"""
+    items = data_sync.build_items(conn, filters, use_fingerprints=False)
+    return {c.id: data_sync.serialize_item(c.to_item()) for c in items}
+
+
+def _describe_difference(expected: bytes, actual: bytes) -> str:
+    try:
+        a, b = json.loads(expected), json.loads(actual)
+    except ValueError as e:
+        return f"SQL 輸出不是合法 JSON：{e}"
+    fields = [f"properties.{k}" for k in a["properties"].keys() | b["properties"].keys()
+              if a["properties"].get(k, ...) != b["properties"].get(k, ...)]
+    fields += [k for k in ("content", "acl") if a.get(k) != b.get(k)]
+    if fields:
+        return "欄位不同：" + ", ".join(sorted(fields))
+
+    position = min(len(expected), len(actual))
+    for index, (x, y) in enumerate(zip(expected, actual)):
+        if x != y:
+            position = index
+            break
+    return (f"格式不同（第 {position} 個位元組）：Python {expected[max(0, position - 20):position + 20]!r}"
+            f" / SQL {actual[max(0, position - 20):position + 20]!r}")
+
+
+def verify(conn, filters: Optional[Dict] = None, max_report: int = 20) -> List[str]:
+    """比對兩種路徑的輸出，回傳差異描述（空 list 表示逐位元組相同）"""
+    from dead_letter import DeadLetterWriter
+
+    # 兩種路徑都會擋下未通過驗證的項目，比對時只計數，不寫入 dead letter
+    data_sync._dead_letter = DeadLetterWriter(path="")
+    expected = python_item_bytes(conn, filters)
+    actual = dict(iter_item_bytes(conn, filters))
+
+    problems = []
+    for item_id in sorted(expected.keys() - actual.keys()):
+        problems.append(f"{item_id}: SQL 模式沒有輸出")
+    for item_id in sorted(actual.keys() - expected.keys()):
+        problems.append(f"{item_id}: 只有 SQL 模式輸出")
+    for item_id in sorted(expected.keys() & actual.keys()):
+        if expected[item_id] != actual[item_id]:
+            problems.append(f"{item_id}: {_describe_difference(expected[item_id], actual[item_id])}")
+    print(f"\n🔎 比對 {len(expected)} 個項目，{len(problems)} 個差異")
+    for problem in problems[:max_report]:
+        print(f"   ❌ {problem}")
+    return problems
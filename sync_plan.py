@@ -0,0 +1,187 @@
+"""
+同步計畫估算（--plan）
+執行與正式同步相同的讀取、轉換與序列化，但不上傳、不更新 watermark 與鏡像，
+依 itemType 列出將送出的 PUT / DELETE 數量與 payload 大小，
+並以執行紀錄中同模式的 items/sec 估算上傳耗時
+
+啟用本機鏡像時與鏡像比對：PUT 分為新增、變更與內容未變，
+完整同步時鏡像中有、這次未產生的項目列為可刪除（目前的同步流程不會自動刪除）；
+啟用資料列指紋（--skip-unchanged）時，指紋未變更而略過的項目另列為「略過」，不計入可刪除
+"""
+import copy
+import time
+from typing import Dict, Iterable, Optional, Tuple
+
+import data_sync
+
+
+def item_type_of(item_id: str) -> str:
+    for prefix, kind in data_sync.ID_PREFIXES.items():
+        if item_id.startswith(prefix):
+            return kind
+    return "unknown"
+
+
+def _empty_counts() -> Dict:
+    return {"put": 0, "new": 0, "changed": 0, "unchanged": 0, "bytes": 0, "skipped": 0, "delete": 0}
+
+
+def build_plan(pairs: Iterable[Tuple[str, bytes]], mirror=None, full: bool = False,
+               skipped: Iterable[str] = ()) -> Dict:
+    """
+    pairs 為 (item_id, 上傳用 bytes)；回傳 itemType -> 計數
+    mirror 為 LocalMirror 時比對已上傳的內容；full 表示 pairs 涵蓋全部資料，才計算可刪除的項目
+    skipped 為指紋未變更、這次不會上傳的項目 id（仍存在於資料庫）
+    """
+    from local_mirror import body_hash
+
+    uploaded = mirror.hashes() if mirror is not None else None
+    plan: Dict[str, Dict] = {}
+    seen = set()
+    for item_id, body in pairs:
+        counts = plan.setdefault(item_type_of(item_id), _empty_counts())
+        counts["put"] += 1
+        counts["bytes"] += len(body)
+        if uploaded is not None:
+            seen.add(item_id)
+            previous = uploaded.get(item_id)
+            if previous is None:
+                counts["new"] += 1
+            elif previous != body_hash(body):
+                counts["changed"] += 1
+            else:
+                counts["unchanged"] += 1
+    for item_id in skipped:
+        plan.setdefault(item_type_of(item_id), _empty_counts())["skipped"] += 1
+        seen.add(item_id)
+    if uploaded is not None and full:
+        for item_id in uploaded:
+            if item_id not in seen:
+                plan.setdefault(item_type_of(item_id), _empty_counts())["delete"] += 1
+    return plan
+
+
+def estimate_seconds(mode: str, puts: int) -> Tuple[Optional[float], Optional[str]]:
+    """(預估秒數, 依據的模式)；沒有可用的執行紀錄時為 (None, None)"""
+    if not puts:
+        return 0.0, mode
+    try:
+        import run_history
+
+        history = run_history.RunHistory()
+        try:
+            for basis in (mode, None):
+                rate = history.throughput(basis)
+                if rate:
+                    return puts / rate, basis or "全部模式"
+        finally:
+            history.close()
+    except Exception as e:
+        print(f"⚠️ 無法讀取執行紀錄: {e}")
+    return None, None
+
+
+def _format_bytes(n: int) -> str:
+    for unit in ("B", "KB", "MB"):
+        if n < 1024:
+            return f"{n:.0f} {unit}" if unit == "B" else f"{n:.1f} {unit}"
+        n /= 1024
+    return f"{n:.1f} GB"
+
+
+def _format_duration(seconds: float) -> str:
+    if seconds >= 3600:
+        return f"{seconds / 3600:.1f} 小時"
+    if seconds >= 60:
+        return f"{seconds / 60:.1f} 分鐘"
+    return f"{seconds:.0f} 秒"
+
+
+def print_plan(plan: Dict, mode: str, diffed: bool, full: bool, extract_seconds: float, invalid: int):
+    total = _empty_counts()
+    for counts in plan.values():
+        for key, value in counts.items():
+            total[key] += value
+
+    print(f"\n📋 同步計畫（{mode}，未上傳任何項目）")
+    fingerprints = total["skipped"] > 0
+    columns = (["PUT", "大小"] + (["新增", "變更", "未變"] if diffed else []) + (["略過"] if fingerprints else [])
+               + (["DELETE"] if diffed and full else []))
+    print(f"   {'itemType':<12}" + "".join(f"{c:>10}" for c in columns))
+    for item_type, counts in sorted(plan.items()) + [("合計", total)]:
+        # 「合計」為全形字，顯示寬度多 2
+        width = 10 if item_type == "合計" else 12
+        cells = [str(counts["put"]), _format_bytes(counts["bytes"])]
+        if diffed:
+            cells += [str(counts["new"]), str(counts["changed"]), str(counts["unchanged"])]
+        if fingerprints:
+            cells.append(str(counts["skipped"]))
+        if diffed and full:
+            cells.append(str(counts["delete"]))
+        print(f"   {item_type:<{width}}" + "".join(f"{c:>10}" for c in cells))
+
+    if invalid:
+        print(f"\n🚫 {invalid} 個項目未通過 Schema 驗證，將不會上傳（正式同步時寫入 dead letter）")
+    if fingerprints:
+        print(f"\nℹ️ {total['skipped']} 個項目的資料列指紋與上次上傳時相同，同步時略過轉換與上傳")
+    if diffed and total["unchanged"]:
+        if data_sync.ROW_FINGERPRINTS:
+            print(f"\nℹ️ {total['unchanged']} 個項目內容與鏡像相同，但資料列指紋不同（例如上次上傳後未記錄指紋），仍會重新上傳")
+        else:
+            print(f"\nℹ️ {total['unchanged']} 個項目內容與鏡像相同，仍會重新上傳（--skip-unchanged 可依資料列指紋略過）")
+    if diffed and full and total["delete"]:
+        print(f"ℹ️ {total['delete']} 個鏡像中的項目已不在資料庫中；目前的同步流程不會刪除，"
+              f"需要時可用 purge 清空後重新同步")
+    elif not diffed:
+        print("\nℹ️ 未啟用本機鏡像（--mirror），無法比對已上傳的內容與可刪除的項目")
+
+    print(f"\n⏱️ 讀取與轉換耗時 {extract_seconds:.1f}s")
+    seconds, basis = estimate_seconds(mode, total["put"])
+    if seconds is None:
+        print("   無歷史資料，無法估算上傳耗時（同步後會寫入執行紀錄）")
+    else:
+        print(f"   預估上傳耗時約 {_format_duration(seconds)}（依 {basis} 最近執行的 items/sec 中位數）")
+    return {"items": plan, "total": total, "estimated_seconds": seconds}
+
+
+def plan_sync(mode: str, filters: Optional[Dict] = None) -> Dict:
+    """依 mode（full / selected / incremental，SQL JSON 時加上 -sql）產生同步計畫"""
+    from dead_letter import DeadLetterWriter
+
+    print("=" * 60)
+    print("同步計畫（不上傳）")
+    print("=" * 60)
+
+    # 驗證失敗的項目只計數，不寫入 dead letter
+    data_sync._dead_letter = DeadLetterWriter(path="")
+    mirror = data_sync.get_mirror()
+    started = time.perf_counter()
+    # 指紋略過的項目仍在資料庫中，需與產生的項目一併視為存在
+    stats = {"unchanged": []}
+    conn = data_sync.get_db_connection()
+    try:
+        if mode == "incremental":
+            import coalesce
+            import sync_state
+
+            state = sync_state.load_state()
+            items, _ = data_sync.collect_incremental(conn, state, stats)
+            # 與 run_incremental 相同先合併更新；作用在狀態的副本上，產生計畫不會改變等待中的項目
+            coalescer = coalesce.get_coalescer(copy.deepcopy(state))
+            if coalescer is not None:
+                items = data_sync.coalesce_items(conn, coalescer, items, stats)
+            pairs = list(data_sync.serialize_items(items))
+        elif data_sync.SQL_JSON:
+            import sql_items
+
+            pairs = list(sql_items.iter_item_bytes(conn, filters))
+        else:
+            items = data_sync.build_items(conn, filters, stats)
+            pairs = list(data_sync.serialize_items(items))
+    finally:
+        conn.close()
+
+    full = mode in ("full", "full-sql")
+    plan = build_plan(pairs, mirror, full, stats["unchanged"])
+    extract_seconds = time.perf_counter() - started
+    return print_plan(plan, mode, mirror is not None, full, extract_seconds, data_sync._dead_letter.count)
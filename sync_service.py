@@ -0,0 +1,220 @@
+"""
+常駐同步服務
+保留資料庫連線池、快取的 Token 與 HTTP keep-alive 連線，
+依固定間隔（加上隨機抖動）執行增量同步，並在 localhost 提供 /health 與 /metrics
+"""
+import json
+import os
+import random
+import signal
+import threading
+import time
+from datetime import datetime
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Dict
+
+import data_sync
+import profiling
+
+SERVICE_INTERVAL = int(os.environ.get("SYNC_INTERVAL_SECONDS", "900"))
+SERVICE_JITTER = int(os.environ.get("SYNC_JITTER_SECONDS", "60"))
+SERVICE_PORT = int(os.environ.get("SERVICE_PORT", "9108"))
+DB_POOL_SIZE = int(os.environ.get("DB_POOL_SIZE", "4"))
+
+
+class SyncService:
+    def __init__(self, interval: int = SERVICE_INTERVAL, jitter: int = SERVICE_JITTER,
+                 port: int = SERVICE_PORT):
+        import sync_state
+
+        self.interval = interval
+        self.jitter = jitter
+        self.port = port
+        self.state = sync_state.load_state()
+        self.pool = None
+        self._stop = threading.Event()
+        self._lock = threading.Lock()
+        self.metrics = {
+            "started_at": time.time(),
+            "runs_total": 0,
+            "run_failures_total": 0,
+            "items_uploaded_total": 0,
+            "items_failed_total": 0,
+            "updates_deferred_total": 0,
+            "uploads_saved_total": 0,
+            "last_run_started": None,
+            "last_run_duration_seconds": None,
+            "last_success_timestamp": None,
+            "last_error": None,
+            "next_run_at": None,
+        }
+
+    # ============================================
+    # 同步執行
+    # ============================================
+    def run_once(self):
+        import sync_state
+
+        started = time.time()
+        with self._lock:
+            self.metrics["last_run_started"] = started
+
+        conn = None
+        broken = False
+        results = None
+        error = None
+        dead_before = data_sync.dead_letter_count()
+        profiling.start_timing()
+        try:
+            if self.pool is None:
+                import partitioned_fetch
+
+                # 第一次（尚無 watermark）同步的分區讀取也向連線池借用：本身 1 條、協調 1 條、各分區各 1 條
+                self.pool = data_sync.get_db_pool(max(DB_POOL_SIZE, partitioned_fetch.EXTRACT_PARTITIONS + 2))
+                partitioned_fetch.use_pool(self.pool)
+            conn = self.pool.getconn()
+            # 每次重新讀取狀態與使用中的 Connection，以便接上 reindex 的切換
+            data_sync.CONNECTION_ID = data_sync.resolve_connection_id()
+            self.state = sync_state.load_state()
+            token = data_sync.get_access_token()
+            results = data_sync.run_incremental(token, conn, self.state)
+            data_sync.print_summary(results)
+
+            with self._lock:
+                self.metrics["items_uploaded_total"] += results["success"]
+                self.metrics["items_failed_total"] += results["failed"]
+                self.metrics["updates_deferred_total"] += results.get("coalesced", 0)
+                self.metrics["uploads_saved_total"] += results.get("coalesce_saved", 0)
+                if results["failed"] == 0:
+                    self.metrics["last_success_timestamp"] = time.time()
+                    self.metrics["last_error"] = None
+                else:
+                    self.metrics["last_error"] = f"{results['failed']} 個項目上傳失敗"
+        except Exception as e:
+            import psycopg2
+
+            broken = isinstance(e, (psycopg2.OperationalError, psycopg2.InterfaceError))
+            error = f"{type(e).__name__}: {str(e).splitlines()[0] if str(e) else e}"
+            print(f"❌ 同步失敗: {e}")
+            with self._lock:
+                self.metrics["run_failures_total"] += 1
+                self.metrics["last_error"] = str(e)
+        finally:
+            if conn is not None:
+                # 連線已失效時關閉並丟棄，下次會建立新連線
+                self.pool.putconn(conn, close=broken)
+            data_sync.record_run("service", datetime.fromtimestamp(started).astimezone(), time.time() - started,
+                                 results, data_sync.dead_letter_count() - dead_before, error)
+            with self._lock:
+                self.metrics["runs_total"] += 1
+                self.metrics["last_run_duration_seconds"] = time.time() - started
+
+    def serve_forever(self):
+        server = self._start_http_server()
+        for sig in (signal.SIGTERM, signal.SIGINT):
+            signal.signal(sig, lambda *_: self._stop.set())
+
+        print(f"🚀 同步服務啟動：每 {self.interval}s（±{self.jitter}s），健康檢查 http://127.0.0.1:{self.port}/health")
+        try:
+            while not self._stop.is_set():
+                self.run_once()
+                delay = max(1.0, self.interval + random.uniform(-self.jitter, self.jitter))
+                with self._lock:
+                    self.metrics["next_run_at"] = time.time() + delay
+                self._stop.wait(delay)
+        finally:
+            print("\n🛑 同步服務停止")
+            server.shutdown()
+            if self.pool is not None:
+                import partitioned_fetch
+
+                partitioned_fetch.use_pool(None)
+                self.pool.closeall()
+
+    # ============================================
+    # 健康檢查與指標
+    # ============================================
+    def health(self) -> Dict:
+        with self._lock:
+            metrics = dict(self.metrics)
+        last_success = metrics["last_success_timestamp"]
+        if metrics["runs_total"] == 0:
+            status = "starting"
+        elif last_success is None or time.time() - last_success > 3 * (self.interval + self.jitter):
+            status = "degraded"
+        else:
+            status = "ok"
+        return {
+            "status": status,
+            "watermark": self.state.get("watermark"),
+            "last_success_timestamp": last_success,
+            "last_error": metrics["last_error"],
+            "next_run_at": metrics["next_run_at"],
+        }
+
+    def prometheus_metrics(self) -> str:
+        with self._lock:
+            metrics = dict(self.metrics)
+        lines = [
+            f"copilot_sync_uptime_seconds {time.time() - metrics['started_at']:.0f}",
+            f"copilot_sync_runs_total {metrics['runs_total']}",
+            f"copilot_sync_run_failures_total {metrics['run_failures_total']}",
+            f"copilot_sync_items_uploaded_total {metrics['items_uploaded_total']}",
+            f"copilot_sync_items_failed_total {metrics['items_failed_total']}",
+            f"copilot_sync_updates_deferred_total {metrics['updates_deferred_total']}",
+            f"copilot_sync_uploads_saved_total {metrics['uploads_saved_total']}",
+        ]
+        if metrics["last_run_duration_seconds"] is not None:
+            lines.append(f"copilot_sync_last_run_duration_seconds {metrics['last_run_duration_seconds']:.3f}")
+        if metrics["last_success_timestamp"] is not None:
+            lines.append(f"copilot_sync_last_success_timestamp_seconds {metrics['last_success_timestamp']:.0f}")
+        return "\n".join(lines) + "\n"
+
+    def _start_http_server(self) -> ThreadingHTTPServer:
+        service = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/health":
+                    health = service.health()
+                    code = 503 if health["status"] == "degraded" else 200
+                    self._send(code, "application/json", json.dumps(health, ensure_ascii=False))
+                elif self.path == "/metrics":
+                    self._send(200, "text/plain; version=0.0.4", service.prometheus_metrics())
+                else:
+                    self._send(404, "text/plain", "not found\n")
+
+            def _send(self, code: int, content_type: str, body: str):
+                data = body.encode("utf-8")
+                self.send_response(code)
+                self.send_header("Content-Type", content_type)
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+            def log_message(self, format, *args):
+                pass
+
+        # 只綁定 localhost，不對外開放
+        server = ThreadingHTTPServer(("127.0.0.1", self.port), Handler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+# ============================================
+# 執行
+# ============================================
+def main(argv=None):
+    import argparse
+
+    parser = argparse.ArgumentParser(prog="sync_service.py", description="常駐增量同步服務")
+    parser.add_argument("--interval", type=int, default=SERVICE_INTERVAL, help="同步間隔秒數")
+    parser.add_argument("--jitter", type=int, default=SERVICE_JITTER, help="每次間隔的隨機抖動秒數")
+    parser.add_argument("--port", type=int, default=SERVICE_PORT, help="健康檢查埠（僅 127.0.0.1）")
+    args = parser.parse_args(argv)
+
+    SyncService(args.interval, args.jitter, args.port).serve_forever()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""
+同步狀態檔
+保存增量同步的 watermark（上次同步看到的最大 updated_at）等跨次執行的狀態
+"""
+import json
+import os
+from datetime import datetime
+from typing import Dict, Optional
+
+# 相對路徑以專案目錄為準（不受執行時的工作目錄影響）；多台主機同步時可指向共用儲存空間
+SYNC_STATE_DIR = os.environ.get("SYNC_STATE_DIR", os.path.dirname(os.path.abspath(__file__)))
+
+
+def _state_path(env: str, default: str) -> str:
+    return os.path.join(SYNC_STATE_DIR, os.environ.get(env, default))
+
+
+SYNC_STATE_PATH = _state_path("SYNC_STATE_PATH", ".sync_state.json")
+# blue/green 重建索引後目前使用中的 Connection
+ACTIVE_CONNECTION_PATH = _state_path("ACTIVE_CONNECTION_PATH", ".active_connection.json")
+
+
+def load_state(path: str = SYNC_STATE_PATH) -> Dict:
+    if not os.path.exists(path):
+        return {}
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def save_state(state: Dict, path: str = SYNC_STATE_PATH):
+    """先寫入暫存檔再取代，避免中斷時留下損毀的狀態檔（其他狀態檔也共用）"""
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(state, f, indent=2, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+
+def get_watermark(state: Dict) -> Optional[datetime]:
+    value = state.get("watermark")
+    return datetime.fromisoformat(value) if value else None
+
+
+def set_watermark(state: Dict, value: datetime, seen: Optional[Dict[str, str]] = None):
+    """
+    seen 為重疊區間內已處理的 item id -> lastModifiedDateTime，下次重新讀取時略過；
+    未提供時清空（例如重建索引後的新 Connection）
+    """
+    state["watermark"] = value.isoformat()
+    state["overlap_seen"] = seen or {}
+
+
+def load_active_connection(path: str = ACTIVE_CONNECTION_PATH) -> Optional[str]:
+    return load_state(path).get("connection_id")
+
+
+def save_active_connection(connection_id: str, previous: Optional[str] = None,
+                           path: str = ACTIVE_CONNECTION_PATH):
+    from datetime import timezone
+
+    save_state({
+        "connection_id": connection_id,
+        "previous_connection_id": previous,
+        "cutover_at": datetime.now(timezone.utc).isoformat(),
+    }, path)
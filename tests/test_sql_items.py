@@ -0,0 +1,142 @@
+"""
+SQL JSON 模式與一般同步路徑的逐位元組比對（sql_items.verify）
+在暫時的 schema 建立涵蓋各種邊界值的資料表：NULL、整數值與非整數的浮點數、
+有無時區與有無微秒的時間、空陣列、未排序與重複的 project_ids
+
+未設定資料庫（DB_HOST）或無法連線時略過：DB_HOST=... python -m pytest tests
+"""
+import os
+import sys
+import unittest
+from unittest import mock
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import data_sync
+
+SCHEMA = f"sql_items_test_{os.getpid()}"
+
+DDL = """
+CREATE TABLE project_categories (id int PRIMARY KEY, label text);
+CREATE TABLE projects (id text PRIMARY KEY, name text NOT NULL, code text NOT NULL, description text,
+  start_date timestamptz, end_date timestamp, status text, progress integer, budget numeric(14,2),
+  budget_used double precision, priority text, managers text[], team_members text[], tags text[],
+  created_at timestamptz, updated_at timestamptz, category_id int);
+CREATE TABLE milestones (id text PRIMARY KEY, project_id text, title text, description text, due_date timestamp,
+  status text, priority text, assigned_to text, category text, phase text, is_critical_path boolean,
+  created_at timestamp, updated_at timestamp);
+CREATE TABLE risks (id text PRIMARY KEY, project_ids text[], title text, description text, deadline timestamptz,
+  probability text, impact text, status text, mitigation text, owners text[], is_critical_path boolean,
+  created_at timestamptz, updated_at timestamptz);
+CREATE TABLE issues (id text PRIMARY KEY, project_ids text[], title text, description text, due_date timestamp,
+  severity text, status text, owners text[], root_cause text, is_critical_path boolean,
+  created_at timestamptz, updated_at timestamptz);
+"""
+
+FIXTURES = [
+    ("INSERT INTO project_categories VALUES (%s, %s)", [(1, "研發"), (2, None)]),
+    ("INSERT INTO projects VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", [
+        ("p1", "Alpha", "P-1", "說明 <b>粗體</b>", "2025-01-02 00:00:00+08", "2025-03-01 08:00:00.123456",
+         "active", 37, 100, 100.0, "high", ["u2", "u1"], [], [], "2025-01-01 00:00:00+00",
+         "2025-03-02 10:00:00.5+08", 1),
+        ("p2", '專案 "Beta"', "P-2", None, None, "2025-03-01 08:00:00", None, 0,
+         None, 0.1, None, None, None, None, None, "2025-03-02 10:00:00+00", None),
+        ("p3", "Gamma\n換行", "P-3", "", None, None, "done", None,
+         12345678.25, 1e15, "", ["中文使用者"], ["u3"], ["tag"], "2024-12-31 23:59:59.000500+00",
+         "2025-01-01 00:00:00-05:30", 2),
+        # updated_at 為 NULL：兩種路徑都應擋下
+        ("p4", "Delta", "P-4", "缺少 updated_at", "2025-02-28 12:30:00.75+00", None, None, 100,
+         0, 12345678.25, None, [], None, None, None, None, 9),
+    ]),
+    ("INSERT INTO milestones VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", [
+        ("m10", "p1", "M1", "d", "2025-04-01 00:00:00.123456", "open", "high", "u1", "c", "p1", True,
+         "2025-01-01 00:00:00", "2025-03-03 12:00:00.000001"),
+        ("m11", "p2", "M2", None, "2025-04-01 00:00:00", None, None, None, None, None, False,
+         None, "2025-03-03 12:00:00"),
+        ("m12", "p3", "M3", "", None, "", "", "", "", "", None, "2025-01-01 00:00:00.5", "2025-03-03 12:00:00"),
+    ]),
+    ("INSERT INTO risks VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", [
+        ("r20", ["p3", "p1"], "R1", "d", "2025-05-01 00:00:00.25+02", "high", "low", "open", "m", ["u2", "u1"],
+         True, None, "2025-03-04 00:00:00+00"),
+        ("r21", [], "R2", None, "2025-05-01 00:00:00+00", None, None, None, None, [], False,
+         "2025-01-01 00:00:00+00", "2025-03-04 00:00:00.999999+00"),
+        ("r22", None, "R3", "", None, "", "", "", "", None, None, None, "2025-03-04 00:00:00+00"),
+        ("r23", ["p2", "p2", "p99"], "R4", "重複與不存在的專案", None, None, None, None, None, ["u9"], None,
+         None, "2025-03-04 00:00:00+00"),
+    ]),
+    ("INSERT INTO issues VALUES (%s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s, %s)", [
+        ("i30", ["p4", "p2", "p1"], "I1", "d", "2025-06-01 09:00:00.5", "high", "open", ["u1"], "rc", True,
+         "2025-01-01 00:00:00+00", "2025-03-05 00:00:00.123+00"),
+        ("i31", [], "I2", None, None, None, None, [], None, False, None, "2025-03-05 00:00:00+00"),
+        ("i32", None, "I3", "", "2025-06-01 00:00:00", "", "", None, "", None, None, "2025-03-05 00:00:00+00"),
+    ]),
+]
+
+
+class SqlItemsEquivalenceTest(unittest.TestCase):
+    @classmethod
+    def setUpClass(cls):
+        if not os.environ.get("DB_HOST"):
+            raise unittest.SkipTest("未設定資料庫（DB_HOST）")
+        try:
+            import psycopg2
+        except ImportError:
+            raise unittest.SkipTest("未安裝 psycopg2")
+        try:
+            admin = data_sync.get_db_connection()
+        except psycopg2.OperationalError as e:
+            raise unittest.SkipTest(f"無法連線資料庫：{e}")
+        with admin.cursor() as cur:
+            cur.execute(f"CREATE SCHEMA {SCHEMA}")
+            cur.execute(f"SET search_path TO {SCHEMA}")
+            cur.execute(DDL)
+            for sql, rows in FIXTURES:
+                cur.executemany(sql, rows)
+        admin.commit()
+        cls.admin = admin
+
+        # 同步程式使用未加 schema 的表名，分區讀取也會另開連線，以 PGOPTIONS 讓所有連線都指向暫時的 schema
+        cls._pgoptions = os.environ.get("PGOPTIONS")
+        os.environ["PGOPTIONS"] = f"-c search_path={SCHEMA}"
+
+    @classmethod
+    def tearDownClass(cls):
+        if cls._pgoptions is None:
+            os.environ.pop("PGOPTIONS", None)
+        else:
+            os.environ["PGOPTIONS"] = cls._pgoptions
+        with cls.admin.cursor() as cur:
+            cur.execute(f"DROP SCHEMA {SCHEMA} CASCADE")
+        cls.admin.commit()
+        cls.admin.close()
+
+    def setUp(self):
+        import sql_items
+
+        # 欄位型別依資料表名稱快取，需避免沿用其他 schema 的結果
+        data_sync._id_array_types.clear()
+        sql_items._column_types.clear()
+        # 與 SQL_JSON=1 時相同：不做文字正規化與人員解析
+        for name, value in (("TEXT_NORMALIZE", False), ("PEOPLE_SOURCE", None), ("ROW_FINGERPRINTS", False)):
+            patcher = mock.patch.object(data_sync, name, value)
+            patcher.start()
+            self.addCleanup(patcher.stop)
+        self.conn = data_sync.get_db_connection()
+        self.addCleanup(self.conn.close)
+
+    def test_full_output_is_byte_identical(self):
+        import sql_items
+
+        self.assertEqual(sql_items.verify(self.conn), [])
+        # 只有 updated_at 為 NULL 的專案未通過驗證，其餘項目兩邊都有輸出
+        self.assertEqual(len(dict(sql_items.iter_item_bytes(self.conn))), 13)
+
+    def test_selected_output_is_byte_identical(self):
+        import sql_items
+
+        # 與 --project 相同：專案本身及 project_ids 包含它的 milestones / risks / issues
+        self.assertEqual(sql_items.verify(self.conn, {"project_ids": {"p1"}}), [])
+
+
+if __name__ == "__main__":
+    unittest.main()
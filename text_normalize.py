@@ -0,0 +1,244 @@
+"""
+描述文字正規化
+Portal 的描述、緩解措施與根本原因是含 HTML / Markdown 的富文字，直接上傳會讓標籤與符號進入搜尋索引。
+此模組將其轉為純文字（HTML → 文字、去除 Markdown 標記、整理空白、限制長度），
+大量文字時分塊交給 process pool 處理；結果依原文的雜湊快取在本機 SQLite，未變更的文字不會重新處理
+"""
+import atexit
+import hashlib
+import multiprocessing
+import os
+import re
+import sqlite3
+from concurrent.futures import ProcessPoolExecutor
+from html import unescape
+from html.parser import HTMLParser
+from typing import Dict, Iterable, List, Optional
+
+TEXT_CACHE_PATH = os.environ.get("TEXT_CACHE_PATH", "text_cache.db")
+TEXT_MAX_LENGTH = int(os.environ.get("TEXT_MAX_LENGTH", "8000"))
+TEXT_WORKERS = int(os.environ.get("TEXT_WORKERS", "0")) or (os.cpu_count() or 1)
+TEXT_CHUNK_SIZE = int(os.environ.get("TEXT_CHUNK_SIZE", "200"))
+# 未命中快取的文字少於此數量時直接在目前的程序處理，省去啟動 process pool 的成本
+TEXT_PARALLEL_MIN = int(os.environ.get("TEXT_PARALLEL_MIN", "500"))
+
+# 正規化規則變更時遞增，舊的快取結果即不再使用
+NORMALIZER_VERSION = 1
+
+# 各資料表需正規化的欄位
+NORMALIZED_FIELDS = {
+    "projects": ("description",),
+    "milestones": ("description",),
+    "risks": ("description", "mitigation"),
+    "issues": ("description", "root_cause"),
+}
+
+
+# ============================================
+# 正規化規則
+# ============================================
+_BLOCK_TAGS = {"p", "div", "br", "tr", "table", "ul", "ol", "h1", "h2", "h3", "h4", "h5", "h6",
+               "blockquote", "pre", "hr", "section", "article", "header", "footer"}
+_SKIP_TAGS = {"script", "style", "head"}
+
+_HTML_TAG = re.compile(r"<[a-zA-Z/!][^>]*>")
+_HTML_ENTITY = re.compile(r"&(?:[a-zA-Z]+|#\d+|#x[0-9a-fA-F]+);")
+# 不含任何標記字元、空白也已整理過的文字可直接沿用
+_MARKUP = re.compile(r"[<>&*_`#\[\]~|\r\t\u00a0\u3000\u200b-\u200d\ufeff]|\n\s*\n\s*\n|  |^\s|\s$|^\s*[-+>]\s|^\s*\d+\.\s", re.M)
+
+_MD_FENCE = re.compile(r"^\s*(```|~~~).*$", re.M)
+_MD_HEADING = re.compile(r"^\s{0,3}#{1,6}\s+", re.M)
+_MD_QUOTE = re.compile(r"^\s*>\s?", re.M)
+_MD_RULE = re.compile(r"^\s*([-*_])(\s*\1){2,}\s*$", re.M)
+_MD_BULLET = re.compile(r"^\s*[-*+]\s+", re.M)
+_MD_IMAGE = re.compile(r"!\[([^\]]*)\]\([^)]*\)")
+_MD_LINK = re.compile(r"\[([^\]]+)\]\([^)]*\)")
+_MD_STRONG = re.compile(r"(\*\*|__)(?=\S)(.+?)(?<=\S)\1")
+_MD_EMPHASIS = re.compile(r"(?<![\w*])([*_])(?=\S)(.+?)(?<=\S)\1(?![\w*])")
+_MD_STRIKE = re.compile(r"~~(.+?)~~")
+_MD_CODE = re.compile(r"`([^`]+)`")
+_MD_TABLE_RULE = re.compile(r"^\s*\|?\s*:?-{3,}:?\s*(\|\s*:?-{3,}:?\s*)*\|?\s*$", re.M)
+
+_ZERO_WIDTH = re.compile(r"[\u200b-\u200d\ufeff]")
+_SPACES = re.compile(r"[ \t\u00a0\u3000]+")
+_BLANK_LINES = re.compile(r"\n{3,}")
+
+
+class _TextExtractor(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.parts: List[str] = []
+        self._skip = 0
+
+    def handle_starttag(self, tag, attrs):
+        if tag in _SKIP_TAGS:
+            self._skip += 1
+        elif tag == "li":
+            self.parts.append("\n- ")
+        elif tag in _BLOCK_TAGS:
+            self.parts.append("\n")
+        elif tag in ("td", "th"):
+            self.parts.append(" ")
+
+    def handle_endtag(self, tag):
+        if tag in _SKIP_TAGS:
+            self._skip = max(0, self._skip - 1)
+        elif tag in _BLOCK_TAGS or tag == "li":
+            self.parts.append("\n")
+
+    def handle_data(self, data):
+        if not self._skip:
+            self.parts.append(data)
+
+
+def html_to_text(text: str) -> str:
+    parser = _TextExtractor()
+    parser.feed(text)
+    parser.close()
+    return "".join(parser.parts)
+
+
+def strip_markdown(text: str) -> str:
+    text = _MD_FENCE.sub("", text)
+    text = _MD_TABLE_RULE.sub("", text)
+    text = _MD_RULE.sub("", text)
+    text = _MD_HEADING.sub("", text)
+    text = _MD_QUOTE.sub("", text)
+    text = _MD_BULLET.sub("- ", text)
+    text = _MD_IMAGE.sub(r"\1", text)
+    text = _MD_LINK.sub(r"\1", text)
+    text = _MD_CODE.sub(r"\1", text)
+    text = _MD_STRONG.sub(r"\2", text)
+    text = _MD_EMPHASIS.sub(r"\2", text)
+    text = _MD_STRIKE.sub(r"\1", text)
+    return text.replace("|", " ")
+
+
+def clean_whitespace(text: str) -> str:
+    text = _ZERO_WIDTH.sub("", text.replace("\r\n", "\n").replace("\r", "\n"))
+    lines = [_SPACES.sub(" ", line).strip() for line in text.split("\n")]
+    return _BLANK_LINES.sub("\n\n", "\n".join(lines)).strip()
+
+
+def cap_length(text: str, max_length: int = TEXT_MAX_LENGTH) -> str:
+    if max_length <= 0 or len(text) <= max_length:
+        return text
+    return text[:max_length - 1].rstrip() + "…"
+
+
+def normalize_text(text: str, max_length: int = TEXT_MAX_LENGTH) -> str:
+    if _HTML_TAG.search(text):
+        text = html_to_text(text)
+    elif _HTML_ENTITY.search(text):
+        text = unescape(text)
+    return cap_length(clean_whitespace(strip_markdown(text)), max_length)
+
+
+def needs_normalization(text: str, max_length: int = TEXT_MAX_LENGTH) -> bool:
+    return bool(_MARKUP.search(text)) or 0 < max_length < len(text)
+
+
+def normalize_chunk(texts: List[str], max_length: int = TEXT_MAX_LENGTH) -> List[str]:
+    """process pool 的工作單位"""
+    return [normalize_text(t, max_length) for t in texts]
+
+
+# ============================================
+# 快取
+# ============================================
+def text_key(text: str, max_length: int = TEXT_MAX_LENGTH) -> str:
+    return hashlib.sha256(f"{NORMALIZER_VERSION}:{max_length}:{text}".encode("utf-8")).hexdigest()
+
+
+class TextCache:
+    """原文雜湊 -> 正規化後的文字"""
+
+    def __init__(self, path: str = TEXT_CACHE_PATH):
+        self.conn = sqlite3.connect(path)
+        self.conn.execute("CREATE TABLE IF NOT EXISTS texts (hash TEXT PRIMARY KEY, text TEXT NOT NULL)")
+
+    def close(self):
+        self.conn.close()
+
+    def get_many(self, keys: List[str]) -> Dict[str, str]:
+        found: Dict[str, str] = {}
+        for start in range(0, len(keys), 500):
+            chunk = keys[start:start + 500]
+            rows = self.conn.execute(
+                f"SELECT hash, text FROM texts WHERE hash IN ({','.join('?' * len(chunk))})", chunk
+            )
+            found.update(rows)
+        return found
+
+    def put_many(self, entries: Dict[str, str]):
+        with self.conn:
+            self.conn.executemany("INSERT OR REPLACE INTO texts VALUES (?, ?)", entries.items())
+
+
+# ============================================
+# Process pool
+# ============================================
+_pool: Optional[ProcessPoolExecutor] = None
+
+
+def get_pool() -> ProcessPoolExecutor:
+    """
+    模組層級共用，常駐服務多次同步沿用同一組 worker；
+    同步程序中已有上傳與服務執行緒，以 spawn 啟動 worker 避免 fork 複製到鎖住的狀態
+    """
+    global _pool
+    if _pool is None:
+        _pool = ProcessPoolExecutor(max_workers=TEXT_WORKERS, mp_context=multiprocessing.get_context("spawn"))
+        atexit.register(_pool.shutdown)
+    return _pool
+
+
+def normalize_many(texts: List[str], max_length: int = TEXT_MAX_LENGTH) -> List[str]:
+    if len(texts) < TEXT_PARALLEL_MIN or TEXT_WORKERS <= 1:
+        return normalize_chunk(texts, max_length)
+    chunks = [texts[i:i + TEXT_CHUNK_SIZE] for i in range(0, len(texts), TEXT_CHUNK_SIZE)]
+    out: List[str] = []
+    for result in get_pool().map(normalize_chunk, chunks, [max_length] * len(chunks)):
+        out.extend(result)
+    return out
+
+
+def normalize_rows(rows: Iterable[Dict], fields: Iterable[str], stats: Optional[Dict] = None,
+                   cache_path: str = TEXT_CACHE_PATH, max_length: int = TEXT_MAX_LENGTH):
+    """
+    就地替換資料列中指定欄位的文字；相同的原文只處理一次
+    stats 累計 texts（需處理的文字段數）、cached（快取命中）、normalized（新處理）
+    """
+    rows = rows if isinstance(rows, list) else list(rows)
+    fields = tuple(fields)
+    pending: Dict[str, str] = {}
+    for row in rows:
+        for field in fields:
+            text = row.get(field)
+            if text and isinstance(text, str) and needs_normalization(text, max_length):
+                pending.setdefault(text, "")
+    if stats is not None:
+        stats["texts"] = stats.get("texts", 0) + len(pending)
+    if not pending:
+        return
+
+    keys = {text: text_key(text, max_length) for text in pending}
+    cache = TextCache(cache_path)
+    try:
+        cached = cache.get_many(list(set(keys.values())))
+        misses = [text for text in pending if keys[text] not in cached]
+        results = normalize_many(misses, max_length) if misses else []
+        cache.put_many({keys[text]: result for text, result in zip(misses, results)})
+    finally:
+        cache.close()
+
+    normalized = {text: cached[keys[text]] for text in pending if keys[text] in cached}
+    normalized.update(zip(misses, results))
+    for row in rows:
+        for field in fields:
+            text = row.get(field)
+            if isinstance(text, str) and text in normalized:
+                row[field] = normalized[text]
+    if stats is not None:
+        stats["cached"] = stats.get("cached", 0) + len(pending) - len(misses)
+        stats["normalized"] = stats.get("normalized", 0) + len(misses)